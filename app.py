@@ -1,89 +1,457 @@
 """
 API Gateway Flask - Sistema de Pedidos Esfiharia
 Simula o API Gateway da AWS
+A aplicação é criada por create_app(); importar este módulo não abre bancos
+nem configura filas
 """
-from flask import Flask, request, jsonify, render_template
-from lambda_functions.receber_pedido import receber_pedido_handler
+from flask import Blueprint, Flask, Response, g, request, jsonify, render_template, stream_with_context
+from lambda_functions.admissao import ControleAdmissao, LimitadorClientes, chave_cliente
+from lambda_functions.idempotencia import CacheIdempotencia
+from lambda_functions.receber_pedido import receber_pedido_handler, receber_pedidos_lote_handler
+from monitoramento.logs import (configurar_logs, definir_trace_id, novo_trace_id, registrar_payload,
+                                restaurar_trace_id, validar_trace_id)
+from monitoramento.metricas import CONTENT_TYPE_PROMETHEUS, exportar, histograma
+from queue import Empty
+import hashlib
+import io
+import json
 import logging
 import os
+import time
 
-# Importa configuração para inicializar arquitetura
-import config.setup
-
-app = Flask(__name__, template_folder='templates')
-logging.basicConfig(level=logging.INFO)
+api = Blueprint('api', __name__)
 logger = logging.getLogger(__name__)
 
+# Intervalo (s) entre comentários keep-alive no stream de eventos
+INTERVALO_KEEPALIVE_SSE = 15
+# Buffer de leitura do corpo NDJSON de POST /pedidos/lote
+TAMANHO_BUFFER_LOTE = 64 * 1024
+# Tamanho das páginas de GET /pedidos
+LIMITE_PADRAO_PEDIDOS = 100
+LIMITE_MAXIMO_PEDIDOS = 1000
+# Respostas de POST /pedidos guardadas por Idempotency-Key
+CAPACIDADE_IDEMPOTENCIA = int(os.environ.get('ESFIHARIA_IDEMPOTENCIA_CAPACIDADE', '10000'))
+TTL_IDEMPOTENCIA = float(os.environ.get('ESFIHARIA_IDEMPOTENCIA_TTL', str(24 * 3600)))
+TAMANHO_MAXIMO_CHAVE = 255
+# Tempo (s) que uma repetição espera a requisição original terminar
+ESPERA_IDEMPOTENCIA = 10
+# Horas da série de GET /relatorios/vendas?agrupar=hora (31 dias)
+MAXIMO_HORAS_RELATORIO = 31 * 24
+# Por quanto tempo (s) o cliente pode reutilizar GET /estoque sem revalidar
+MAX_AGE_ESTOQUE = int(os.environ.get('ESFIHARIA_MAX_AGE_ESTOQUE', '5'))
+# Controle de admissão de POST /pedidos: mensagens aguardando na
+# Fila_Pagamentos a partir das quais parte (alerta) ou todos (máximo) os
+# pedidos são recusados com 429, e o Retry-After (s) dessas respostas
+ADMISSAO_FILA_ALERTA = int(os.environ.get('ESFIHARIA_ADMISSAO_FILA_ALERTA', '2000'))
+ADMISSAO_FILA_MAXIMO = int(os.environ.get('ESFIHARIA_ADMISSAO_FILA_MAXIMO', '10000'))
+ADMISSAO_RETRY_AFTER = int(os.environ.get('ESFIHARIA_ADMISSAO_RETRY_AFTER', '5'))
+# Pedidos por segundo e rajada de cada cliente (taxa 0 desliga o limite)
+ADMISSAO_TAXA_CLIENTE = float(os.environ.get('ESFIHARIA_ADMISSAO_TAXA_CLIENTE', '1'))
+ADMISSAO_RAJADA_CLIENTE = float(os.environ.get('ESFIHARIA_ADMISSAO_RAJADA_CLIENTE', '10'))
+ADMISSAO_CAPACIDADE_CLIENTES = int(os.environ.get('ESFIHARIA_ADMISSAO_CAPACIDADE_CLIENTES', '100000'))
+
+respostas_idempotentes = CacheIdempotencia('pedidos', CAPACIDADE_IDEMPOTENCIA, TTL_IDEMPOTENCIA)
+controle_admissao = ControleAdmissao(
+    'Fila_Pagamentos', ADMISSAO_FILA_ALERTA, ADMISSAO_FILA_MAXIMO, ADMISSAO_RETRY_AFTER,
+    LimitadorClientes(ADMISSAO_TAXA_CLIENTE, ADMISSAO_RAJADA_CLIENTE, ADMISSAO_CAPACIDADE_CLIENTES)
+    if ADMISSAO_TAXA_CLIENTE > 0 else None
+)
+
+
+_duracao_requisicoes = histograma(
+    'esfiharia_http_duracao_segundos', 'Latência das requisições por rota', ('rota', 'metodo', 'status')
+)
+
+
+@api.before_app_request
+def iniciar_cronometro():
+    g.inicio_requisicao = time.perf_counter()
+
+
+@api.before_app_request
+def iniciar_trace():
+    """
+    Trace ID da requisição (o do cabeçalho X-Trace-Id ou um novo); em
+    POST /pedidos ele acompanha o pedido pelo SNS e pelo SQS até o pagamento
+    """
+    g.trace_id = validar_trace_id(request.headers.get('X-Trace-Id')) or novo_trace_id()
+    g.token_trace = definir_trace_id(g.trace_id)
+
+
+@api.teardown_app_request
+def encerrar_trace(_erro):
+    token = g.pop('token_trace', None)
+    if token is not None:
+        restaurar_trace_id(token)
+
+
+@api.after_app_request
+def registrar_latencia(response):
+    inicio = g.pop('inicio_requisicao', None)
+    if inicio is not None:
+        # Rota com os parâmetros (/pedidos/<pedido_id>), não a URL: uma série por endpoint
+        rota = request.url_rule.rule if request.url_rule else 'desconhecida'
+        _duracao_requisicoes.observar(
+            time.perf_counter() - inicio, rota=rota, metodo=request.method, status=response.status_code
+        )
+    if 'trace_id' in g:
+        response.headers['X-Trace-Id'] = g.trace_id
+    return response
+
 
-@app.route('/', methods=['GET'])
+@api.route('/', methods=['GET'])
 def index():
     """Endpoint raiz - página inicial com menu e instruções"""
     return render_template('index.html')
 
 
-@app.route('/health', methods=['GET'])
+@api.route('/metrics', methods=['GET'])
+def metricas():
+    """Métricas no formato texto do Prometheus"""
+    return Response(exportar(), content_type=CONTENT_TYPE_PROMETHEUS)
+
+
+@api.route('/health', methods=['GET'])
 def health_check():
     """Endpoint de health check"""
     return jsonify({"status": "healthy", "service": "API Gateway"}), 200
 
 
-@app.route('/pedidos', methods=['POST'])
+@api.route('/pedidos', methods=['POST'])
 def criar_pedido():
     """
     Endpoint principal para receber pedidos
     Simula: User -> API Gateway -> Lambda (Receber_Pedido)
+    Com o cabeçalho Idempotency-Key, repetições da mesma requisição (ex.:
+    retentativas do cliente após um timeout) recebem a resposta original
+    em vez de criar outro pedido
+    Sob sobrecarga, pedidos novos recebem 429 com Retry-After antes de
+    qualquer trabalho (controle de admissão). Repetições de uma
+    Idempotency-Key conhecida não são pedidos novos: recebem a resposta
+    guardada (ou o 409) sem passar pelo controle. A recusa não é guardada
+    para a chave
     """
+    chave = request.headers.get('Idempotency-Key')
+    if not chave:
+        recusa = _admitir_pedido()
+        if recusa is not None:
+            return recusa
+        corpo, status = _receber_pedido()
+        return jsonify(corpo), status
+    if len(chave) > TAMANHO_MAXIMO_CHAVE:
+        return jsonify({"erro": f"Idempotency-Key deve ter até {TAMANHO_MAXIMO_CHAVE} caracteres"}), 400
+
+    impressao = hashlib.sha256(request.get_data()).hexdigest()
+    while True:
+        registro = respostas_idempotentes.iniciar(chave, impressao)
+        if registro is None:
+            break
+        if registro.impressao != impressao:
+            return jsonify({"erro": "Idempotency-Key já usada com outro pedido"}), 422
+        if not registro.concluido.wait(ESPERA_IDEMPOTENCIA):
+            return jsonify({"erro": "Pedido com esta Idempotency-Key ainda em processamento"}), 409
+        if registro.resultado is not None:
+            corpo, status = registro.resultado
+            resposta = jsonify(corpo)
+            resposta.headers['Idempotent-Replayed'] = 'true'
+            return resposta, status
+        # A original falhou sem resposta guardada: esta tentativa assume a chave
+
+    recusa = _admitir_pedido()
+    if recusa is not None:
+        respostas_idempotentes.cancelar(chave)
+        return recusa
+
+    corpo, status = None, 500
+    try:
+        corpo, status = _receber_pedido()
+    finally:
+        # Erros internos não são guardados: a retentativa pode dar certo
+        if status < 500:
+            respostas_idempotentes.concluir(chave, (corpo, status))
+        else:
+            respostas_idempotentes.cancelar(chave)
+    return jsonify(corpo), status
+
+
+def _admitir_pedido():
+    """Controle de admissão de um pedido novo, identificando o cliente pelo corpo ou pelo IP"""
+    data = request.get_json(silent=True)
+    cliente = chave_cliente(data.get('cliente')) if isinstance(data, dict) else None
+    return _recusar_sobrecarga(cliente or request.remote_addr)
+
+
+def _recusar_sobrecarga(cliente: str | None):
+    """Resposta 429 com Retry-After se o controle de admissão recusar o pedido, ou None"""
+    recusa = controle_admissao.admitir(cliente)
+    if recusa is None:
+        return None
+    motivo, retry_after = recusa
+    if motivo == 'fila':
+        erro = "Muitos pedidos aguardando pagamento; tente novamente em instantes"
+    else:
+        erro = "Limite de pedidos por cliente excedido"
+    resposta = jsonify({"erro": erro, "motivo": motivo})
+    resposta.headers['Retry-After'] = str(retry_after)
+    return resposta, 429
+
+
+def _receber_pedido() -> tuple:
+    """Valida o corpo de POST /pedidos e invoca Receber_Pedido; retorna (corpo, status)"""
     try:
         data = request.get_json()
         
         if not data:
-            return jsonify({"erro": "Dados do pedido não fornecidos"}), 400
+            return {"erro": "Dados do pedido não fornecidos"}, 400
         
         # Validação básica
         if 'cliente' not in data or 'itens' not in data:
-            return jsonify({
+            return {
                 "erro": "Dados incompletos. Necessário: cliente, itens"
-            }), 400
+            }, 400
         
         # Invoca a função Lambda Receber_Pedido
-        logger.info(f"Recebendo pedido: {data}")
+        registrar_payload(logger, 'Recebendo pedido', data)
         resultado = receber_pedido_handler(data, {})
         
-        return jsonify(resultado), 201
+        # 202: pedido salvo e publicado; o pagamento é processado pelos consumidores
+        return resultado, resultado['statusCode']
         
     except Exception as e:
-        logger.error(f"Erro ao processar pedido: {str(e)}")
-        return jsonify({"erro": f"Erro interno: {str(e)}"}), 500
+        logger.error("Erro ao processar pedido: %s", e)
+        return {"erro": f"Erro interno: {str(e)}"}, 500
+
+
+@api.route('/pedidos', methods=['GET'])
+def consultar_pedidos():
+    """
+    Lista pedidos em páginas, do mais antigo para o mais novo
+    Filtros opcionais: status, cliente (nome ou email), data_inicio e data_fim
+    Paginação: limite e cursor (o proximo_cursor da página anterior)
+    O JSON é gerado pedido a pedido; cada requisição carrega no máximo uma página
+    """
+    from database.db import listar_pedidos
+    
+    try:
+        limite = int(request.args.get('limite', LIMITE_PADRAO_PEDIDOS))
+        if not 0 < limite <= LIMITE_MAXIMO_PEDIDOS:
+            raise ValueError(f"limite deve estar entre 1 e {LIMITE_MAXIMO_PEDIDOS}")
+        data_fim = request.args.get('data_fim')
+        if data_fim and len(data_fim) == 10:
+            # Só a data: inclui o dia inteiro
+            data_fim += 'T23:59:59.999999'
+        pedidos, proximo_cursor = listar_pedidos(
+            limite,
+            cursor=request.args.get('cursor'),
+            status=request.args.get('status'),
+            cliente=request.args.get('cliente'),
+            inicio=request.args.get('data_inicio'),
+            fim=data_fim
+        )
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+    
+    def gerar():
+        yield '{"pedidos": ['
+        for i, pedido in enumerate(pedidos):
+            yield (', ' if i else '') + json.dumps(pedido)
+        yield f'], "proximo_cursor": {json.dumps(proximo_cursor)}}}'
+    
+    return Response(gerar(), mimetype='application/json')
+
+
+@api.route('/pedidos/lote', methods=['POST'])
+def criar_pedidos_lote():
+    """
+    Importação de pedidos em lote
+    Corpo em NDJSON (um pedido por linha), lido em streaming; a resposta
+    também é NDJSON, com um resultado por linha enviado assim que o bloco
+    correspondente é gravado e publicado
+    Sujeita ao controle de admissão pela profundidade da fila (sem o limite
+    por cliente)
+    """
+    recusa = _recusar_sobrecarga(None)
+    if recusa is not None:
+        return recusa
 
+    # request.stream é um stream "cru": ler linhas direto dele custa uma
+    # chamada por byte
+    linhas = io.BufferedReader(request.stream, buffer_size=TAMANHO_BUFFER_LOTE)
 
-@app.route('/pedidos/<pedido_id>', methods=['GET'])
+    def gerar():
+        for resultado in receber_pedidos_lote_handler(linhas, {}):
+            yield json.dumps(resultado) + '\n'
+
+    return Response(stream_with_context(gerar()), mimetype='application/x-ndjson')
+
+
+@api.route('/pedidos/<pedido_id>', methods=['GET'])
 def consultar_pedido(pedido_id):
-    """Consulta status de um pedido"""
-    from database.db import get_pedido
+    """
+    Consulta status de um pedido
+    O status muda com o pagamento: o cliente sempre revalida (no-cache),
+    mas recebe 304 enquanto o pedido não mudar
+    """
+    from database.db import get_pedido_json
     
     try:
-        pedido = get_pedido(pedido_id)
-        if pedido:
-            return jsonify(pedido), 200
+        representacao = get_pedido_json(pedido_id)
+        if representacao:
+            return resposta_em_cache(representacao, 'private, no-cache')
         return jsonify({"erro": "Pedido não encontrado"}), 404
     except Exception as e:
-        logger.error(f"Erro ao consultar pedido: {str(e)}")
+        logger.error("Erro ao consultar pedido: %s", e)
         return jsonify({"erro": str(e)}), 500
 
 
-@app.route('/estoque', methods=['GET'])
+@api.route('/pedidos/<pedido_id>/eventos', methods=['GET'])
+def eventos_pedido(pedido_id):
+    """
+    Stream Server-Sent Events com as mudanças de status de um pedido
+    Envia o status atual e cada transição (ex.: recebido -> pago) até
+    o pedido chegar a um status final
+    """
+    from database.db import get_pedido
+    from messaging.notificacoes import canal_status, STATUS_FINAIS
+    
+    # Assina antes de ler o pedido para não perder uma transição no meio
+    fila = canal_status.assinar(pedido_id)
+    pedido = get_pedido(pedido_id)
+    if not pedido:
+        canal_status.cancelar(pedido_id, fila)
+        return jsonify({"erro": "Pedido não encontrado"}), 404
+    
+    def gerar():
+        try:
+            evento = {'pedido_id': pedido_id, 'status': pedido.get('status')}
+            while True:
+                yield f"event: status\ndata: {json.dumps(evento)}\n\n"
+                if evento['status'] in STATUS_FINAIS:
+                    return
+                while True:
+                    try:
+                        evento = fila.get(timeout=INTERVALO_KEEPALIVE_SSE)
+                        break
+                    except Empty:
+                        yield ": keep-alive\n\n"
+        finally:
+            canal_status.cancelar(pedido_id, fila)
+    
+    return Response(gerar(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@api.route('/estoque', methods=['GET'])
 def consultar_estoque():
-    """Consulta estoque de esfihas"""
-    from database.db import get_estoque
+    """
+    Consulta estoque de esfihas
+    Resposta servida do cache de leitura; clientes podem reutilizá-la por
+    MAX_AGE_ESTOQUE segundos e depois revalidar com If-None-Match
+    """
+    from database.db import get_estoque_json
     
     try:
-        estoque = get_estoque()
-        return jsonify(estoque), 200
+        return resposta_em_cache(get_estoque_json(), f'public, max-age={MAX_AGE_ESTOQUE}')
     except Exception as e:
-        logger.error(f"Erro ao consultar estoque: {str(e)}")
+        logger.error("Erro ao consultar estoque: %s", e)
         return jsonify({"erro": str(e)}), 500
 
 
+@api.route('/relatorios/vendas', methods=['GET'])
+def relatorio_vendas():
+    """
+    Quantidade e receita por tipo de esfiha entre data_inicio e data_fim
+    (datas ou datas e horas ISO, resolução de uma hora, inclusive)
+    Respondido pelos agregados mantidos a cada pagamento, sem ler pedidos:
+    o custo não depende do intervalo nem do número de pedidos
+    Com agrupar=hora, inclui a série hora a hora (até MAXIMO_HORAS_RELATORIO)
+    """
+    from database.db import consultar_vendas, consultar_vendas_por_hora
+    from database.vendas import hora_do_momento, momento_da_hora
+    
+    try:
+        data_inicio = request.args.get('data_inicio')
+        data_fim = request.args.get('data_fim')
+        inicio = hora_do_momento(data_inicio) if data_inicio else None
+        fim = None
+        if data_fim:
+            # Só a data: inclui o dia inteiro
+            fim = hora_do_momento(data_fim + 'T23:00' if len(data_fim) == 10 else data_fim)
+        agrupar = request.args.get('agrupar')
+        if agrupar not in (None, 'hora'):
+            raise ValueError("agrupar deve ser 'hora'")
+        if agrupar and (inicio is None or fim is None or not 0 <= fim - inicio < MAXIMO_HORAS_RELATORIO):
+            raise ValueError(f"agrupar=hora exige data_inicio e data_fim com até "
+                             f"{MAXIMO_HORAS_RELATORIO} horas de intervalo")
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+    
+    def formatar(por_tipo: dict) -> dict:
+        return {tipo: {'quantidade': quantidade, 'receita': centavos / 100}
+                for tipo, (quantidade, centavos) in sorted(por_tipo.items())}
+    
+    por_tipo = consultar_vendas(inicio, fim)
+    corpo = {
+        'data_inicio': momento_da_hora(inicio) if inicio is not None else None,
+        'data_fim': momento_da_hora(fim) if fim is not None else None,
+        'por_tipo': formatar(por_tipo),
+        'total': {
+            'quantidade': sum(quantidade for quantidade, _ in por_tipo.values()),
+            'receita': sum(centavos for _, centavos in por_tipo.values()) / 100
+        }
+    }
+    if agrupar:
+        corpo['por_hora'] = [{'hora': momento_da_hora(hora), 'por_tipo': formatar(vendas)}
+                             for hora, vendas in consultar_vendas_por_hora(inicio, fim)]
+    return jsonify(corpo)
+
+
+def resposta_em_cache(representacao, cache_control: str) -> Response:
+    """Resposta com ETag e Cache-Control; 304 sem corpo se o cliente já tem esta versão"""
+    if request.if_none_match.contains(representacao.etag):
+        resposta = Response(status=304)
+    else:
+        resposta = Response(representacao.corpo, mimetype='application/json')
+    resposta.set_etag(representacao.etag)
+    resposta.headers['Cache-Control'] = cache_control
+    return resposta
+
+
+def create_app() -> Flask:
+    """
+    Cria a aplicação Flask e configura logs, tópicos e filas
+    Os bancos (pedidos, estoque) são abertos na primeira requisição que os usa
+    """
+    from config.setup import configurar_arquitetura
+    
+    configurar_logs()
+    configurar_arquitetura()
+    app = Flask(__name__, template_folder='templates')
+    app.register_blueprint(api)
+    return app
+
+
+def iniciar_worker_embutido():
+    """
+    Processa a Fila_Pagamentos em uma thread do próprio processo da API
+    Necessário com o backend de filas em memória, que não é visto pelo worker
+    """
+    from threading import Thread
+    from worker import PoolConsumidores
+    
+    pool = PoolConsumidores()
+    Thread(target=pool.executar, name='worker-embutido', daemon=True).start()
+    return pool
+
+
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    from messaging.sqs import BACKEND_FILAS
+    
+    app = create_app()
+    # Com o reloader do modo debug, só o processo filho atende requisições
+    if BACKEND_FILAS == 'memoria' and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        iniciar_worker_embutido()
+    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
 
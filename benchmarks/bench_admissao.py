@@ -0,0 +1,102 @@
+"""
+Benchmark do controle de admissão de POST /pedidos sob sobrecarga
+`--produtores` threads enviam pedidos durante `--duracao` segundos, mais
+rápido do que um consumidor da Fila_Pagamentos (`--latencia` segundos por
+mensagem) consegue pagar. Sem controle a fila cresce sem limite e cada
+pedido aceito espera mais que o anterior; com controle (limites
+`--alerta` e `--maximo`) o excesso recebe 429 e a espera fica limitada.
+A espera do último pedido aceito é estimada pelo que ficou na fila e pela
+vazão observada do consumidor
+
+Uso:
+    python -m benchmarks.bench_admissao --duracao 5 --produtores 4 --latencia 0.01 --alerta 100 --maximo 300
+"""
+from threading import Event, Thread
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+TIPOS = ['esfiha_carne', 'esfiha_frango', 'esfiha_queijo',
+         'esfiha_espinafre', 'esfiha_pizza', 'esfiha_4_queijos']
+
+
+def sobrecarregar(cliente, fila, duracao: float, produtores: int, latencia: float) -> dict:
+    """Produtores e um consumidor ao mesmo tempo; retorna os contadores e as latências do POST"""
+    parar = Event()
+    resultado = {'aceitos': 0, 'recusados': 0, 'consumidos': 0, 'profundidade_maxima': 0, 'post': []}
+
+    def produtor(numero: int):
+        i = 0
+        while not parar.is_set():
+            corpo = {'cliente': {'nome': f'Cliente {numero}-{i % 1000}'},
+                     'itens': [{'tipo': TIPOS[i % len(TIPOS)], 'quantidade': 1}]}
+            inicio = time.perf_counter()
+            status = cliente.post('/pedidos', json=corpo).status_code
+            resultado['post'].append(time.perf_counter() - inicio)
+            resultado['aceitos' if status == 202 else 'recusados'] += 1
+            resultado['profundidade_maxima'] = max(resultado['profundidade_maxima'], fila.get_queue_size())
+            i += 1
+
+    def consumidor():
+        while not parar.is_set():
+            for msg in fila.receive_message(max_number_of_messages=1, wait_time_seconds=0.1):
+                time.sleep(latencia)
+                fila.delete_message(msg['ReceiptHandle'])
+                resultado['consumidos'] += 1
+
+    threads = [Thread(target=produtor, args=(n,)) for n in range(produtores)] + [Thread(target=consumidor)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duracao)
+    parar.set()
+    for thread in threads:
+        thread.join()
+    resultado['pendentes'] = fila.get_queue_size()
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--duracao', type=float, default=5)
+    parser.add_argument('--produtores', type=int, default=4)
+    parser.add_argument('--latencia', type=float, default=0.01)
+    parser.add_argument('--alerta', type=int, default=100)
+    parser.add_argument('--maximo', type=int, default=300)
+    args = parser.parse_args()
+
+    # Banco isolado em um diretório temporário; filas em memória
+    os.chdir(tempfile.mkdtemp())
+    os.environ['ESFIHARIA_BACKEND_FILAS'] = 'memoria'
+    logging.disable(logging.CRITICAL)
+    import app
+    from database.db import adicionar_estoque
+    from lambda_functions.admissao import ControleAdmissao
+    from messaging.sqs import SQSQueueFIFO, _filas
+
+    cliente = app.create_app().test_client()
+    for tipo in TIPOS:
+        adicionar_estoque(tipo, 1000000)
+
+    cenarios = (
+        ('sem controle', ControleAdmissao('Fila_Pagamentos', 0, 0, 1)),
+        ('com controle', ControleAdmissao('Fila_Pagamentos', args.alerta, args.maximo, 1)),
+    )
+    print(f"{args.produtores} produtores por {args.duracao:.0f}s; consumidor com "
+          f"{args.latencia * 1000:.0f} ms por mensagem (~{1 / args.latencia:.0f} pedidos/s)")
+    print(f"{'cenário':<14} {'aceitos':>8} {'429':>6} {'POST p99 (ms)':>14} {'fila máx':>9} "
+          f"{'pendentes':>10} {'espera do último (s)':>21}")
+    for nome, controle in cenarios:
+        _filas['Fila_Pagamentos'] = SQSQueueFIFO('Fila_Pagamentos', content_based_deduplication=True)
+        app.controle_admissao = controle
+        r = sobrecarregar(cliente, _filas['Fila_Pagamentos'], args.duracao, args.produtores, args.latencia)
+        post = statistics.quantiles(r['post'], n=100)
+        espera = r['pendentes'] / (r['consumidos'] / args.duracao)
+        print(f"{nome:<14} {r['aceitos']:>8} {r['recusados']:>6} {post[98] * 1000:>14.1f} "
+              f"{r['profundidade_maxima']:>9} {r['pendentes']:>10} {espera:>21.1f}")
+
+
+if __name__ == '__main__':
+    main()
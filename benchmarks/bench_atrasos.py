@@ -0,0 +1,92 @@
+"""
+Benchmark das mensagens atrasadas (DelaySeconds)
+1. Agenda `--timers` mensagens com atrasos aleatórios de até 15 minutos e
+   mede o custo por envio (heap em memória e índice do SQLite) em relação a
+   um envio sem atraso; confere que nenhuma thread foi criada
+2. Envia `--mensagens` com atrasos curtos para um consumidor em long polling
+   e mede o atraso extra entre o prazo de cada uma e o recebimento
+
+Uso:
+    python -m benchmarks.bench_atrasos --timers 200000 --mensagens 500
+"""
+from threading import Thread
+import argparse
+import logging
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+
+def agendar(fila, quantidade: int, atrasado: bool) -> float:
+    """Tempo médio por envio em microssegundos"""
+    aleatorio = random.Random(0)
+    entries = [{'Id': str(i), 'MessageBody': {'n': i},
+                'DelaySeconds': aleatorio.uniform(60, 900) if atrasado else 0}
+               for i in range(quantidade)]
+    inicio = time.perf_counter()
+    for i in range(0, quantidade, 10):
+        fila.send_message_batch(entries[i:i + 10])
+    return (time.perf_counter() - inicio) / quantidade * 1e6
+
+
+def precisao(fila, mensagens: int) -> tuple:
+    """Atraso extra (ms) entre o prazo e o recebimento; retorna (p50, p99, máximo)"""
+    aleatorio = random.Random(1)
+    atrasos = []
+
+    def consumidor():
+        recebidas = 0
+        while recebidas < mensagens:
+            for msg in fila.receive_message(max_number_of_messages=10, wait_time_seconds=1):
+                atrasos.append(time.time() - msg['Body']['prazo'])
+                fila.delete_message(msg['ReceiptHandle'])
+                recebidas += 1
+
+    thread = Thread(target=consumidor)
+    thread.start()
+    for _ in range(mensagens):
+        atraso = aleatorio.uniform(0.01, 1)
+        fila.send_message({'prazo': time.time() + atraso}, delay_seconds=atraso)
+        time.sleep(0.002)
+    thread.join()
+    quantis = statistics.quantiles(atrasos, n=100)
+    return quantis[49] * 1000, quantis[98] * 1000, max(atrasos) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--timers', type=int, default=200000)
+    parser.add_argument('--mensagens', type=int, default=500)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    from messaging.sqs import SQSQueue
+    from messaging.sqs_sqlite import SQSQueueSQLite
+
+    arquivo = os.path.join(tempfile.mkdtemp(), 'filas.db')
+    fabricas = {
+        'memoria': lambda nome: SQSQueue(nome),
+        'sqlite': lambda nome: SQSQueueSQLite(nome, arquivo),
+    }
+
+    print(f"{'backend':<8} {'envio (µs)':>11} {'com atraso (µs)':>16} {'atrasadas':>10} {'threads':>8}")
+    for backend, fabrica in fabricas.items():
+        threads = threading.active_count()
+        imediato = agendar(fabrica(f'Bench_imediato_{backend}'), args.timers, False)
+        fila = fabrica(f'Bench_atrasos_{backend}')
+        atrasado = agendar(fila, args.timers, True)
+        print(f"{backend:<8} {imediato:>11.1f} {atrasado:>16.1f} {fila.get_delayed_count():>10} "
+              f"{threading.active_count() - threads:>8}")
+
+    print(f"\n{args.mensagens} mensagens com atraso de 10 ms a 1 s, consumidor em long polling")
+    print(f"{'backend':<8} {'p50 (ms)':>9} {'p99 (ms)':>9} {'máx (ms)':>9}")
+    for backend, fabrica in fabricas.items():
+        p50, p99, maximo = precisao(fabrica(f'Bench_precisao_{backend}'), args.mensagens)
+        print(f"{backend:<8} {p50:>9.1f} {p99:>9.1f} {maximo:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
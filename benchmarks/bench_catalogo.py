@@ -0,0 +1,73 @@
+"""
+Benchmark do cálculo de totais de pedidos
+Compara a consulta ao banco por item com o catálogo de preços em cache,
+pedido a pedido e em lote (ex.: reprecificar uma importação em massa)
+
+Uso:
+    python -m benchmarks.bench_catalogo --pedidos 100000
+"""
+import argparse
+import random
+import time
+
+TIPOS = ['esfiha_carne', 'esfiha_frango', 'esfiha_queijo',
+         'esfiha_espinafre', 'esfiha_pizza', 'esfiha_4_queijos']
+
+
+def medir(funcao) -> float:
+    inicio = time.perf_counter()
+    funcao()
+    return time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pedidos', type=int, default=100000)
+    parser.add_argument('--pedidos-banco', type=int, default=2000,
+                        help='pedidos precificados consultando o banco (caminho lento)')
+    args = parser.parse_args()
+
+    from tinydb import TinyDB, Query
+    from tinydb.storages import MemoryStorage
+    from database.catalogo import CatalogoPrecos
+
+    db_estoque = TinyDB(storage=MemoryStorage)
+    db_estoque.insert_multiple({'tipo': tipo, 'quantidade': 100, 'preco': 3.0 + i / 2}
+                               for i, tipo in enumerate(TIPOS))
+    catalogo = CatalogoPrecos(db_estoque)
+
+    aleatorio = random.Random(0)
+    pedidos = [[{'tipo': aleatorio.choice(TIPOS), 'quantidade': aleatorio.randint(1, 5)}
+                for _ in range(aleatorio.randint(1, 4))]
+               for _ in range(args.pedidos)]
+
+    Estoque = Query()
+
+    def consultando_banco():
+        for itens in pedidos[:args.pedidos_banco]:
+            round(sum(db_estoque.search(Estoque.tipo == item['tipo'])[0]['preco'] * item['quantidade']
+                      for item in itens), 2)
+
+    def pedido_a_pedido():
+        for itens in pedidos:
+            catalogo.calcular_total(itens)
+
+    def em_lote():
+        catalogo.calcular_totais(pedidos)
+
+    def apos_invalidar():
+        catalogo.invalidar()
+        catalogo.calcular_totais(pedidos)
+
+    por_banco = medir(consultando_banco) / args.pedidos_banco
+    print(f"{'caminho':<22} {'µs/pedido':>10} {'total (s)':>10}")
+    print(f"{'banco (estimado)':<22} {por_banco * 1e6:>10.2f} {por_banco * args.pedidos:>10.2f}")
+    for nome, funcao in (('cache, pedido a pedido', pedido_a_pedido),
+                         ('cache, em lote', em_lote),
+                         ('lote após invalidar', apos_invalidar)):
+        duracao = medir(funcao)
+        print(f"{nome:<22} {duracao / args.pedidos * 1e6:>10.2f} {duracao:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark do pool de consumidores do worker
+Mede a vazão da Fila_Pagamentos para diferentes níveis de concorrência,
+com latência injetada no gateway de pagamentos
+
+Uso:
+    python -m benchmarks.bench_consumidores --concorrencias 1,4,16 --latencia 0.02
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+from threading import Thread
+
+
+def medir_vazao(concorrencia: int, mensagens: int) -> float:
+    """Retorna mensagens processadas por segundo"""
+    from config.setup import configurar_arquitetura
+    from messaging.sqs import get_queue
+    from worker import PoolConsumidores
+
+    configurar_arquitetura()
+    fila = get_queue('Fila_Pagamentos')
+    fila.send_message_batch([
+        {'Id': str(i), 'MessageGroupId': f"bench-{concorrencia}-{i}", 'MessageBody': {
+            'pedido_id': f"bench-{concorrencia}-{i}", 'total': 10.0,
+            'forcar_status_pagamento': 'aprovado'
+        }}
+        for i in range(mensagens)
+    ])
+
+    pool = PoolConsumidores(concorrencia=concorrencia, wait_time_seconds=0.1)
+    inicio = time.perf_counter()
+    thread = Thread(target=pool.executar)
+    thread.start()
+    while fila.get_queue_size() or fila.get_in_flight_count():
+        time.sleep(0.005)
+    duracao = time.perf_counter() - inicio
+    pool.parar()
+    thread.join()
+    return mensagens / duracao
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--concorrencias', default='1,4,16')
+    parser.add_argument('--mensagens', type=int, default=200)
+    parser.add_argument('--latencia', type=float, default=0.02)
+    args = parser.parse_args()
+
+    # Banco isolado em um diretório temporário
+    os.chdir(tempfile.mkdtemp())
+    logging.disable(logging.CRITICAL)
+    from lambda_functions import gateway_pagamentos
+    gateway_pagamentos.LATENCIA_GATEWAY = args.latencia
+
+    print(f"{'concorrência':>12} {'msgs/s':>10}")
+    for concorrencia in (int(c) for c in args.concorrencias.split(',')):
+        print(f"{concorrencia:>12} {medir_vazao(concorrencia, args.mensagens):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark das filas FIFO com grupos de mensagens
+`--pedidos` pedidos com `--eventos` eventos cada (numerados em ordem),
+consumidos por `--consumidores` threads com, em média, `--latencia`
+segundos de processamento por mensagem. Compara, em memória e em SQLite:
+- fila padrão com vários consumidores (rápida, mas fora de ordem)
+- fila padrão com um único consumidor (em ordem, sem paralelismo)
+- fila FIFO agrupada por pedido com vários consumidores
+e confere, para cada pedido, se os eventos foram processados em ordem e
+nunca dois ao mesmo tempo
+
+Uso:
+    python -m benchmarks.bench_fifo --pedidos 50 --eventos 4 --consumidores 8 --latencia 0.005
+"""
+from threading import Lock, Thread
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+
+
+def consumir(fila, total: int, consumidores: int, latencia: float) -> tuple:
+    """Consome `total` mensagens; retorna (msgs/s, eventos fora de ordem, sobreposições)"""
+    lock = Lock()
+    aleatorio = random.Random(0)
+    ultimo, em_processamento = {}, set()
+    contagem = {'processadas': 0, 'fora_de_ordem': 0, 'sobreposicoes': 0}
+
+    def consumidor():
+        while True:
+            with lock:
+                if contagem['processadas'] >= total:
+                    return
+            for msg in fila.receive_message(max_number_of_messages=1, wait_time_seconds=0.05):
+                pedido, evento = msg['Body']['pedido'], msg['Body']['evento']
+                with lock:
+                    if pedido in em_processamento:
+                        contagem['sobreposicoes'] += 1
+                    em_processamento.add(pedido)
+                time.sleep(aleatorio.uniform(0, 2 * latencia))
+                with lock:
+                    # Ordem em que os efeitos dos eventos ficam prontos
+                    if evento != ultimo.get(pedido, -1) + 1:
+                        contagem['fora_de_ordem'] += 1
+                    ultimo[pedido] = max(evento, ultimo.get(pedido, -1))
+                    em_processamento.discard(pedido)
+                    contagem['processadas'] += 1
+                fila.delete_message(msg['ReceiptHandle'])
+
+    inicio = time.perf_counter()
+    threads = [Thread(target=consumidor) for _ in range(consumidores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return total / (time.perf_counter() - inicio), contagem['fora_de_ordem'], contagem['sobreposicoes']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pedidos', type=int, default=50)
+    parser.add_argument('--eventos', type=int, default=4)
+    parser.add_argument('--consumidores', type=int, default=8)
+    parser.add_argument('--latencia', type=float, default=0.005)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    from messaging.sqs import SQSQueue, SQSQueueFIFO
+    from messaging.sqs_sqlite import SQSQueueSQLite
+
+    arquivo = os.path.join(tempfile.mkdtemp(), 'filas.db')
+    fabricas = {
+        'memoria': lambda nome, fifo: SQSQueueFIFO(nome) if fifo else SQSQueue(nome),
+        'sqlite': lambda nome, fifo: SQSQueueSQLite(nome, arquivo, fifo=fifo),
+    }
+    cenarios = (
+        ('padrão', False, args.consumidores),
+        ('padrão', False, 1),
+        ('FIFO por pedido', True, args.consumidores),
+    )
+    total = args.pedidos * args.eventos
+
+    print(f"{args.pedidos} pedidos x {args.eventos} eventos, {args.latencia * 1000:.0f} ms por mensagem em média")
+    print(f"{'backend':<8} {'fila':<16} {'consumidores':>12} {'msgs/s':>8} {'fora de ordem':>14} {'simultâneos':>12}")
+    for backend, fabrica in fabricas.items():
+        for numero, (nome, fifo, consumidores) in enumerate(cenarios):
+            fila = fabrica(f'Bench_{numero}', fifo)
+            # Os eventos de um pedido chegam juntos (ex.: pedido seguido do cancelamento)
+            fila.send_message_batch([
+                {'Id': str(i), 'MessageBody': {'pedido': pedido, 'evento': evento},
+                 'MessageGroupId': f'pedido-{pedido}', 'MessageDeduplicationId': f'{pedido}-{evento}'}
+                for i, (pedido, evento) in enumerate(
+                    (pedido, evento) for pedido in range(args.pedidos) for evento in range(args.eventos))
+            ])
+            vazao, fora_de_ordem, sobreposicoes = consumir(fila, total, consumidores, args.latencia)
+            print(f"{backend:<8} {nome:<16} {consumidores:>12} {vazao:>8.0f} {fora_de_ordem:>14} {sobreposicoes:>12}")
+
+
+if __name__ == '__main__':
+    main()
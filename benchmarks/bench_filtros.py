@@ -0,0 +1,76 @@
+"""
+Benchmark das políticas de filtro das assinaturas SNS
+Um tópico com `--assinantes` filas SQLite, cada uma interessada em um tipo de
+evento. Sem filtro, toda publicação é serializada e gravada em todas as filas
+(e cada consumidor descartaria as que não são suas); com filtro, só na fila
+do tipo publicado. Mede também o custo de avaliar uma política compilada
+
+Uso:
+    python -m benchmarks.bench_filtros --publicacoes 2000 --assinantes 8
+"""
+import argparse
+import os
+import tempfile
+import time
+
+EVENTO = {
+    'tipo': 'pedido_recebido',
+    'pedido_id': '5b0c6a4e-2f7e-4d0b-9d6b-0f8e3c1a2b3c',
+    'cliente': {'nome': 'Maria Silva', 'email': 'maria@example.com'},
+    'itens': [{'tipo': 'esfiha_carne', 'quantidade': 2}, {'tipo': 'esfiha_queijo', 'quantidade': 3}],
+    'total': 16.0,
+    'timestamp': '2026-01-01T12:00:00'
+}
+
+POLITICA = {
+    'tipo': ['pedido_recebido', 'pedido_cancelado'],
+    'total': [{'numeric': ['>=', 10, '<', 500]}],
+    'cliente': {'email': [{'prefix': 'maria@'}]}
+}
+
+
+def medir(funcao, repeticoes: int) -> float:
+    """Tempo médio por chamada em microssegundos"""
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--publicacoes', type=int, default=2000)
+    parser.add_argument('--assinantes', type=int, default=8)
+    args = parser.parse_args()
+
+    from messaging.filtros import compilar_politica
+    from messaging.sns import SNSTopic
+    from messaging.sqs import _filas
+    from messaging.sqs_sqlite import SQSQueueSQLite
+
+    arquivo = os.path.join(tempfile.mkdtemp(), 'filas.db')
+    tipos = [f'evento_{i}' for i in range(args.assinantes - 1)] + ['pedido_recebido']
+
+    def criar_topico(nome: str, filtrar: bool) -> SNSTopic:
+        topico = SNSTopic(nome)
+        for tipo in tipos:
+            fila = f'{nome}_{tipo}'
+            _filas[fila] = SQSQueueSQLite(fila, arquivo)
+            topico.subscribe('sqs', fila, filter_policy={'tipo': [tipo]} if filtrar else None)
+        return topico
+
+    sem_filtro = criar_topico('Sem_Filtro', False)
+    com_filtro = criar_topico('Com_Filtro', True)
+    print(f"{args.assinantes} filas assinantes, uma por tipo de evento")
+    print(f"{'cenário':<34} {'publish (µs)':>13} {'gravações':>10}")
+    for nome, topico in (('sem filtro', sem_filtro), ('com filtro', com_filtro)):
+        media = medir(lambda: topico.publish(EVENTO), args.publicacoes)
+        gravadas = sum(_filas[f'{topico.topic_name}_{tipo}'].get_queue_size() for tipo in tipos)
+        print(f"{nome:<34} {media:>13.1f} {gravadas:>10}")
+
+    casar = compilar_politica(POLITICA)
+    print(f"política compilada (3 chaves): {medir(lambda: casar(EVENTO), 100000) * 1000:.0f} ns por mensagem")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark do cliente do gateway de pagamentos contra o stub HTTP local
+- conexão nova por cobrança x pool com keep-alive
+- gateway com erros intermitentes: retentativas sem cobrança dupla
+- gateway travado: prazo por chamada e disjuntor limitam a espera dos consumidores
+- cauda de latência (algumas requisições lentas): p99 sem e com hedge
+
+Uso:
+    python -m benchmarks.bench_gateway --cobrancas 500 --threads 8
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import logging
+import statistics
+import time
+
+
+def medir(funcao, quantidade: int, threads: int, duracoes: list = None) -> tuple:
+    """
+    Executa funcao(i) para cada i; retorna (duração total, maior duração de uma chamada, falhas)
+    duracoes: recebe a duração de cada chamada
+    """
+    maiores = [] if duracoes is None else duracoes
+
+    def chamar(i):
+        inicio = time.perf_counter()
+        try:
+            funcao(i)
+            return None
+        except Exception as e:
+            return e
+        finally:
+            maiores.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        falhas = sum(1 for erro in executor.map(chamar, range(quantidade)) if erro is not None)
+    return time.perf_counter() - inicio, max(maiores), falhas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cobrancas', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--latencia', type=float, default=0.002, help='latência (s) do stub saudável')
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    import requests
+    from lambda_functions.cliente_gateway import ClienteGateway, Disjuntor
+    from lambda_functions.gateway_stub import iniciar_gateway_stub
+
+    stub = iniciar_gateway_stub(latencia=args.latencia)
+    cliente = ClienteGateway(stub.url, prazo=2, tamanho_pool=args.threads, atraso_hedge=0)
+
+    def sem_pool(i):
+        requests.post(f"{stub.url}/pagamentos", json={'valor': 10.0, 'forcar_status': 'aprovado'},
+                      headers={'Idempotency-Key': f"sem-pool-{i}", 'Connection': 'close'}).raise_for_status()
+
+    print(f"{'cenário':<34} {'cobranças/s':>12} {'maior (ms)':>11} {'falhas':>7} {'conexões':>9}")
+    for nome, funcao in (('conexão nova por cobrança', sem_pool),
+                         ('pool com keep-alive', lambda i: cliente.cobrar(f"pool-{i}", 10.0, 'aprovado'))):
+        conexoes = stub.conexoes
+        duracao, maior, falhas = medir(funcao, args.cobrancas, args.threads)
+        print(f"{nome:<34} {args.cobrancas / duracao:>12.0f} {maior * 1000:>11.1f} {falhas:>7} "
+              f"{stub.conexoes - conexoes:>9}")
+
+    # 30% das requisições falham com 503: as retentativas completam as cobranças
+    stub.taxa_erro = 0.3
+    cobrancas = stub.cobrancas
+    duracao, maior, falhas = medir(lambda i: cliente.cobrar(f"erros-{i}", 10.0, 'aprovado'),
+                                   args.cobrancas, args.threads)
+    print(f"{'30% de erros 503, 3 tentativas':<34} {args.cobrancas / duracao:>12.0f} {maior * 1000:>11.1f} "
+          f"{falhas:>7} {'':>9}  ({stub.cobrancas - cobrancas} cobranças no gateway)")
+
+    # 5% das requisições demoram 1s a mais: sem hedge cada uma custa 1s ao
+    # consumidor; com hedge (50ms) o reforço quase sempre responde antes
+    stub.taxa_erro = 0
+    stub.taxa_lenta, stub.latencia_lenta = 0.05, 1.0
+    for nome, atraso_hedge in (('cauda lenta, sem hedge', 0), ('cauda lenta, hedge após 50ms', 0.05)):
+        cauda = ClienteGateway(stub.url, prazo=2, tamanho_pool=args.threads, atraso_hedge=atraso_hedge)
+        duracoes = []
+        duracao, maior, falhas = medir(lambda i: cauda.cobrar(f"{nome}-{i}", 10.0, 'aprovado'),
+                                       args.cobrancas, args.threads, duracoes)
+        p99 = statistics.quantiles(duracoes, n=100)[98]
+        print(f"{nome:<34} {args.cobrancas / duracao:>12.0f} {maior * 1000:>11.1f} "
+              f"{falhas:>7} {'':>9}  (p99 {p99 * 1000:.1f} ms)")
+        cauda.fechar()
+    stub.taxa_lenta = 0
+
+    # Gateway travado (30s por requisição): cada cobrança espera no máximo o
+    # prazo e, com o disjuntor aberto, as demais falham na hora
+    stub.latencia = 30
+    travado = ClienteGateway(stub.url, prazo=0.5, tamanho_pool=args.threads,
+                             disjuntor=Disjuntor(limite_falhas=5, tempo_aberto=60))
+    duracao, maior, falhas = medir(lambda i: travado.cobrar(f"travado-{i}", 10.0, 'aprovado'),
+                                   args.cobrancas, args.threads)
+    print(f"{'gateway travado, prazo 0.5s':<34} {args.cobrancas / duracao:>12.0f} {maior * 1000:>11.1f} "
+          f"{falhas:>7} {'':>9}  (disjuntor {travado.disjuntor.estado}, total {duracao:.2f}s)")
+
+
+if __name__ == '__main__':
+    main()
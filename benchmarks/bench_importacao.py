@@ -0,0 +1,65 @@
+"""
+Benchmark da importação de pedidos
+Compara POST /pedidos (um pedido por requisição) com POST /pedidos/lote
+(NDJSON em streaming, gravado e publicado em blocos)
+
+Uso:
+    python -m benchmarks.bench_importacao --pedidos 50000 --pedidos-individuais 500
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+TIPOS = ['esfiha_carne', 'esfiha_frango', 'esfiha_queijo',
+         'esfiha_espinafre', 'esfiha_pizza', 'esfiha_4_queijos']
+
+
+def gerar_pedidos(quantidade: int, semente: int = 0) -> list:
+    aleatorio = random.Random(semente)
+    return [{
+        'cliente': {'nome': f"Cliente {i}"},
+        'itens': [{'tipo': aleatorio.choice(TIPOS), 'quantidade': aleatorio.randint(1, 3)}
+                  for _ in range(aleatorio.randint(1, 3))]
+    } for i in range(quantidade)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pedidos', type=int, default=50000)
+    parser.add_argument('--pedidos-individuais', type=int, default=500)
+    args = parser.parse_args()
+
+    # Banco e filas isolados em um diretório temporário
+    os.chdir(tempfile.mkdtemp())
+    logging.disable(logging.CRITICAL)
+    from app import create_app
+    from database.db import adicionar_estoque
+
+    for tipo in TIPOS:
+        adicionar_estoque(tipo, 10 * (args.pedidos + args.pedidos_individuais))
+    cliente = create_app().test_client()
+
+    inicio = time.perf_counter()
+    for pedido in gerar_pedidos(args.pedidos_individuais, semente=1):
+        assert cliente.post('/pedidos', json=pedido).status_code == 202
+    por_pedido = (time.perf_counter() - inicio) / args.pedidos_individuais
+
+    corpo = ''.join(json.dumps(pedido) + '\n' for pedido in gerar_pedidos(args.pedidos))
+    inicio = time.perf_counter()
+    resposta = cliente.post('/pedidos/lote', data=corpo, content_type='application/x-ndjson')
+    resultados = [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+    duracao = time.perf_counter() - inicio
+    aceitos = sum(1 for r in resultados if r['statusCode'] == 202)
+
+    print(f"POST /pedidos:      {por_pedido * 1000:.2f} ms/pedido "
+          f"(estimado para {args.pedidos}: {por_pedido * args.pedidos:.1f}s)")
+    print(f"POST /pedidos/lote: {duracao:.1f}s para {args.pedidos} pedidos "
+          f"({args.pedidos / duracao:.0f} pedidos/s, {aceitos} aceitos)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark dos índices da Tabela_Pedidos
+Compara get/atualizar via índice com a varredura por Query do TinyDB e mede
+o custo de inserir um pedido: em ordem de data_criacao (append no índice por
+data) e fora de ordem (insort, proporcional ao tamanho da tabela)
+
+Uso:
+    python -m benchmarks.bench_indices --tamanhos 1000,100000,1000000
+"""
+import argparse
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from tinydb import TinyDB, Query
+from tinydb.middlewares import CachingMiddleware
+from tinydb.storages import MemoryStorage
+from database.indices import IndicePedidos
+
+
+def gerar_pedidos(quantidade: int, inicio: datetime = datetime(2024, 1, 1)) -> list:
+    """Gera pedidos sintéticos com datas crescentes, um por segundo a partir de inicio"""
+    return [
+        {
+            'pedido_id': str(uuid.uuid4()),
+            'status': 'recebido',
+            'data_criacao': (inicio + timedelta(seconds=i)).isoformat(),
+            'total': 10.0
+        }
+        for i in range(quantidade)
+    ]
+
+
+def medir(funcao, argumentos: list) -> float:
+    """Retorna o tempo médio por chamada em microssegundos"""
+    inicio = time.perf_counter()
+    for argumento in argumentos:
+        funcao(argumento)
+    return (time.perf_counter() - inicio) / len(argumentos) * 1e6
+
+
+def executar(tamanho: int, operacoes: int, operacoes_varredura: int) -> dict:
+    db = TinyDB(storage=CachingMiddleware(MemoryStorage))
+    indice = IndicePedidos(db.table(db.default_table_name))
+    pedidos = gerar_pedidos(tamanho)
+    indice.inserir_varios(pedidos)
+
+    ids = [random.choice(pedidos)['pedido_id'] for _ in range(operacoes)]
+    Pedido = Query()
+    # Novos pedidos depois do último (em ordem) e com datas sorteadas entre
+    # os existentes (fora de ordem)
+    em_ordem = gerar_pedidos(operacoes, datetime(2024, 1, 1) + timedelta(seconds=tamanho))
+    fora_de_ordem = [dict(pedido, data_criacao=random.choice(pedidos)['data_criacao'])
+                     for pedido in gerar_pedidos(operacoes)]
+
+    resultado = {
+        'tamanho': tamanho,
+        'get_indice_us': medir(indice.buscar, ids),
+        'atualizar_indice_us': medir(
+            lambda pedido_id: indice.atualizar(pedido_id, {'status': 'pago'}), ids
+        ),
+        'get_varredura_us': medir(
+            lambda pedido_id: db.search(Pedido.pedido_id == pedido_id),
+            ids[:operacoes_varredura]
+        ),
+        'inserir_us': medir(indice.inserir, em_ordem),
+        'inserir_fora_de_ordem_us': medir(indice.inserir, fora_de_ordem),
+    }
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tamanhos', default='1000,100000,1000000')
+    parser.add_argument('--operacoes', type=int, default=5000)
+    parser.add_argument('--operacoes-varredura', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'pedidos':>10} {'get (índice)':>14} {'atualizar':>14} {'get (varredura)':>16} "
+          f"{'inserir':>14} {'inserir (fora de ordem)':>24}")
+    for tamanho in (int(t) for t in args.tamanhos.split(',')):
+        r = executar(tamanho, args.operacoes, args.operacoes_varredura)
+        print(f"{r['tamanho']:>10} {r['get_indice_us']:>12.2f}us "
+              f"{r['atualizar_indice_us']:>12.2f}us {r['get_varredura_us']:>14.2f}us "
+              f"{r['inserir_us']:>12.2f}us {r['inserir_fora_de_ordem_us']:>22.2f}us")
+
+
+if __name__ == '__main__':
+    main()
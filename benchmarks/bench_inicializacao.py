@@ -0,0 +1,97 @@
+"""
+Benchmark de inicialização a frio (cold start)
+Cada medição roda em um interpretador novo, sobre um diretório de dados já
+populado, e mede o tempo da importação da API até a primeira resposta de
+cada rota. Com --raiz é possível medir outra cópia do repositório (ex.: uma
+versão anterior, com `git worktree add /tmp/antes <commit>`)
+
+Uso:
+    python -m benchmarks.bench_inicializacao --pedidos 100000 --repeticoes 5
+    python -m benchmarks.bench_inicializacao --raiz /tmp/antes
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Executado no processo filho: importa a API, cria a aplicação e faz uma requisição
+_FILHO = """
+import json, logging, sys, time
+inicio = time.perf_counter()
+logging.disable(logging.CRITICAL)
+import app as modulo
+importado = time.perf_counter()
+criar = getattr(modulo, 'create_app', None)
+aplicacao = criar() if criar else modulo.app
+criado = time.perf_counter()
+cliente = aplicacao.test_client()
+metodo, rota = sys.argv[1], sys.argv[2]
+if metodo == 'POST':
+    resposta = cliente.post(rota, json={'cliente': {'nome': 'bench'},
+                                        'itens': [{'tipo': 'esfiha_carne', 'quantidade': 1}]})
+else:
+    resposta = cliente.get(rota)
+assert resposta.status_code < 500, resposta.status_code
+fim = time.perf_counter()
+print(json.dumps({'importacao': importado - inicio, 'criacao': criado - importado,
+                  'primeira_resposta': fim - criado}))
+"""
+
+ROTAS = (('GET', '/health'), ('GET', '/estoque'), ('POST', '/pedidos'))
+
+
+def popular(diretorio: str, pedidos: int):
+    """Cria data/pedidos.json com `pedidos` pedidos e o estoque inicial"""
+    from tinydb import TinyDB
+    from database.indices import IndicePedidos
+    from database.wal import WALStorage
+    from benchmarks.bench_indices import gerar_pedidos
+
+    dados = Path(diretorio) / 'data'
+    dados.mkdir()
+    db = TinyDB(str(dados / 'pedidos.json'), storage=WALStorage)
+    indice = IndicePedidos(db.table(db.default_table_name))
+    for inicio in range(0, pedidos, 50000):
+        indice.inserir_varios(gerar_pedidos(min(50000, pedidos - inicio)))
+    db.storage.compactar()
+    db.close()
+
+
+def medir(raiz: str, diretorio: str, metodo: str, rota: str) -> dict:
+    """Uma inicialização a frio; tempos em segundos (total inclui subir o interpretador)"""
+    ambiente = dict(os.environ, PYTHONPATH=raiz, ESFIHARIA_BACKEND_FILAS='memoria')
+    inicio = time.perf_counter()
+    saida = subprocess.run([sys.executable, '-c', _FILHO, metodo, rota], cwd=diretorio, env=ambiente,
+                           capture_output=True, text=True, check=True).stdout
+    total = time.perf_counter() - inicio
+    return dict(json.loads(saida.strip().splitlines()[-1]), total=total)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--raiz', default=str(Path(__file__).resolve().parent.parent),
+                        help='cópia do repositório a medir (padrão: esta)')
+    parser.add_argument('--pedidos', type=int, default=100000)
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    popular(diretorio, args.pedidos)
+
+    print(f"{args.raiz} ({args.pedidos} pedidos; medianas em ms)")
+    print(f"{'rota':<16} {'importação':>11} {'create_app':>11} {'1ª resposta':>12} {'total':>8}")
+    for metodo, rota in ROTAS:
+        medicoes = [medir(args.raiz, diretorio, metodo, rota) for _ in range(args.repeticoes)]
+        medianas = {campo: statistics.median(m[campo] for m in medicoes) * 1000
+                    for campo in ('importacao', 'criacao', 'primeira_resposta', 'total')}
+        print(f"{metodo + ' ' + rota:<16} {medianas['importacao']:>11.0f} {medianas['criacao']:>11.0f} "
+              f"{medianas['primeira_resposta']:>12.0f} {medianas['total']:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark do custo dos logs no caminho da requisição
+Compara, na thread de quem registra, o log antigo (payload inteiro em INFO
+com f-string, escrito na hora) com os logs em fila (monitoramento.logs):
+payload amostrado e formatação/escrita na thread dos logs
+
+Uso:
+    python -m benchmarks.bench_logs --chamadas 20000 --threads 8
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import logging
+import statistics
+import tempfile
+import time
+
+PEDIDO = {
+    'tipo': 'pedido_recebido',
+    'pedido_id': '5b0c6a4e-2f7e-4d0b-9d6b-0f8e3c1a2b3c',
+    'cliente': {'nome': 'Maria Silva', 'email': 'maria@example.com', 'telefone': '11999999999'},
+    'itens': [{'tipo': tipo, 'quantidade': 2} for tipo in
+              ('esfiha_carne', 'esfiha_frango', 'esfiha_queijo', 'esfiha_pizza', 'esfiha_4_queijos')],
+    'total': 42.0,
+    'timestamp': '2026-01-01T12:00:00'
+}
+
+
+def medir(registrar, chamadas: int, threads: int) -> tuple:
+    """Executa registrar(i) em threads; retorna (p50, p99) em µs por chamada"""
+    def lote(inicio):
+        duracoes = []
+        for i in range(inicio, chamadas, threads):
+            t = time.perf_counter()
+            registrar(i)
+            duracoes.append(time.perf_counter() - t)
+        return duracoes
+
+    with ThreadPoolExecutor(threads) as executor:
+        duracoes = [d for parte in executor.map(lote, range(threads)) for d in parte]
+    quantis = statistics.quantiles(duracoes, n=100)
+    return quantis[49] * 1e6, quantis[98] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--chamadas', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    from monitoramento import logs
+    from monitoramento.logs import configurar_logs, novo_trace_id, rastrear, registrar_payload
+
+    logger = logging.getLogger('bench')
+    arquivo = tempfile.TemporaryFile('w')
+    raiz = logging.getLogger()
+    raiz.setLevel(logging.INFO)
+
+    # Antes: handler síncrono, payload inteiro formatado e escrito a cada chamada
+    sincrono = logging.StreamHandler(arquivo)
+    sincrono.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+    raiz.addHandler(sincrono)
+
+    def antes(i):
+        logger.info(f"Processando pagamento: {PEDIDO}")
+        logger.info(f"Pagamento aprovado para pedido {PEDIDO['pedido_id']}")
+
+    print(f"{'cenário':<44} {'p50 (µs)':>9} {'p99 (µs)':>9}")
+    p50, p99 = medir(antes, args.chamadas, args.threads)
+    print(f"{'síncrono, payload em toda chamada':<44} {p50:>9.1f} {p99:>9.1f}")
+
+    # Depois: fila + thread dos logs, payload em 1% dos pedidos
+    raiz.removeHandler(sincrono)
+    configurar_logs('INFO', fluxo=arquivo)
+    trace_ids = [novo_trace_id() for _ in range(1000)]
+
+    def depois(i):
+        with rastrear(trace_ids[i % len(trace_ids)]):
+            registrar_payload(logger, 'Processando pagamento', PEDIDO)
+            logger.info("Pagamento aprovado para pedido %s", PEDIDO['pedido_id'])
+
+    for taxa in (0.01, 1.0):
+        logs.TAXA_AMOSTRA_PAYLOADS = taxa
+        p50, p99 = medir(depois, args.chamadas, args.threads)
+        print(f"{f'em fila, payload em {taxa:.0%} dos pedidos':<44} {p50:>9.1f} {p99:>9.1f}")
+        # Esvazia a fila antes do próximo cenário
+        while not logs._listener.queue.empty():
+            time.sleep(0.01)
+
+
+if __name__ == '__main__':
+    main()
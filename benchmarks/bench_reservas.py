@@ -0,0 +1,134 @@
+"""
+Teste de estresse do motor de reservas de estoque
+Várias threads (e, com --processos, vários processos sobre os mesmos
+bancos) reservam, confirmam e liberam pedidos ao mesmo tempo; ao final
+confere que nenhum tipo foi vendido além do estoque, que os contadores
+batem com o que está gravado em disco e que não sobrou nenhuma reserva
+
+Uso:
+    python -m benchmarks.bench_reservas --threads 16 --pedidos 20000
+    python -m benchmarks.bench_reservas --threads 4 --processos 4 --pedidos 8000 --estoque 1000
+"""
+from multiprocessing import Process, Queue
+import argparse
+import os
+import random
+import tempfile
+import time
+from threading import Thread
+
+TIPOS = ['esfiha_carne', 'esfiha_frango', 'esfiha_queijo',
+         'esfiha_espinafre', 'esfiha_pizza', 'esfiha_4_queijos']
+
+
+def abrir_motor(diretorio: str):
+    from tinydb import TinyDB
+    from database.reservas import MotorReservas
+    from database.wal import WALStorage
+
+    db_estoque = TinyDB(os.path.join(diretorio, 'estoque.json'), storage=WALStorage)
+    db_reservas = TinyDB(os.path.join(diretorio, 'reservas.json'), storage=WALStorage)
+    return MotorReservas(db_estoque, db_reservas), (db_estoque, db_reservas)
+
+
+def clientes(motor, indice: int, pedidos: int, resultados: list):
+    """Faz pedidos aleatórios; metade dos reservados é paga, o resto recusado"""
+    from database.reservas import EstoqueInsuficiente
+
+    aleatorio = random.Random(indice)
+    reservados = recusados = 0
+    for numero in range(pedidos):
+        pedido_id = f"stress-{os.getpid()}-{indice}-{numero}"
+        itens = [{'tipo': aleatorio.choice(TIPOS), 'quantidade': aleatorio.randint(1, 3)}
+                 for _ in range(aleatorio.randint(1, 3))]
+        try:
+            motor.reservar(pedido_id, itens)
+        except EstoqueInsuficiente:
+            recusados += 1
+            continue
+        reservados += 1
+        if aleatorio.random() < 0.5:
+            motor.confirmar(pedido_id)
+        else:
+            motor.liberar(pedido_id)
+    resultados[indice] = (reservados, recusados)
+
+
+def executar_processo(diretorio: str, threads: int, pedidos: int, saida: Queue):
+    """Um processo com o seu próprio motor sobre os bancos compartilhados"""
+    motor, bancos = abrir_motor(diretorio)
+    resultados = [None] * threads
+    grupo = [Thread(target=clientes, args=(motor, i, pedidos // threads, resultados))
+             for i in range(threads)]
+    for thread in grupo:
+        thread.start()
+    for thread in grupo:
+        thread.join()
+    for db in bancos:
+        db.close()
+    saida.put((sum(r[0] for r in resultados), sum(r[1] for r in resultados)))
+
+
+def conferir(motor, estoque_inicial: int) -> list:
+    """Retorna os problemas encontrados (lista vazia = nenhum overselling)"""
+    problemas = []
+    for tipo in TIPOS:
+        vendido = estoque_inicial - motor.quantidades.get(tipo, 0)
+        if vendido > estoque_inicial or motor.disponivel(tipo) < 0:
+            problemas.append(f"{tipo}: vendido {vendido} com estoque {estoque_inicial}")
+        if motor.reservado.get(tipo, 0):
+            problemas.append(f"{tipo}: {motor.reservado[tipo]} esfihas ainda reservadas")
+    return problemas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=16, help='threads por processo')
+    parser.add_argument('--processos', type=int, default=1)
+    parser.add_argument('--pedidos', type=int, default=20000, help='total de pedidos')
+    parser.add_argument('--estoque', type=int, default=5000, help='estoque inicial por tipo')
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    motor, bancos = abrir_motor(diretorio)
+    for tipo in TIPOS:
+        motor.adicionar(tipo, args.estoque)
+    for db in bancos:
+        db.close()
+
+    saida = Queue()
+    processos = [Process(target=executar_processo,
+                         args=(diretorio, args.threads, args.pedidos // args.processos, saida))
+                 for _ in range(args.processos)]
+    inicio = time.perf_counter()
+    for processo in processos:
+        processo.start()
+    resultados = [saida.get() for _ in processos]
+    for processo in processos:
+        processo.join()
+    duracao = time.perf_counter() - inicio
+
+    reservados = sum(r[0] for r in resultados)
+    recusados = sum(r[1] for r in resultados)
+    print(f"{args.processos} processo(s) x {args.threads} threads, {reservados + recusados} pedidos "
+          f"em {duracao:.2f}s ({(reservados + recusados) / duracao:.0f} pedidos/s)")
+    print(f"reservados: {reservados}, recusados por falta de estoque: {recusados}")
+
+    # Contadores recalculados a partir do disco: vendas descontadas do
+    # estoque e nenhuma reserva pendente
+    motor, bancos = abrir_motor(diretorio)
+    problemas = conferir(motor, args.estoque)
+    if motor.reservas.all():
+        problemas.append(f"{len(motor.reservas.all())} reservas ainda gravadas")
+    for db in bancos:
+        db.close()
+
+    for problema in problemas:
+        print(f"ERRO: {problema}")
+    if problemas:
+        raise SystemExit(1)
+    print("sem overselling; contadores consistentes com o disco")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark do fan-out do SNS com publicadores concorrentes
+Um tópico com uma fila SQS em memória e um assinante Lambda lento (latência
+injetada, como a escrita do Atualizar_Pedido no TinyDB). Compara:
+- lock do tópico durante todo o fan-out (comportamento anterior)
+- entregas síncronas sem o lock
+- assinante Lambda assíncrono (executor e buffer próprios)
+
+Uso:
+    python -m benchmarks.bench_sns --publicacoes 2000 --threads 1,4,16 --latencia 0.002
+"""
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import argparse
+import statistics
+import time
+
+
+def medir(publicar, publicacoes: int, threads: int) -> tuple:
+    """Executa publicar() em threads; retorna (publicações/s, p50 µs, p99 µs)"""
+    def lote(inicio):
+        duracoes = []
+        for _ in range(inicio, publicacoes, threads):
+            t = time.perf_counter()
+            publicar()
+            duracoes.append(time.perf_counter() - t)
+        return duracoes
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        duracoes = [d for parte in executor.map(lote, range(threads)) for d in parte]
+    total = time.perf_counter() - inicio
+    quantis = statistics.quantiles(duracoes, n=100)
+    return publicacoes / total, quantis[49] * 1e6, quantis[98] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--publicacoes', type=int, default=2000)
+    parser.add_argument('--threads', default='1,4,16')
+    parser.add_argument('--latencia', type=float, default=0.002,
+                        help='segundos de cada invocação do assinante Lambda')
+    args = parser.parse_args()
+
+    from messaging.sns import SNSTopic
+    from messaging.sqs import SQSQueue, _filas
+
+    def assinante_lento(event, context):
+        time.sleep(args.latencia)
+        return {'statusCode': 200}
+
+    evento = {'tipo': 'pagamento_concluido', 'pedido_id': 'bench', 'total': 10.5}
+    lock_antigo = Lock()
+
+    def criar_topico(nome: str, assincrono: bool) -> SNSTopic:
+        _filas[f'Fila_{nome}'] = SQSQueue(f'Fila_{nome}')
+        topico = SNSTopic(nome)
+        topico.subscribe('sqs', f'Fila_{nome}')
+        topico.subscribe('lambda', 'Lento', assinante_lento, assincrono=assincrono,
+                         capacidade=args.publicacoes)
+        return topico
+
+    print(f"{'cenário':<28} {'threads':>7} {'pub/s':>9} {'p50 (µs)':>10} {'p99 (µs)':>10}")
+    for threads in [int(t) for t in args.threads.split(',')]:
+        topico = criar_topico(f'Bench_lock_{threads}', False)
+
+        def com_lock():
+            with lock_antigo:
+                topico.publish(evento)
+
+        sincrono = criar_topico(f'Bench_sinc_{threads}', False)
+        assincrono = criar_topico(f'Bench_assinc_{threads}', True)
+        cenarios = (
+            ('lock durante o fan-out', com_lock),
+            ('síncrono, sem lock', lambda: sincrono.publish(evento)),
+            ('Lambda assíncrono', lambda: assincrono.publish(evento)),
+        )
+        for nome, publicar in cenarios:
+            vazao, p50, p99 = medir(publicar, args.publicacoes, threads)
+            print(f"{nome:<28} {threads:>7} {vazao:>9.0f} {p50:>10.1f} {p99:>10.1f}")
+        # Não deixa as entregas pendentes interferirem na próxima rodada
+        assincrono.aguardar_entregas()
+
+
+if __name__ == '__main__':
+    main()
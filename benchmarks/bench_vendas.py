@@ -0,0 +1,94 @@
+"""
+Benchmark do relatório de vendas por tipo e hora
+Compara a varredura dos pedidos pagos (o que era preciso antes dos
+agregados) com a consulta aos agregados, para intervalos de um dia, um
+mês e todo o histórico, e mede o custo de registrar um pagamento
+
+Uso:
+    python -m benchmarks.bench_vendas --pedidos 100000 --dias 90
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+TIPOS = {'esfiha_carne': 3.5, 'esfiha_frango': 3.5, 'esfiha_queijo': 3.0,
+         'esfiha_espinafre': 3.0, 'esfiha_pizza': 3.5, 'esfiha_4_queijos': 4.0}
+
+
+def gerar_pedidos_pagos(quantidade: int, dias: int) -> list:
+    """Pedidos pagos com data_pagamento espalhada pelos últimos `dias` dias"""
+    aleatorio = random.Random(0)
+    fim = datetime(2026, 1, 1)
+    return [
+        {
+            'pedido_id': str(uuid.uuid4()),
+            'status': 'pago',
+            'data_pagamento': (fim - timedelta(seconds=aleatorio.uniform(0, dias * 86400))).isoformat(),
+            'itens': [{'tipo': aleatorio.choice(list(TIPOS)), 'quantidade': aleatorio.randint(1, 5)}
+                      for _ in range(aleatorio.randint(1, 4))]
+        }
+        for _ in range(quantidade)
+    ]
+
+
+def varrer(pedidos: list, inicio: str, fim: str) -> dict:
+    """Relatório por varredura: receita por tipo dos pedidos pagos no intervalo"""
+    resultado = {}
+    for pedido in pedidos:
+        if pedido['status'] == 'pago' and inicio <= pedido['data_pagamento'] <= fim:
+            for item in pedido['itens']:
+                resultado[item['tipo']] = resultado.get(item['tipo'], 0) + TIPOS[item['tipo']] * item['quantidade']
+    return resultado
+
+
+def medir(funcao, repeticoes: int) -> float:
+    """Tempo médio por chamada em microssegundos"""
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pedidos', type=int, default=100000)
+    parser.add_argument('--dias', type=int, default=90)
+    args = parser.parse_args()
+
+    from database.vendas import AgregadosVendas, agregar_pedidos, hora_do_momento, somar_itens
+
+    pedidos = gerar_pedidos_pagos(args.pedidos, args.dias)
+    agregados = AgregadosVendas(os.path.join(tempfile.mkdtemp(), 'vendas.db'))
+    agregados.reconstruir(lambda: agregar_pedidos(pedidos, TIPOS, 3.0))
+
+    # A primeira consulta do processo carrega todas as linhas
+    carga = medir(agregados.consultar, 1)
+
+    fim = datetime(2026, 1, 1)
+    print(f"{args.pedidos} pedidos pagos em {args.dias} dias; carga inicial dos agregados: {carga:.0f} µs")
+    print(f"{'intervalo':<12} {'varredura (µs)':>15} {'agregados (µs)':>15}")
+    for nome, dias in (('1 dia', 1), ('30 dias', 30), ('tudo', args.dias)):
+        inicio = fim - timedelta(days=dias)
+        varredura = medir(lambda: varrer(pedidos, inicio.isoformat(), fim.isoformat()), 3)
+        consulta = medir(lambda: agregados.consultar(hora_do_momento(inicio.isoformat()),
+                                                     hora_do_momento(fim.isoformat())), 1000)
+        print(f"{nome:<12} {varredura:>15.0f} {consulta:>15.1f}")
+
+    # Pagamentos novos: um UPSERT por pedido; a consulta seguinte aplica só as linhas alteradas
+    novos = gerar_pedidos_pagos(2000, 1)
+    inicio = time.perf_counter()
+    for pedido in novos:
+        hora, somas = hora_do_momento(pedido['data_pagamento']), {}
+        somar_itens(somas, hora, pedido['itens'], TIPOS, 3.0)
+        agregados.registrar(pedido['pedido_id'], hora, somas)
+    registrar = (time.perf_counter() - inicio) / len(novos) * 1e6
+    print(f"registrar um pagamento: {registrar:.0f} µs; "
+          f"consulta após pagamentos: {medir(lambda: agregados.consultar(), 1):.0f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark do WALStorage
+Compara o custo de uma atualização e de uma inserção de pedido com
+JSONStorage (reescreve o arquivo inteiro) e com o WAL, para diferentes
+tamanhos de tabela. No WAL as duas devem custar o mesmo em qualquer tamanho
+
+Uso:
+    python -m benchmarks.bench_wal --tamanhos 1000,10000,100000
+"""
+import argparse
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from tinydb import TinyDB
+from tinydb.storages import JSONStorage
+from database.indices import IndicePedidos
+from database.wal import WALStorage
+from benchmarks.bench_indices import gerar_pedidos
+
+
+def medir_escritas(db: TinyDB, pedidos: list, operacoes: int) -> tuple:
+    """Retorna o tempo médio por atualização e por inserção em microssegundos"""
+    indice = IndicePedidos(db.table(db.default_table_name))
+    indice.inserir_varios(pedidos)
+    ids = [random.choice(pedidos)['pedido_id'] for _ in range(operacoes)]
+    # Pedidos novos, mais recentes que os existentes (o caso comum)
+    novos = gerar_pedidos(operacoes, datetime(2024, 1, 1) + timedelta(seconds=len(pedidos)))
+
+    inicio = time.perf_counter()
+    for pedido_id in ids:
+        indice.atualizar(pedido_id, {'status': 'pago'})
+    atualizar = (time.perf_counter() - inicio) / operacoes * 1e6
+
+    inicio = time.perf_counter()
+    for pedido in novos:
+        indice.inserir(pedido)
+    inserir = (time.perf_counter() - inicio) / operacoes * 1e6
+    return atualizar, inserir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tamanhos', default='1000,10000,100000')
+    parser.add_argument('--operacoes', type=int, default=200)
+    parser.add_argument('--janela-commit', type=float, default=0.05)
+    args = parser.parse_args()
+
+    print(f"{'pedidos':>10} {'atualizar (JSON)':>17} {'atualizar (WAL)':>16} "
+          f"{'inserir (JSON)':>15} {'inserir (WAL)':>14}")
+    for tamanho in (int(t) for t in args.tamanhos.split(',')):
+        pedidos = gerar_pedidos(tamanho)
+        with tempfile.TemporaryDirectory() as diretorio:
+            db_json = TinyDB(Path(diretorio) / 'json.json', storage=JSONStorage)
+            atualizar_json, inserir_json = medir_escritas(db_json, pedidos, args.operacoes)
+            db_json.close()
+
+            db_wal = TinyDB(Path(diretorio) / 'wal.json', storage=WALStorage,
+                            janela_commit=args.janela_commit)
+            atualizar_wal, inserir_wal = medir_escritas(db_wal, pedidos, args.operacoes)
+            db_wal.close()
+
+        print(f"{tamanho:>10} {atualizar_json:>15.1f}us {atualizar_wal:>14.1f}us "
+              f"{inserir_json:>13.1f}us {inserir_wal:>12.1f}us")
+
+
+if __name__ == '__main__':
+    main()
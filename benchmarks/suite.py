@@ -0,0 +1,304 @@
+"""
+Suíte de benchmarks de desempenho (em processo, sem servidor)
+Mede latência (p50/p95/p99) e vazão (ops/s) de:
+- criar_pedido / get_pedido / atualizar_pedido com 1k, 100k e 1M pedidos
+- SQSQueue: envio e recebimento com produtores e consumidores concorrentes
+- SNSTopic.publish com fan-out para 1, 4 e 16 filas
+- calcular_total
+- POST /pedidos de ponta a ponta (Flask test client)
+
+O resultado é gravado em JSON; com --comparar, cada caso é comparado com
+uma execução anterior e o script falha se algum piorar além da tolerância.
+Toda mudança de desempenho deve ser avaliada com esta suíte.
+
+Uso:
+    python -m benchmarks.suite --saida base.json
+    python -m benchmarks.suite --saida nova.json --comparar base.json
+    python -m benchmarks.suite --rapido
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from threading import Barrier, Lock, Thread
+from benchmarks.bench_indices import gerar_pedidos
+
+TIPOS = ['esfiha_carne', 'esfiha_frango', 'esfiha_queijo',
+         'esfiha_espinafre', 'esfiha_pizza', 'esfiha_4_queijos']
+
+
+def resumir(latencias: list, duracao: float, operacoes: int = None) -> dict:
+    """Percentis em microssegundos e vazão de um caso"""
+    ordenadas = sorted(latencias)
+
+    def percentil(p: float) -> float:
+        return ordenadas[min(int(p * len(ordenadas)), len(ordenadas) - 1)] * 1e6
+
+    operacoes = operacoes if operacoes is not None else len(latencias)
+    return {
+        'n': operacoes,
+        'p50_us': round(percentil(0.50), 2),
+        'p95_us': round(percentil(0.95), 2),
+        'p99_us': round(percentil(0.99), 2),
+        'ops_s': round(operacoes / duracao, 1)
+    }
+
+
+def cronometrar(funcao, argumentos: list) -> dict:
+    """Executa funcao(argumento) para cada argumento, medindo cada chamada"""
+    latencias = []
+    relogio = time.perf_counter
+    inicio = relogio()
+    for argumento in argumentos:
+        t0 = relogio()
+        funcao(argumento)
+        latencias.append(relogio() - t0)
+    return resumir(latencias, relogio() - inicio)
+
+
+def caso_banco(tamanho: int, operacoes: int) -> dict:
+    """Operações da Tabela_Pedidos (índices + WALStorage) com `tamanho` pedidos"""
+    from tinydb import TinyDB
+    from database.indices import IndicePedidos
+    from database.wal import WALStorage
+
+    diretorio = tempfile.mkdtemp()
+    db = TinyDB(os.path.join(diretorio, 'pedidos.json'), storage=WALStorage)
+    indice = IndicePedidos(db.table(db.default_table_name))
+    existentes = gerar_pedidos(tamanho)
+    for inicio in range(0, tamanho, 50000):
+        indice.inserir_varios(existentes[inicio:inicio + 50000])
+    # Carga inicial fora da medição: snapshot gravado, log vazio
+    db.storage.compactar()
+
+    novos = gerar_pedidos(operacoes)
+    ids = [random.choice(existentes)['pedido_id'] for _ in range(operacoes)]
+
+    def criar(pedido):
+        # Mesmo caminho de database.db.criar_pedido: inserção + sincronização do log
+        indice.inserir(pedido)
+        db.storage.sincronizar()
+
+    resultados = {
+        f'banco.criar_pedido[{tamanho}]': cronometrar(criar, novos),
+        f'banco.get_pedido[{tamanho}]': cronometrar(indice.buscar, ids),
+        f'banco.atualizar_pedido[{tamanho}]': cronometrar(
+            lambda pedido_id: indice.atualizar(pedido_id, {'status': 'pago'}), ids
+        ),
+    }
+    db.close()
+    return resultados
+
+
+def caso_sqs(backend: str, threads: int, mensagens: int) -> dict:
+    """`threads` produtores e `threads` consumidores disputando a mesma fila"""
+    if backend == 'sqlite':
+        from messaging.sqs_sqlite import SQSQueueSQLite
+        fila = SQSQueueSQLite('Bench', os.path.join(tempfile.mkdtemp(), 'filas.db'))
+    else:
+        from messaging.sqs import SQSQueue
+        fila = SQSQueue('Bench')
+
+    por_thread = mensagens // threads
+    envios = [[] for _ in range(threads)]
+    recebimentos = [[] for _ in range(threads)]
+    largada = Barrier(2 * threads + 1)
+    relogio = time.perf_counter
+    # Mensagens ainda não consumidas (qualquer consumidor pode pegar qualquer uma)
+    restantes = [por_thread * threads]
+    fim = [None]
+    trava = Lock()
+
+    def produtor(latencias):
+        largada.wait()
+        for i in range(por_thread):
+            t0 = relogio()
+            fila.send_message({'pedido_id': str(i), 'total': 10.0})
+            latencias.append(relogio() - t0)
+
+    def consumidor(latencias):
+        largada.wait()
+        while True:
+            with trava:
+                if restantes[0] <= 0:
+                    return
+            t0 = relogio()
+            lote = fila.receive_message(max_number_of_messages=1, wait_time_seconds=0.1)
+            for mensagem in lote:
+                fila.delete_message(mensagem['ReceiptHandle'])
+            if lote:
+                latencias.append(relogio() - t0)
+                with trava:
+                    restantes[0] -= len(lote)
+                    if restantes[0] <= 0:
+                        # Os demais consumidores ainda podem estar em long polling
+                        fim[0] = relogio()
+
+    trabalhadores = ([Thread(target=produtor, args=(l,)) for l in envios] +
+                     [Thread(target=consumidor, args=(l,)) for l in recebimentos])
+    for thread in trabalhadores:
+        thread.start()
+    largada.wait()
+    inicio = relogio()
+    for thread in trabalhadores:
+        thread.join()
+    duracao = fim[0] - inicio
+
+    total = por_thread * threads
+    return {
+        f'sqs.{backend}.send_message[{threads}x{threads}]':
+            resumir([l for ls in envios for l in ls], duracao, total),
+        f'sqs.{backend}.receive_delete[{threads}x{threads}]':
+            resumir([l for ls in recebimentos for l in ls], duracao, total),
+    }
+
+
+def caso_sns(assinantes: int, publicacoes: int) -> dict:
+    """SNSTopic.publish para `assinantes` filas em memória"""
+    from messaging.sns import SNSTopic
+    from messaging.sqs import SQSQueue, _filas
+
+    topico = SNSTopic(f'Bench_{assinantes}')
+    for i in range(assinantes):
+        nome = f'Bench_{assinantes}_{i}'
+        _filas[nome] = SQSQueue(nome)
+        topico.subscribe('sqs', nome)
+
+    evento = {'tipo': 'pedido_recebido', 'pedido_id': 'x', 'total': 10.0,
+              'itens': [{'tipo': 'esfiha_carne', 'quantidade': 2}]}
+    resultado = cronometrar(lambda _: topico.publish(evento), range(publicacoes))
+    for i in range(assinantes):
+        _filas.pop(f'Bench_{assinantes}_{i}')
+    return {f'sns.publish[{assinantes} assinantes]': resultado}
+
+
+def caso_calcular_total(operacoes: int) -> dict:
+    from database.db import calcular_total
+
+    aleatorio = random.Random(0)
+    pedidos = [[{'tipo': aleatorio.choice(TIPOS), 'quantidade': aleatorio.randint(1, 5)}
+                for _ in range(aleatorio.randint(1, 4))]
+               for _ in range(operacoes)]
+    return {'calcular_total': cronometrar(calcular_total, pedidos)}
+
+
+def caso_post_pedidos(operacoes: int) -> dict:
+    """POST /pedidos completo: validação, reserva, gravação e publicação"""
+    from app import create_app
+    from database.db import adicionar_estoque
+
+    for tipo in TIPOS:
+        adicionar_estoque(tipo, 10 * operacoes)
+    cliente = create_app().test_client()
+    aleatorio = random.Random(0)
+    corpos = [{
+        'cliente': {'nome': f'Cliente {i}'},
+        'itens': [{'tipo': aleatorio.choice(TIPOS), 'quantidade': aleatorio.randint(1, 3)}]
+    } for i in range(operacoes)]
+    return {'http.post_pedidos': cronometrar(lambda corpo: cliente.post('/pedidos', json=corpo), corpos)}
+
+
+def executar(args) -> dict:
+    resultados = {}
+
+    def registrar(casos: dict):
+        for nome, resultado in casos.items():
+            resultados[nome] = resultado
+            print(f"{nome:<42} p50 {resultado['p50_us']:>10.1f}us  p95 {resultado['p95_us']:>10.1f}us  "
+                  f"p99 {resultado['p99_us']:>10.1f}us  {resultado['ops_s']:>10.1f} ops/s", flush=True)
+
+    for tamanho in args.tamanhos:
+        registrar(caso_banco(tamanho, args.operacoes))
+    for backend in ('memoria', 'sqlite'):
+        for threads in args.threads:
+            registrar(caso_sqs(backend, threads, args.mensagens))
+    for assinantes in (1, 4, 16):
+        registrar(caso_sns(assinantes, args.operacoes))
+    registrar(caso_calcular_total(10 * args.operacoes))
+    registrar(caso_post_pedidos(args.operacoes))
+    return resultados
+
+
+def comparar(atual: dict, anterior: dict, tolerancia: float) -> list:
+    """
+    Compara p50, p99 e ops/s de cada caso presente nas duas execuções
+    Retorna os casos cujo p50 ou ops/s pioraram além da tolerância (fração,
+    ex.: 0.10); o p99 é só informativo, por ser ruidoso com poucas amostras
+    """
+    piores = []
+    print(f"\n{'caso':<42} {'p50':>10} {'p99':>10} {'ops/s':>10}")
+    for nome, resultado in atual.items():
+        base = anterior.get(nome)
+        if base is None:
+            continue
+        variacoes = {
+            'p50_us': resultado['p50_us'] / base['p50_us'] - 1 if base['p50_us'] else 0.0,
+            'p99_us': resultado['p99_us'] / base['p99_us'] - 1 if base['p99_us'] else 0.0,
+            # Menos ops/s é pior: inverte o sinal para "positivo = piorou"
+            'ops_s': 1 - resultado['ops_s'] / base['ops_s'] if base['ops_s'] else 0.0,
+        }
+        piorou = variacoes['p50_us'] > tolerancia or variacoes['ops_s'] > tolerancia
+        marca = '  <-- regressão' if piorou else ''
+        print(f"{nome:<42} {variacoes['p50_us']:>+9.1%} {variacoes['p99_us']:>+9.1%} "
+              f"{-variacoes['ops_s']:>+9.1%}{marca}")
+        if piorou:
+            piores.append(nome)
+    return piores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--saida', default='benchmark.json', help='arquivo JSON com os resultados')
+    parser.add_argument('--comparar', help='JSON de uma execução anterior')
+    parser.add_argument('--tolerancia', type=float, default=0.10,
+                        help='piora relativa aceita ao comparar (padrão 0.10 = 10%%)')
+    parser.add_argument('--tamanhos', default='1000,100000,1000000')
+    parser.add_argument('--operacoes', type=int, default=2000)
+    parser.add_argument('--mensagens', type=int, default=4000)
+    parser.add_argument('--threads', default='1,4')
+    parser.add_argument('--rapido', action='store_true', help='tamanhos e contagens reduzidos')
+    args = parser.parse_args()
+
+    if args.rapido:
+        args.tamanhos, args.operacoes, args.mensagens = '1000,10000', 500, 1000
+    args.tamanhos = [int(t) for t in args.tamanhos.split(',')]
+    args.threads = [int(t) for t in args.threads.split(',')]
+    saida = os.path.abspath(args.saida)
+    anterior = os.path.abspath(args.comparar) if args.comparar else None
+
+    # Banco e filas isolados em um diretório temporário
+    os.chdir(tempfile.mkdtemp())
+    logging.disable(logging.CRITICAL)
+    random.seed(0)
+
+    resultados = executar(args)
+    with open(saida, 'w') as f:
+        json.dump({
+            'meta': {
+                'data': datetime.now().isoformat(),
+                'python': sys.version.split()[0],
+                'plataforma': platform.platform(),
+                'cpus': os.cpu_count(),
+                'parametros': {'tamanhos': args.tamanhos, 'operacoes': args.operacoes,
+                               'mensagens': args.mensagens, 'threads': args.threads}
+            },
+            'resultados': resultados
+        }, f, indent=2)
+    print(f"\nResultados gravados em {saida}")
+
+    if anterior:
+        with open(anterior) as f:
+            piores = comparar(resultados, json.load(f)['resultados'], args.tolerancia)
+        if piores:
+            print(f"\n{len(piores)} caso(s) pioraram mais de {args.tolerancia:.0%}")
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
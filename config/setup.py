@@ -1,70 +1,170 @@
 """
 Configuração inicial do sistema
 Conecta SNS topics com SQS queues e Lambda functions
+Importar este módulo não configura nada: a API (create_app) e o worker
+chamam configurar_arquitetura() na inicialização
 """
 import logging
+from threading import Lock
 from messaging.sns import get_topic
 from messaging.sqs import get_queue
-from lambda_functions.processar_pagamento import processar_pagamento_handler
+from monitoramento.logs import rastrear
 
 logger = logging.getLogger(__name__)
 
+_configurada = False
+_lock = Lock()
+
+# Tempo (s) que uma mensagem fica invisível aguardando confirmação do consumidor
+VISIBILITY_TIMEOUT_PAGAMENTOS = 30
+# Recebimentos sem sucesso antes de mover a mensagem para a DLQ
+MAX_RECEBIMENTOS_PAGAMENTOS = 5
+
 
 def configurar_arquitetura():
     """
     Configura a arquitetura serverless:
     - SNS Topics com assinantes SQS
     - SQS Queues com handlers Lambda
+    Só cria as filas e as assinaturas; os bancos são abertos no primeiro uso
+    Chamadas repetidas não fazem nada
     """
+    global _configurada
+    with _lock:
+        if _configurada:
+            return
+        _configurar()
+        _configurada = True
+
+
+def _configurar():
     logger.info("Configurando arquitetura serverless...")
     
-    # 1. Tópico "Eventos_Pedidos" -> Fila_Pagamentos
+    # 1. Tópico "Eventos_Pedidos" -> Fila_Pagamentos (com dead-letter queue)
+    # FIFO agrupada por pedido_id: eventos de um mesmo pedido são processados
+    # em ordem, um por vez, e pedidos diferentes em paralelo
+    get_queue(
+        'Fila_Pagamentos',
+        visibility_timeout=VISIBILITY_TIMEOUT_PAGAMENTOS,
+        max_receive_count=MAX_RECEBIMENTOS_PAGAMENTOS,
+        dead_letter_queue='Fila_Pagamentos_DLQ',
+        fifo=True,
+        content_based_deduplication=True
+    )
     topic_eventos_pedidos = get_topic('Eventos_Pedidos')
     
-    # Assina fila de pagamentos
-    topic_eventos_pedidos.subscribe('sqs', 'Fila_Pagamentos')
+    # Assina fila de pagamentos: só pedidos novos são cobrados
+    topic_eventos_pedidos.subscribe('sqs', 'Fila_Pagamentos',
+                                    filter_policy={'tipo': ['pedido_recebido']})
     
     # 2. Tópico "Pagamento_Concluido" -> atualiza Tabela_Pedidos
     topic_pagamento_concluido = get_topic('Pagamento_Concluido')
     
     # Assina atualização de pedidos (via Lambda direto)
+    # Os assinantes Lambda são assíncronos: a escrita no TinyDB não segura
+    # quem publica (o pagamento já gravou o status antes de publicar)
     def atualizar_pedido_handler(event, ctx):
-        """Atualiza pedido quando pagamento é concluído"""
-        from database.db import atualizar_pedido
+        """
+        Atualiza pedido quando pagamento é concluído
+        Não faz nada se o pedido já está 'pago' (o caso normal: o pagamento
+        grava antes de publicar); senão grava o horário do próprio evento,
+        o mesmo que o pagamento grava, então a ordem das escritas não importa
+        """
+        from database.db import atualizar_pedido, get_pedido
         from datetime import datetime
         pedido_id = event.get('pedido_id')
-        if pedido_id:
-            atualizar_pedido(pedido_id, {
-                'status': 'pago',
-                'data_pagamento': datetime.now().isoformat()
-            })
+        if not pedido_id:
+            return
+        pedido = get_pedido(pedido_id)
+        if pedido and pedido.get('status') == 'pago':
+            return
+        atualizar_pedido(pedido_id, {
+            'status': 'pago',
+            'data_pagamento': event.get('timestamp') or datetime.now().isoformat()
+        })
+    
+    topic_pagamento_concluido.subscribe('lambda', 'Atualizar_Pedido', atualizar_pedido_handler, assincrono=True)
     
-    topic_pagamento_concluido.subscribe('lambda', 'Atualizar_Pedido', atualizar_pedido_handler)
+    # Agregados de vendas por tipo e hora (GET /relatorios/vendas)
+    from lambda_functions.agregar_vendas import agregar_vendas_handler
+    topic_pagamento_concluido.subscribe('lambda', 'Agregar_Vendas', agregar_vendas_handler, assincrono=True)
+    
+    # 3. Mudanças de status -> clientes do stream GET /pedidos/<id>/eventos
+    from database.db import observar_status_pedidos
+    from messaging.notificacoes import canal_status
+    observar_status_pedidos(canal_status.publicar)
     
     logger.info("Arquitetura configurada com sucesso!")
 
 
-def processar_filas():
+def extrair_evento(msg: dict) -> dict:
+    """
+    Extrai o evento original de uma mensagem SQS (desembrulha o envelope SNS)
+    As filas entregam o Body já decodificado; texto JSON só aparece em
+    mensagens gravadas antes dos codecs (messaging.codec)
+    """
+    import json
+    body_data = msg['Body']
+    if isinstance(body_data, (str, bytes)):
+        body_data = json.loads(body_data)
+    if isinstance(body_data, dict) and 'Message' in body_data:
+        mensagem = body_data['Message']
+        return json.loads(mensagem) if isinstance(mensagem, str) else mensagem
+    return body_data
+
+
+def extrair_trace_id(msg: dict) -> str | None:
+    """Trace ID do pedido, levado no atributo trace_id do envelope SNS"""
+    body_data = msg['Body']
+    if not isinstance(body_data, dict):
+        return None
+    atributo = body_data.get('MessageAttributes', {}).get('trace_id')
+    return atributo.get('Value') if atributo else None
+
+
+def processar_mensagem_pagamento(msg: dict) -> bool:
+    """
+    Invoca Processar_Pagamento para uma mensagem da Fila_Pagamentos
+    Retorna True se a mensagem pode ser removida da fila
+    """
+    from lambda_functions.processar_pagamento import processar_pagamento_handler
+    
+    with rastrear(extrair_trace_id(msg)):
+        resultado = processar_pagamento_handler(extrair_evento(msg), {})
+        if resultado.get('statusCode', 500) >= 500:
+            logger.error("Mensagem %s não confirmada; será reentregue", msg['MessageId'])
+            return False
+    if resultado.get('statusCode') == 409:
+        # Duplicata de um pagamento em andamento: reentregue, verá o resultado
+        return False
+    return True
+
+
+def processar_filas(wait_time_seconds: float = 0, max_number_of_messages: int = 10) -> int:
     """
     Processa mensagens das filas SQS e invoca Lambda functions
-    Deve ser chamado periodicamente (polling)
+    Com wait_time_seconds > 0 aguarda mensagens (long polling) em vez de
+    retornar imediatamente com a fila vazia
+    Mensagens só são removidas se o handler terminar sem erro; as demais
+    voltam para a fila quando o visibility timeout expirar
+    Retorna a quantidade de mensagens processadas
     """
-    from messaging.sqs import get_queue
+    configurar_arquitetura()
     
     # Processa Fila_Pagamentos
     fila_pagamentos = get_queue('Fila_Pagamentos')
-    mensagens = fila_pagamentos.receive_message(max_number_of_messages=10)
+    mensagens = fila_pagamentos.receive_message(
+        max_number_of_messages=max_number_of_messages,
+        wait_time_seconds=wait_time_seconds
+    )
     
+    processadas = []
     for msg in mensagens:
-        import json
-        body_data = json.loads(msg['Body'])
-        if isinstance(body_data, dict) and 'Message' in body_data:
-            event = json.loads(body_data['Message'])
-        else:
-            event = body_data
-        processar_pagamento_handler(event, {})
-        fila_pagamentos.delete_message(msg['MessageId'])
-
-
-# Configura arquitetura ao importar
-configurar_arquitetura()
+        if processar_mensagem_pagamento(msg):
+            processadas.append({'Id': str(len(processadas)), 'ReceiptHandle': msg['ReceiptHandle']})
+    
+    if processadas:
+        fila_pagamentos.delete_message_batch(processadas)
+    
+    return len(processadas)
+
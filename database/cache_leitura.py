@@ -0,0 +1,71 @@
+"""
+Cache de leitura das respostas mais consultadas
+Guarda o JSON já serializado (e o ETag) de cada consulta; as funções de
+escrita do banco invalidam as chaves que alteram
+"""
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Hashable, NamedTuple, Optional
+import hashlib
+import json
+
+
+class Representacao(NamedTuple):
+    """Corpo JSON de uma consulta e seu ETag (hash do corpo)"""
+    corpo: bytes
+    etag: str
+
+
+class CacheLeitura:
+    """
+    Representações serializadas por chave, com descarte LRU
+
+    Um acerto não toca o storage nem serializa de novo. Uma leitura que
+    estava carregando quando a chave foi invalidada não guarda o resultado,
+    que pode ser anterior à escrita; só as leituras seguintes o fazem.
+    Resultados None (ex.: pedido inexistente) não são guardados.
+    """
+
+    def __init__(self, capacidade: int):
+        self.capacidade = capacidade
+        self.lock = Lock()
+        self.representacoes: 'OrderedDict[Hashable, Representacao]' = OrderedDict()
+        # chave -> marca da leitura em andamento (removida por invalidar)
+        self._carregando = {}
+
+    def obter(self, chave: Hashable, carregar: Callable[[], Any]) -> Optional[Representacao]:
+        """Representação da chave; em caso de falta chama carregar() e serializa o resultado"""
+        with self.lock:
+            representacao = self.representacoes.get(chave)
+            if representacao is not None:
+                self.representacoes.move_to_end(chave)
+                return representacao
+            marca = self._carregando[chave] = object()
+
+        dados = carregar()
+        if dados is None:
+            representacao = None
+        else:
+            corpo = json.dumps(dados).encode('utf-8')
+            representacao = Representacao(corpo, hashlib.blake2b(corpo, digest_size=12).hexdigest())
+
+        with self.lock:
+            if self._carregando.get(chave) is marca:
+                del self._carregando[chave]
+                if representacao is not None:
+                    self.representacoes[chave] = representacao
+                    if len(self.representacoes) > self.capacidade:
+                        self.representacoes.popitem(last=False)
+        return representacao
+
+    def invalidar(self, chave: Hashable):
+        """Descarta a chave; chamado depois de cada escrita que a altera"""
+        with self.lock:
+            self.representacoes.pop(chave, None)
+            self._carregando.pop(chave, None)
+
+    def invalidar_tudo(self):
+        """Descarta todas as chaves (ex.: banco recarregado do snapshot)"""
+        with self.lock:
+            self.representacoes.clear()
+            self._carregando.clear()
@@ -0,0 +1,91 @@
+"""
+Catálogo de preços em memória
+Os preços vêm do estoque (db_estoque); calcular o total de um pedido vira
+uma consulta a um dicionário, sem acessar o banco
+"""
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+from tinydb import TinyDB
+
+# Preço usado para tipos fora do catálogo
+PRECO_PADRAO = 3.00
+
+
+class CatalogoPrecos:
+    """
+    Cache versionado dos preços do estoque
+
+    O dicionário de preços nunca é alterado depois de montado: invalidar()
+    incrementa a versão e descarta o cache, que é remontado a partir do
+    banco no próximo acesso. Leitores usam o dicionário que pegaram sem lock
+    e um lote inteiro é precificado com uma mesma versão. Alterações no
+    estoque feitas por outros processos (WALStorage) também invalidam o cache.
+    """
+
+    def __init__(self, db_estoque: TinyDB):
+        self.tabela = db_estoque.table(db_estoque.default_table_name)
+        self.lock = Lock()
+        self.versao = 0
+        self._precos: Optional[Dict[str, float]] = None
+
+        storage = self.tabela.storage
+        if hasattr(storage, 'observar'):
+            storage.observar(lambda tabela, _: self.invalidar())
+
+    def invalidar(self):
+        """Descarta os preços em cache; chamado a cada escrita no estoque"""
+        with self.lock:
+            self.versao += 1
+            self._precos = None
+
+    def precos(self) -> Dict[str, float]:
+        """Retorna o dicionário tipo -> preço da versão atual (não alterar)"""
+        precos = self._precos
+        if precos is not None:
+            return precos
+
+        with self.lock:
+            if self._precos is None:
+                bruta = (self.tabela.storage.read() or {}).get(self.tabela.name, {})
+                self._precos = {item['tipo']: item['preco'] for item in bruta.values()}
+            return self._precos
+
+    def preco(self, tipo: str) -> float:
+        """Preço unitário de um tipo de esfiha"""
+        return self.precos().get(tipo, PRECO_PADRAO)
+
+    def calcular_total(self, itens: list) -> float:
+        """Calcula o total de um pedido"""
+        return self._total(itens, self.precos())
+
+    def precificar(self, itens: list) -> Tuple[list, float]:
+        """
+        Cópia dos itens com o preco_unitario cobrado, e o total do pedido
+        O preço fica gravado no pedido: relatórios não dependem do catálogo atual
+        """
+        return self._precificar(itens, self.precos())
+
+    def precificar_varios(self, pedidos: List[list]) -> List[Tuple[list, float]]:
+        """precificar() de vários pedidos (listas de itens) com a mesma versão dos preços"""
+        precos = self.precos()
+        return [self._precificar(itens, precos) for itens in pedidos]
+
+    def calcular_totais(self, pedidos: List[list]) -> List[float]:
+        """Calcula os totais de vários pedidos (listas de itens) com a mesma versão dos preços"""
+        precos = self.precos()
+        return [self._total(itens, precos) for itens in pedidos]
+
+    @staticmethod
+    def _precificar(itens: list, precos: Dict[str, float]) -> Tuple[list, float]:
+        precificados = [dict(item, preco_unitario=precos.get(item.get('tipo'), PRECO_PADRAO)) for item in itens]
+        total = 0.0
+        for item in precificados:
+            total += item['preco_unitario'] * item.get('quantidade', 1)
+        return precificados, round(total, 2)
+
+    @staticmethod
+    def _total(itens: list, precos: Dict[str, float]) -> float:
+        total = 0.0
+        for item in itens:
+            total += precos.get(item.get('tipo'), PRECO_PADRAO) * item.get('quantidade', 1)
+        return round(total, 2)
@@ -1,27 +1,114 @@
 """
 Gerenciamento de banco de dados usando TinyDB
 Substitui DynamoDB da arquitetura AWS
+Os bancos são abertos no primeiro uso, não na importação: quem só consulta o
+estoque não paga pela leitura e indexação dos pedidos, e vice-versa
 """
+from threading import RLock
 from tinydb import TinyDB, Query
-from tinydb.storages import JSONStorage
-from tinydb.middlewares import CachingMiddleware
+from database.cache_leitura import CacheLeitura, Representacao
+from database.catalogo import CatalogoPrecos, PRECO_PADRAO
+from database.indices import IndicePedidos
+from database.reservas import CAMPO_INCORPORADAS, MotorReservas, EstoqueInsuficiente
+from database.vendas import AgregadosVendas, agregar_pedidos, hora_do_momento, somar_itens
+from database.wal import WALStorage
+import base64
+import json
 import os
 from pathlib import Path
+from typing import Optional
 
-# Cria diretório de dados se não existir
 data_dir = Path('data')
-data_dir.mkdir(exist_ok=True)
 
-# Inicializa TinyDB com cache
-db_pedidos = TinyDB('data/pedidos.json', storage=CachingMiddleware(JSONStorage))
-db_estoque = TinyDB('data/estoque.json', storage=CachingMiddleware(JSONStorage))
+# Janela de group commit do WAL em segundos (0 = fsync a cada escrita)
+JANELA_COMMIT = float(os.environ.get('ESFIHARIA_JANELA_COMMIT', '0.05'))
+# Respostas de GET /estoque e GET /pedidos/<id> guardadas já serializadas
+CAPACIDADE_CACHE_LEITURA = int(os.environ.get('ESFIHARIA_CACHE_LEITURA_CAPACIDADE', '10000'))
 
 Pedido = Query()
 Estoque = Query()
-Reserva = Query()
 
+# JSON das consultas mais frequentes, invalidado pelas escritas abaixo
+cache_leitura = CacheLeitura(CAPACIDADE_CACHE_LEITURA)
 
-def inicializar_estoque():
+
+def _abrir(arquivo: str) -> TinyDB:
+    """Abre um banco TinyDB com storage em log (snapshot + WAL)"""
+    data_dir.mkdir(exist_ok=True)
+    return TinyDB(str(data_dir / arquivo), storage=WALStorage, janela_commit=JANELA_COMMIT)
+
+
+class BancoPedidos:
+    """Tabela_Pedidos e seus índices (reconstruídos a partir do disco na abertura)"""
+
+    def __init__(self, observadores_status: list):
+        self.db_pedidos = _abrir('pedidos.json')
+        self.indice_pedidos = IndicePedidos(self.db_pedidos.table(self.db_pedidos.default_table_name))
+        for callback in observadores_status:
+            self.indice_pedidos.observar_status(callback)
+        self.db_pedidos.storage.observar(_invalidar_pedidos_externos)
+
+
+class BancoEstoque:
+    """Estoque, reservas e os contadores e preços mantidos em memória a partir deles"""
+
+    def __init__(self):
+        self.db_estoque = _abrir('estoque.json')
+        self.db_reservas = _abrir('reservas.json')
+        inicializar_estoque(self.db_estoque)
+        # Contadores de estoque em memória (recalculados a partir do estoque e das reservas)
+        self.motor_reservas = MotorReservas(self.db_estoque, self.db_reservas)
+        # Preços do estoque em memória, invalidados a cada escrita no estoque
+        self.catalogo_precos = CatalogoPrecos(self.db_estoque)
+        self.db_estoque.storage.observar(_invalidar_estoque_externo)
+        self.db_reservas.storage.observar(_invalidar_estoque_externo)
+
+
+_banco_pedidos: Optional[BancoPedidos] = None
+_banco_estoque: Optional[BancoEstoque] = None
+_agregados_vendas: Optional[AgregadosVendas] = None
+# Observadores de status registrados antes de os pedidos serem abertos
+_observadores_status = []
+_lock = RLock()
+
+
+def banco_pedidos() -> BancoPedidos:
+    """Bancos e índices de pedidos, abertos no primeiro acesso"""
+    global _banco_pedidos
+    if _banco_pedidos is None:
+        with _lock:
+            if _banco_pedidos is None:
+                _banco_pedidos = BancoPedidos(_observadores_status)
+    return _banco_pedidos
+
+
+def banco_estoque() -> BancoEstoque:
+    """Bancos de estoque e reservas, abertos no primeiro acesso"""
+    global _banco_estoque
+    if _banco_estoque is None:
+        with _lock:
+            if _banco_estoque is None:
+                _banco_estoque = BancoEstoque()
+    return _banco_estoque
+
+
+def agregados_vendas() -> AgregadosVendas:
+    """
+    Agregados de vendas (data/vendas.db), abertos no primeiro acesso
+    Um banco recém-criado é preenchido a partir dos pedidos já pagos
+    """
+    global _agregados_vendas
+    if _agregados_vendas is None:
+        with _lock:
+            if _agregados_vendas is None:
+                agregados = AgregadosVendas(str(data_dir / 'vendas.db'))
+                if agregados.novo:
+                    agregados.reconstruir(_somas_pedidos_pagos)
+                _agregados_vendas = agregados
+    return _agregados_vendas
+
+
+def inicializar_estoque(db_estoque: TinyDB):
     """Inicializa estoque com esfihas disponíveis"""
     if not db_estoque.all():
         esfihas_iniciais = [
@@ -41,76 +128,247 @@ def inicializar_estoque():
 
 # Operações de Pedidos
 def criar_pedido(pedido_data: dict):
-    """Cria um novo pedido"""
-    return db_pedidos.insert(pedido_data)
+    """
+    Cria um novo pedido
+    O registro (e a reserva de estoque do pedido) é gravado no log antes de
+    retornar: o pedido é publicado em seguida e pode ser processado por um
+    worker em outro processo
+    """
+    banco = banco_pedidos()
+    doc_id = banco.indice_pedidos.inserir(pedido_data)
+    banco_estoque().db_reservas.storage.sincronizar()
+    banco.db_pedidos.storage.sincronizar()
+    return doc_id
+
+
+def criar_pedidos(pedidos: list) -> list:
+    """
+    Cria vários pedidos com uma única escrita no log (importação em lote)
+    Retorna os doc_ids na mesma ordem
+    """
+    banco = banco_pedidos()
+    doc_ids = banco.indice_pedidos.inserir_varios(pedidos)
+    banco_estoque().db_reservas.storage.sincronizar()
+    banco.db_pedidos.storage.sincronizar()
+    return doc_ids
 
 
 def get_pedido(pedido_id: str) -> dict:
-    """Busca um pedido por ID"""
-    resultado = db_pedidos.search(Pedido.pedido_id == pedido_id)
-    return resultado[0] if resultado else None
+    """Busca um pedido por ID (via índice primário)"""
+    return banco_pedidos().indice_pedidos.buscar(pedido_id)
+
+
+def get_pedido_json(pedido_id: str) -> Optional[Representacao]:
+    """Pedido serializado em JSON, com ETag, a partir do cache de leitura"""
+    return cache_leitura.obter(('pedido', pedido_id), lambda: get_pedido(pedido_id))
 
 
 def atualizar_pedido(pedido_id: str, atualizacoes: dict):
     """Atualiza um pedido"""
-    db_pedidos.update(atualizacoes, Pedido.pedido_id == pedido_id)
+    banco_pedidos().indice_pedidos.atualizar(pedido_id, atualizacoes)
+    cache_leitura.invalidar(('pedido', pedido_id))
+
+
+def observar_status_pedidos(callback):
+    """
+    Registra callback(pedido_id, pedido) chamado a cada mudança de status,
+    inclusive as feitas por outros processos (ex.: o worker)
+    Não abre os pedidos: se ainda não foram abertos, o callback é registrado
+    quando forem
+    """
+    with _lock:
+        _observadores_status.append(callback)
+        if _banco_pedidos is not None:
+            _banco_pedidos.indice_pedidos.observar_status(callback)
+
+
+def listar_pedidos(limite: int, cursor: str = None, status: str = None, cliente: str = None,
+                   inicio: str = None, fim: str = None) -> tuple:
+    """
+    Lista uma página de pedidos, em ordem de criação (via índices)
+    cursor: valor de proximo_cursor da página anterior
+    Retorna (pedidos, proximo_cursor); proximo_cursor é None na última página
+    Lança ValueError se o cursor for inválido
+    """
+    apos = _decodificar_cursor(cursor) if cursor else None
+    pedidos, proximo = banco_pedidos().indice_pedidos.listar_pagina(
+        limite, apos=apos, status=status, cliente=cliente, inicio=inicio, fim=fim
+    )
+    return pedidos, _codificar_cursor(proximo) if proximo else None
+
+
+def _codificar_cursor(chave: tuple) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(chave)).encode('utf-8')).decode('ascii')
 
 
-def listar_pedidos() -> list:
-    """Lista todos os pedidos"""
-    return db_pedidos.all()
+def _decodificar_cursor(cursor: str) -> tuple:
+    try:
+        data_criacao, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(data_criacao), int(doc_id)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError(f"Cursor inválido: {cursor}")
+
+
+def listar_pedidos_por_status(status: str) -> list:
+    """Lista os pedidos com um determinado status (via índice secundário)"""
+    return banco_pedidos().indice_pedidos.listar_por_status(status)
+
+
+def listar_pedidos_por_periodo(inicio: str = None, fim: str = None) -> list:
+    """Lista os pedidos criados entre inicio e fim (datas ISO, inclusive)"""
+    return banco_pedidos().indice_pedidos.listar_por_periodo(inicio, fim)
 
 
 # Operações de Estoque
 def get_estoque() -> list:
-    """Retorna todo o estoque"""
-    return db_estoque.all()
+    """Retorna todo o estoque, com a quantidade ainda disponível para reserva"""
+    banco = banco_estoque()
+    return [_item_estoque(item, banco.motor_reservas.disponivel(item['tipo']))
+            for item in banco.db_estoque.all()]
+
+
+def get_estoque_json() -> Representacao:
+    """Estoque serializado em JSON, com ETag, a partir do cache de leitura"""
+    return cache_leitura.obter('estoque', get_estoque)
 
 
 def get_estoque_item(tipo: str) -> dict:
     """Busca um item específico do estoque"""
-    resultado = db_estoque.search(Estoque.tipo == tipo)
-    return resultado[0] if resultado else None
-
-
-def reservar_estoque(tipo: str, quantidade: int, pedido_id: str):
-    """Reserva esfihas do estoque"""
-    item = get_estoque_item(tipo)
-    
-    if item:
-        nova_quantidade = item['quantidade'] - quantidade
-        db_estoque.update(
-            {'quantidade': nova_quantidade},
-            Estoque.tipo == tipo
-        )
-        
-        # Registra a reserva
-        db_reservas.insert({
-            'pedido_id': pedido_id,
-            'tipo': tipo,
-            'quantidade': quantidade,
-            'data_reserva': item.get('data_reserva', '')
-        })
+    banco = banco_estoque()
+    resultado = banco.db_estoque.search(Estoque.tipo == tipo)
+    if not resultado:
+        return None
+    return _item_estoque(resultado[0], banco.motor_reservas.disponivel(tipo))
+
+
+def _item_estoque(item: dict, disponivel: int) -> dict:
+    """Documento de estoque com a quantidade disponível, sem os campos internos das reservas"""
+    item = dict(item, quantidade=disponivel)
+    item.pop(CAMPO_INCORPORADAS, None)
+    return item
+
+
+def reservar_estoque(pedido_id: str, itens: list):
+    """
+    Reserva todos os itens do pedido de uma vez
+    Lança EstoqueInsuficiente se algum tipo não tiver quantidade suficiente
+    """
+    banco_estoque().motor_reservas.reservar(pedido_id, itens)
+    cache_leitura.invalidar('estoque')
+
+
+def confirmar_reserva(pedido_id: str) -> bool:
+    """Pagamento aprovado: as esfihas reservadas viram venda"""
+    confirmada = banco_estoque().motor_reservas.confirmar(pedido_id)
+    cache_leitura.invalidar('estoque')
+    return confirmada
+
+
+def liberar_reserva(pedido_id: str) -> bool:
+    """Pagamento recusado (ou pedido não criado): devolve as esfihas ao estoque"""
+    liberada = banco_estoque().motor_reservas.liberar(pedido_id)
+    cache_leitura.invalidar('estoque')
+    return liberada
 
 
 def adicionar_estoque(tipo: str, quantidade: int):
     """Adiciona esfihas ao estoque"""
-    item = get_estoque_item(tipo)
-    
-    if item:
-        nova_quantidade = item['quantidade'] + quantidade
-        db_estoque.update(
-            {'quantidade': nova_quantidade},
-            Estoque.tipo == tipo
-        )
-    else:
-        db_estoque.insert({
-            'tipo': tipo,
-            'quantidade': quantidade,
-            'preco': 3.00
-        })
-
-
-# Inicializa estoque ao importar
-inicializar_estoque()
+    banco = banco_estoque()
+    banco.motor_reservas.adicionar(tipo, quantidade)
+    banco.catalogo_precos.invalidar()
+    cache_leitura.invalidar('estoque')
+
+
+def atualizar_preco(tipo: str, preco: float):
+    """Altera o preço de um tipo de esfiha"""
+    banco = banco_estoque()
+    banco.motor_reservas.atualizar_preco(tipo, preco)
+    banco.catalogo_precos.invalidar()
+    cache_leitura.invalidar('estoque')
+
+
+# Operações de Catálogo
+def calcular_total(itens: list) -> float:
+    """Calcula o total de um pedido com os preços do estoque (em cache)"""
+    return banco_estoque().catalogo_precos.calcular_total(itens)
+
+
+def calcular_totais(pedidos: list) -> list:
+    """Calcula os totais de vários pedidos (listas de itens) de uma vez"""
+    return banco_estoque().catalogo_precos.calcular_totais(pedidos)
+
+
+def precificar_itens(itens: list) -> tuple:
+    """(itens com o preco_unitario cobrado, total) com os preços do estoque (em cache)"""
+    return banco_estoque().catalogo_precos.precificar(itens)
+
+
+def precificar_pedidos(pedidos: list) -> list:
+    """precificar_itens() de vários pedidos (listas de itens) de uma vez"""
+    return banco_estoque().catalogo_precos.precificar_varios(pedidos)
+
+
+# Operações de Vendas
+def registrar_venda(pedido_id: str, momento: str, itens: list) -> bool:
+    """
+    Soma os itens de um pedido pago aos agregados da hora do pagamento (momento ISO)
+    A receita usa o preco_unitario gravado em cada item; o catálogo atual só
+    vale para itens de pedidos anteriores a ele
+    Retorna False se o pedido já estava contabilizado
+    """
+    hora, somas = hora_do_momento(momento), {}
+    somar_itens(somas, hora, itens, banco_estoque().catalogo_precos.precos(), PRECO_PADRAO)
+    return agregados_vendas().registrar(pedido_id, hora, somas)
+
+
+def consultar_vendas(inicio: Optional[int] = None, fim: Optional[int] = None) -> dict:
+    """(quantidade, centavos) por tipo nas horas [inicio, fim] (ver database.vendas.hora_do_momento)"""
+    return agregados_vendas().consultar(inicio, fim)
+
+
+def consultar_vendas_por_hora(inicio: int, fim: int) -> list:
+    """Série hora a hora das vendas por tipo em [inicio, fim]"""
+    return agregados_vendas().consultar_por_hora(inicio, fim)
+
+
+def reconstruir_vendas():
+    """Recalcula os agregados de vendas a partir dos pedidos pagos da Tabela_Pedidos"""
+    agregados_vendas().reconstruir(_somas_pedidos_pagos)
+
+
+def _somas_pedidos_pagos() -> tuple:
+    # Aplica antes os pagamentos gravados há instantes por outros processos
+    banco_pedidos().db_pedidos.storage.acompanhar()
+    # A receita usa os preços cobrados, gravados nos itens (o catálogo só
+    # para pedidos antigos, sem preco_unitario), como registrar_venda
+    return agregar_pedidos(listar_pedidos_por_status('pago'),
+                           banco_estoque().catalogo_precos.precos(), PRECO_PADRAO)
+
+
+def _liquidar_reserva(pedido_id: str, pedido: dict):
+    """
+    Liquida a reserva quando o pagamento termina, inclusive se o status foi
+    alterado por outro processo (o worker) e a reserva pendente está aqui
+    """
+    if pedido.get('status') == 'pago':
+        confirmar_reserva(pedido_id)
+    elif pedido.get('status') == 'pagamento_recusado':
+        liberar_reserva(pedido_id)
+
+
+def _invalidar_pedidos_externos(tabela: Optional[str], alteracoes: list):
+    """Observador do storage: pedidos alterados por outros processos (ex.: o worker)"""
+    if tabela is None:
+        cache_leitura.invalidar_tudo()
+        return
+    for _, anterior, novo in alteracoes:
+        cache_leitura.invalidar(('pedido', (novo or anterior).get('pedido_id')))
+
+
+def _invalidar_estoque_externo(tabela: Optional[str], alteracoes: list):
+    """Observador do storage: estoque ou reservas alterados por outros processos"""
+    cache_leitura.invalidar('estoque')
+
 
+# Reservas pendentes deste processo são liquidadas quando o pagamento termina
+observar_status_pedidos(_liquidar_reserva)
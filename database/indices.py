@@ -0,0 +1,325 @@
+"""
+Índices em memória para a Tabela_Pedidos
+Evita varrer a tabela inteira a cada consulta por pedido_id
+"""
+from bisect import bisect_left, bisect_right, insort
+from threading import RLock
+from typing import Dict, List, Optional, Set, Tuple
+from tinydb.table import Document, Table
+
+
+class AlocadorIds:
+    """
+    Aloca doc_ids para escritas feitas direto no storage
+    Com um storage compartilhado entre processos (reservar_ids), os ids vêm
+    de blocos únicos entre processos. Não é thread-safe: o chamador segura
+    o próprio lock
+    """
+
+    # Quantidade de doc_ids reservados de uma vez no storage compartilhado
+    TAMANHO_BLOCO = 1000
+
+    def __init__(self, tabela: Table):
+        self.tabela = tabela
+        self.proximo = 1
+        self.fim_bloco = None
+
+    def reiniciar(self, maior_id: int):
+        """Descarta o bloco atual; os próximos ids serão maiores que maior_id"""
+        self.proximo = max(self.proximo, maior_id + 1)
+        self.fim_bloco = None
+
+    def alocar(self, restantes: int = 1) -> int:
+        """Retorna um doc_id livre; restantes dimensiona o próximo bloco reservado"""
+        storage = self.tabela.storage
+        if not hasattr(storage, 'reservar_ids'):
+            doc_id = self.proximo
+            self.proximo += 1
+            return doc_id
+
+        if self.fim_bloco is None or self.proximo >= self.fim_bloco:
+            quantidade = max(restantes, self.TAMANHO_BLOCO)
+            self.proximo = storage.reservar_ids(self.tabela.name, quantidade, self.proximo)
+            self.fim_bloco = self.proximo + quantidade
+        doc_id = self.proximo
+        self.proximo += 1
+        return doc_id
+
+
+class IndicePedidos:
+    """
+    Mantém índices sobre uma tabela TinyDB de pedidos:
+    - primário: pedido_id -> doc_id (hash)
+    - secundário: status -> doc_ids
+    - secundário: data_criacao -> doc_ids ordenados (consultas por intervalo)
+    - secundário: cliente (nome ou email) -> doc_ids
+
+    As escritas gravam apenas os documentos afetados (documentos novos, sem
+    tocar nos que estão na tabela), em vez de reconstruir a tabela inteira
+    como o Table.update do TinyDB; quem altera a tabela é o storage.
+    Todas as escritas em pedidos devem passar por aqui para manter os
+    índices consistentes. Com um storage compartilhado entre processos
+    (WALStorage), as alterações feitas pelos outros processos chegam por
+    observar() e os doc_ids são reservados em blocos únicos entre processos.
+    """
+
+    CAMPOS_INDEXADOS = frozenset({'pedido_id', 'status', 'data_criacao', 'cliente'})
+
+    def __init__(self, tabela: Table):
+        self.tabela = tabela
+        self.lock = RLock()
+        self.por_id: Dict[str, int] = {}
+        self.por_status: Dict[str, Set[int]] = {}
+        self.por_data: List[Tuple[str, int]] = []
+        self.por_cliente: Dict[str, Set[int]] = {}
+        self._ids = AlocadorIds(tabela)
+        self._observadores_status = []
+        self.reconstruir()
+
+        storage = self.tabela.storage
+        if hasattr(storage, 'observar'):
+            storage.observar(self._aplicar_externas)
+
+    def reconstruir(self):
+        """Reconstrói todos os índices a partir do conteúdo do storage"""
+        with self.lock:
+            self.por_id = {}
+            self.por_status = {}
+            self.por_cliente = {}
+            datas = []
+            maior_id = 0
+
+            for chave, doc in self._tabela_bruta().items():
+                doc_id = int(chave)
+                maior_id = max(maior_id, doc_id)
+                self._indexar(doc_id, doc, datas)
+
+            datas.sort()
+            self.por_data = datas
+            self._ids.reiniciar(maior_id)
+
+    def inserir(self, pedido: dict) -> int:
+        """Insere um pedido e retorna seu doc_id"""
+        return self.inserir_varios([pedido])[0]
+
+    def inserir_varios(self, pedidos: list) -> List[int]:
+        """Insere vários pedidos com uma única escrita no storage"""
+        with self.lock:
+            documentos = {}
+            for pedido in pedidos:
+                doc_id = self._ids.alocar(len(pedidos) - len(documentos))
+                documentos[doc_id] = dict(pedido)
+
+            self._gravar(documentos)
+            for doc_id, doc in documentos.items():
+                self._indexar(doc_id, doc)
+            return list(documentos)
+
+    def buscar(self, pedido_id: str) -> Optional[Document]:
+        """Busca um pedido por ID em O(1)"""
+        with self.lock:
+            doc_id = self._localizar(pedido_id)
+            if doc_id is None:
+                return None
+            return self._documento(doc_id)
+
+    def atualizar(self, pedido_id: str, atualizacoes: dict) -> bool:
+        """Atualiza campos de um pedido; retorna False se ele não existir"""
+        with self.lock:
+            doc_id = self._localizar(pedido_id)
+            if doc_id is None:
+                return False
+
+            anterior = self._tabela_bruta()[str(doc_id)]
+            doc = {**anterior, **atualizacoes}
+            self._gravar({doc_id: doc})
+            # Só mexe nos índices dos campos que realmente mudam
+            campos = self.CAMPOS_INDEXADOS.intersection(atualizacoes)
+            self._desindexar(doc_id, anterior, campos)
+            self._indexar(doc_id, doc, campos=campos)
+            pedido = Document(doc, doc_id)
+
+        if pedido.get('status') != anterior.get('status'):
+            self._notificar_status(pedido)
+        return True
+
+    def observar_status(self, callback):
+        """Registra callback(pedido_id, pedido) chamado a cada mudança de status"""
+        self._observadores_status.append(callback)
+
+    def listar_por_status(self, status: str) -> List[Document]:
+        """Retorna os pedidos com um status, em ordem de doc_id"""
+        with self.lock:
+            doc_ids = sorted(self.por_status.get(status, ()))
+            return [self._documento(doc_id) for doc_id in doc_ids]
+
+    def listar_por_periodo(self, inicio: str = None, fim: str = None) -> List[Document]:
+        """Retorna os pedidos com data_criacao entre inicio e fim (inclusive)"""
+        with self.lock:
+            esquerda = 0 if inicio is None else bisect_left(self.por_data, (inicio, 0))
+            direita = (len(self.por_data) if fim is None
+                       else bisect_right(self.por_data, (fim, float('inf'))))
+            return [self._documento(doc_id) for _, doc_id in self.por_data[esquerda:direita]]
+
+    def listar_pagina(self, limite: int, apos: tuple = None, status: str = None, cliente: str = None,
+                      inicio: str = None, fim: str = None) -> Tuple[List[Document], Optional[tuple]]:
+        """
+        Página de pedidos em ordem de (data_criacao, doc_id), com filtros opcionais
+        apos: cursor da página anterior (exclusivo)
+        Retorna (pedidos, cursor da próxima página ou None se não há mais)
+
+        O custo não depende do tamanho da tabela: percorre o índice por data a
+        partir do cursor, ou, se um filtro for muito seletivo, ordena só os
+        doc_ids desse filtro (o que for mais barato)
+        """
+        with self.lock:
+            esquerda = 0 if inicio is None else bisect_left(self.por_data, (inicio, 0))
+            if apos is not None:
+                esquerda = max(esquerda, bisect_right(self.por_data, tuple(apos)))
+            direita = (len(self.por_data) if fim is None
+                       else bisect_right(self.por_data, (fim, float('inf'))))
+
+            filtros = []
+            if status is not None:
+                filtros.append(self.por_status.get(status, set()))
+            if cliente is not None:
+                filtros.append(self.por_cliente.get(cliente, set()))
+            menor = min(filtros, key=len) if filtros else None
+
+            # Percorrer o índice por data examina ~limite * n / k entradas para
+            # achar limite resultados; ordenar o filtro custa ~k
+            if menor is not None and len(menor) ** 2 <= limite * (direita - esquerda):
+                bruta = self._tabela_bruta()
+                minimo = self.por_data[esquerda] if esquerda < direita else None
+                maximo = self.por_data[direita - 1] if esquerda < direita else None
+                chaves = sorted(
+                    chave for chave in ((bruta[str(doc_id)].get('data_criacao'), doc_id) for doc_id in menor)
+                    if chave[0] is not None and minimo is not None and minimo <= chave <= maximo
+                )
+                candidatas = iter(chaves)
+            else:
+                candidatas = (self.por_data[i] for i in range(esquerda, direita))
+
+            pagina = []
+            for chave in candidatas:
+                if all(chave[1] in filtro for filtro in filtros):
+                    pagina.append(chave)
+                    if len(pagina) == limite:
+                        break
+
+            pedidos = [self._documento(doc_id) for _, doc_id in pagina]
+            proximo = pagina[-1] if len(pagina) == limite else None
+            return pedidos, proximo
+
+    @staticmethod
+    def chaves_cliente(cliente) -> Set[str]:
+        """Valores pelos quais um pedido pode ser filtrado por cliente"""
+        if isinstance(cliente, dict):
+            return {str(cliente[campo]) for campo in ('nome', 'email') if cliente.get(campo)}
+        return {str(cliente)} if cliente else set()
+
+    def _localizar(self, pedido_id: str) -> Optional[int]:
+        doc_id = self.por_id.get(pedido_id)
+        storage = self.tabela.storage
+        if doc_id is None and hasattr(storage, 'acompanhar'):
+            # Pode ter sido criado por outro processo há instantes
+            storage.acompanhar()
+            doc_id = self.por_id.get(pedido_id)
+        return doc_id
+
+    def _aplicar_externas(self, tabela: str, alteracoes: list):
+        """Observador do storage: reindexa documentos gravados por outros processos"""
+        if tabela is None:
+            self.reconstruir()
+            return
+        if tabela != self.tabela.name:
+            return
+
+        mudancas_status = []
+        with self.lock:
+            for chave, anterior, novo in alteracoes:
+                doc_id = int(chave)
+                if anterior is not None:
+                    self._desindexar(doc_id, anterior)
+                if novo is not None:
+                    self._indexar(doc_id, novo)
+                    if anterior is not None and anterior.get('status') != novo.get('status'):
+                        mudancas_status.append(Document(novo, doc_id))
+
+        for pedido in mudancas_status:
+            self._notificar_status(pedido)
+
+    def _notificar_status(self, pedido: Document):
+        for callback in self._observadores_status:
+            callback(pedido.get('pedido_id'), pedido)
+
+    def _indexar(self, doc_id: int, doc: dict, datas: list = None, campos=CAMPOS_INDEXADOS):
+        pedido_id = doc.get('pedido_id')
+        if 'pedido_id' in campos and pedido_id is not None:
+            self.por_id[pedido_id] = doc_id
+
+        if 'status' in campos:
+            self.por_status.setdefault(doc.get('status'), set()).add(doc_id)
+
+        data_criacao = doc.get('data_criacao')
+        if 'data_criacao' in campos and data_criacao is not None:
+            chave = (data_criacao, doc_id)
+            if datas is not None:
+                datas.append(chave)
+            elif not self.por_data or chave >= self.por_data[-1]:
+                # Caso comum: pedidos novos chegam em ordem de data_criacao
+                self.por_data.append(chave)
+            else:
+                insort(self.por_data, chave)
+
+        if 'cliente' in campos:
+            for chave in self.chaves_cliente(doc.get('cliente')):
+                self.por_cliente.setdefault(chave, set()).add(doc_id)
+
+    def _desindexar(self, doc_id: int, doc: dict, campos=CAMPOS_INDEXADOS):
+        pedido_id = doc.get('pedido_id')
+        if 'pedido_id' in campos and self.por_id.get(pedido_id) == doc_id:
+            del self.por_id[pedido_id]
+
+        ids_status = self.por_status.get(doc.get('status')) if 'status' in campos else None
+        if ids_status is not None:
+            ids_status.discard(doc_id)
+            if not ids_status:
+                del self.por_status[doc.get('status')]
+
+        data_criacao = doc.get('data_criacao')
+        if 'data_criacao' in campos and data_criacao is not None:
+            posicao = bisect_left(self.por_data, (data_criacao, doc_id))
+            if posicao < len(self.por_data) and self.por_data[posicao] == (data_criacao, doc_id):
+                del self.por_data[posicao]
+
+        if 'cliente' in campos:
+            for chave in self.chaves_cliente(doc.get('cliente')):
+                ids_cliente = self.por_cliente.get(chave)
+                if ids_cliente is not None:
+                    ids_cliente.discard(doc_id)
+                    if not ids_cliente:
+                        del self.por_cliente[chave]
+
+    def _documento(self, doc_id: int) -> Optional[Document]:
+        doc = self._tabela_bruta().get(str(doc_id))
+        return Document(doc, doc_id) if doc is not None else None
+
+    def _tabela_bruta(self) -> dict:
+        return self._ler_tabelas().get(self.tabela.name, {})
+
+    def _ler_tabelas(self) -> dict:
+        return self.tabela.storage.read() or {}
+
+    def _gravar(self, documentos: Dict[int, dict]):
+        """Grava documentos novos ou atualizados (não alterar depois)"""
+        documentos = {str(doc_id): doc for doc_id, doc in documentos.items()}
+        storage = self.tabela.storage
+        if hasattr(storage, 'gravar_documentos'):
+            # Storages com log (WALStorage) registram só os documentos alterados
+            storage.gravar_documentos(self.tabela.name, documentos)
+        else:
+            tabelas = self._ler_tabelas()
+            tabelas.setdefault(self.tabela.name, {}).update(documentos)
+            storage.write(tabelas)
+        self.tabela.clear_cache()
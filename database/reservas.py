@@ -0,0 +1,557 @@
+"""
+Motor de reservas de estoque
+Reserva todos os itens de um pedido de forma atômica, sem varrer o
+estoque e sem vender além do disponível
+"""
+from contextlib import contextmanager
+from datetime import datetime
+import logging
+from threading import Condition, Lock
+from typing import Dict, List, Optional
+from tinydb import TinyDB
+from database.catalogo import PRECO_PADRAO
+from database.indices import AlocadorIds
+
+logger = logging.getLogger(__name__)
+
+# Estados de uma reserva: 'pendente' aguarda o pagamento. Reservas pagas são
+# descontadas do estoque e removidas, as recusadas só removidas; 'confirmada'
+# e 'liberada' só existem em bancos antigos e são incorporadas na abertura
+ESTADOS_ATIVOS = frozenset({'pendente', 'confirmada'})
+# Campo do documento de estoque com os pedidos da última venda descontada
+# do tipo: se o processo cair entre descontar o estoque e remover a reserva,
+# a abertura sabe que a reserva já foi descontada
+CAMPO_INCORPORADAS = 'reservas_incorporadas'
+
+
+class EstoqueInsuficiente(Exception):
+    """Não há esfihas suficientes de um tipo para atender o pedido"""
+
+    def __init__(self, tipo: str, solicitado: int, disponivel: int):
+        self.tipo = tipo
+        self.solicitado = solicitado
+        self.disponivel = disponivel
+        super().__init__(
+            f"Estoque insuficiente de {tipo}: solicitado {solicitado}, disponível {disponivel}"
+        )
+
+
+class MotorReservas:
+    """
+    Contadores de estoque em memória, um lock por tipo de esfiha
+
+    disponível = quantidade em estoque - esfihas em reservas ativas
+    (pendentes ou confirmadas). Uma reserva trava só os tipos do pedido, em
+    ordem fixa para não haver deadlock, confere todos e só então debita:
+    ou o pedido inteiro é reservado, ou nada muda. Pedidos com tipos
+    diferentes não disputam lock.
+
+    Cada reserva pendente é um documento no banco de reservas, gravado
+    apenas com seus próprios dados (gravar_documentos). Quando o pagamento
+    é aprovado, as esfihas são descontadas do documento de estoque e a
+    reserva é removida; quando é recusado, a reserva só é removida. O banco
+    de reservas guarda apenas as pendentes e a abertura não relê o
+    histórico de vendas. Os contadores não são gravados: são recalculados
+    na inicialização.
+
+    Vários processos (API e workers) compartilham os bancos. A conferência
+    e o débito em memória só usam os locks dos tipos; a gravação é feita em
+    lotes: a thread que encontra o lote livre grava de uma vez as operações
+    que as outras threads acumularam, em uma transação do WALStorage das
+    reservas (flock), que antes aplica o que os outros processos gravaram.
+    Dentro da transação cada reserva do lote é conferida de novo, agora
+    vendo as reservas e vendas de todos os processos, e recusada se o
+    estoque não bastar: não há venda além do estoque entre processos.
+    Se a gravação falhar, o débito da reserva é desfeito.
+    """
+
+    def __init__(self, db_estoque: TinyDB, db_reservas: TinyDB):
+        self.estoque = db_estoque.table(db_estoque.default_table_name)
+        self.reservas = db_reservas.table(db_reservas.default_table_name)
+        self.lock = Lock()
+        self._locks: Dict[str, Lock] = {}
+        self.quantidades: Dict[str, int] = {}
+        self.reservado: Dict[str, int] = {}
+        # pedido_id -> (doc_id, {tipo: quantidade}) das reservas pendentes
+        self.pendentes: Dict[str, tuple] = {}
+        # Débitos deste processo em reservado ainda não gravados
+        self._nao_gravado: Dict[str, int] = {}
+        # Operações aguardando gravação e a thread que grava o lote atual
+        self._lote: List[_Operacao] = []
+        self._gravando = False
+        self._lote_gravado = Condition()
+        self._docs_estoque: Dict[str, int] = {}
+        self._ids_estoque = AlocadorIds(self.estoque)
+        self._ids_reservas = AlocadorIds(self.reservas)
+        self.carregar()
+
+        for tabela, callback in ((self.estoque, self._aplicar_estoque_externo),
+                                 (self.reservas, self._aplicar_reservas_externas)):
+            if hasattr(tabela.storage, 'observar'):
+                tabela.storage.observar(callback)
+        self.incorporar()
+
+    def carregar(self):
+        """Recalcula os contadores a partir do estoque e das reservas gravados"""
+        with self.lock:
+            self.quantidades = {}
+            self._docs_estoque = {}
+            maior_id = 0
+            for chave, item in self._tabela_bruta(self.estoque).items():
+                self.quantidades[item['tipo']] = item['quantidade']
+                self._docs_estoque[item['tipo']] = int(chave)
+                maior_id = max(maior_id, int(chave))
+            self._ids_estoque.reiniciar(maior_id)
+
+            # Os débitos ainda não gravados não estão no banco
+            self.reservado = {tipo: q for tipo, q in self._nao_gravado.items() if q}
+            self.pendentes = {}
+            maior_id = 0
+            for chave, reserva in self._tabela_bruta(self.reservas).items():
+                maior_id = max(maior_id, int(chave))
+                if self._ja_incorporada(reserva):
+                    continue
+                if reserva['estado'] in ESTADOS_ATIVOS:
+                    for tipo, quantidade in reserva['itens'].items():
+                        self.reservado[tipo] = self.reservado.get(tipo, 0) + quantidade
+                if reserva['estado'] == 'pendente':
+                    self.pendentes[reserva['pedido_id']] = (int(chave), reserva['itens'])
+            self._ids_reservas.reiniciar(maior_id)
+
+    def incorporar(self):
+        """
+        Desconta do estoque as reservas 'confirmada' de bancos antigos e
+        remove as já liquidadas; feito uma vez na abertura, em transação
+        """
+        with self._transacao():
+            vendas, remover = {}, {}
+            for chave, reserva in list(self._tabela_bruta(self.reservas).items()):
+                incorporada = self._ja_incorporada(reserva)
+                if reserva['estado'] == 'pendente' and not incorporada:
+                    continue
+                if reserva['estado'] == 'confirmada' and not incorporada:
+                    vendas[reserva['pedido_id']] = reserva['itens']
+                remover[int(chave)] = None
+                with self.lock:
+                    self.pendentes.pop(reserva['pedido_id'], None)
+            if not remover:
+                return
+            self._descontar(vendas)
+            self._gravar(self.reservas, remover)
+            self._sincronizar(self.reservas)
+
+    def disponivel(self, tipo: str) -> int:
+        """Esfihas de um tipo que ainda podem ser reservadas"""
+        return self.quantidades.get(tipo, 0) - self.reservado.get(tipo, 0)
+
+    def reservar(self, pedido_id: str, itens: list):
+        """
+        Reserva todos os itens do pedido ou nenhum
+        Lança EstoqueInsuficiente se algum tipo não tiver quantidade suficiente
+        """
+        quantidades = self._agrupar(itens)
+        with self.lock:
+            doc_id = self._ids_reservas.alocar()
+        operacao = _Operacao('reservar', pedido_id, quantidades, doc_id)
+        with self._travar_tipos(quantidades):
+            # Os contadores podem não ter visto uma reposição de outro
+            # processo: sem estoque aqui, a conferência fica para o lote
+            if all(quantidade <= self.disponivel(tipo) for tipo, quantidade in quantidades.items()):
+                self._debitar(operacao)
+        self._executar(operacao)
+
+    def confirmar(self, pedido_id: str) -> bool:
+        """
+        Converte a reserva pendente do pedido em venda: desconta as esfihas
+        do estoque e remove a reserva
+        Retorna False se não há reserva pendente (ex.: já liquidada)
+        """
+        return self._executar(_Operacao('confirmar', pedido_id))
+
+    def liberar(self, pedido_id: str) -> bool:
+        """
+        Devolve ao estoque as esfihas da reserva pendente do pedido
+        Retorna False se não há reserva pendente (ex.: já liquidada)
+        """
+        return self._executar(_Operacao('liberar', pedido_id))
+
+    def adicionar(self, tipo: str, quantidade: int, preco: float = PRECO_PADRAO):
+        """Soma esfihas ao estoque de um tipo (cria o tipo se não existir)"""
+        with self._transacao(), self._travar_tipos({tipo: quantidade}):
+            doc_id, item = self._item_estoque(tipo, preco)
+            item['quantidade'] += quantidade
+            self.quantidades[tipo] = item['quantidade']
+            self._gravar(self.estoque, {doc_id: item})
+
+    def atualizar_preco(self, tipo: str, preco: float):
+        """Altera o preço de um tipo (cria o tipo sem estoque se não existir)"""
+        with self._transacao(), self._travar_tipos({tipo: 0}):
+            doc_id, item = self._item_estoque(tipo, preco)
+            item['preco'] = preco
+            self._gravar(self.estoque, {doc_id: item})
+
+    def _item_estoque(self, tipo: str, preco: float) -> tuple:
+        """Cópia do documento de estoque de um tipo; deve ser chamado com o lock do tipo"""
+        with self.lock:
+            doc_id = self._docs_estoque.get(tipo)
+            if doc_id is None:
+                doc_id = self._docs_estoque[tipo] = self._ids_estoque.alocar()
+        item = self._tabela_bruta(self.estoque).get(str(doc_id))
+        return doc_id, dict(item or {'tipo': tipo, 'quantidade': 0, 'preco': preco})
+
+    def _executar(self, operacao: '_Operacao'):
+        """
+        Acrescenta a operação ao lote e espera que ela seja gravada
+        Se nenhuma thread está gravando, esta grava o lote inteiro
+        """
+        with self._lote_gravado:
+            self._lote.append(operacao)
+            while self._gravando and not operacao.concluida:
+                self._lote_gravado.wait()
+            lote = None
+            if not operacao.concluida:
+                lote, self._lote = self._lote, []
+                self._gravando = True
+
+        if lote is not None:
+            try:
+                self._gravar_lote(lote)
+            finally:
+                with self._lote_gravado:
+                    self._gravando = False
+                    self._lote_gravado.notify_all()
+        if operacao.erro is not None:
+            raise operacao.erro
+        return operacao.resultado
+
+    def _gravar_lote(self, lote: List['_Operacao']):
+        """Grava o lote em uma transação; se ela falhar, desfaz as reservas não gravadas"""
+        try:
+            with self._transacao():
+                self._aplicar_lote(lote)
+        except Exception as e:
+            for operacao in lote:
+                if not operacao.concluida:
+                    self._desfazer(operacao)
+                    operacao.erro = e
+        finally:
+            for operacao in lote:
+                operacao.concluida = True
+
+    def _aplicar_lote(self, lote: List['_Operacao']):
+        """
+        Confere as reservas do lote, desconta as vendas e grava as reservas
+        novas e as removidas; chamado em transação
+        """
+        reservas, vendas, liberacoes = [], {}, {}
+        aceitas: Dict[str, int] = {}
+        for operacao in lote:
+            if operacao.acao == 'reservar':
+                if self._conferir(operacao, aceitas):
+                    reservas.append(operacao)
+                else:
+                    operacao.concluida = True
+                continue
+            with self.lock:
+                pendente = self.pendentes.get(operacao.pedido_id)
+            repetida = operacao.pedido_id in vendas or operacao.pedido_id in liberacoes
+            if pendente is None or repetida:
+                operacao.resultado = False
+                operacao.concluida = True
+            else:
+                operacao.doc_id, operacao.quantidades = pendente
+                destino = vendas if operacao.acao == 'confirmar' else liberacoes
+                destino[operacao.pedido_id] = operacao
+
+        if vendas:
+            self._descontar({pedido_id: venda.quantidades for pedido_id, venda in vendas.items()})
+            for operacao in vendas.values():
+                self._concluir(operacao)
+
+        documentos = {op.doc_id: None for op in (*vendas.values(), *liberacoes.values())}
+        agora = datetime.now().isoformat()
+        for operacao in reservas:
+            documentos[operacao.doc_id] = {
+                'pedido_id': operacao.pedido_id,
+                'itens': operacao.quantidades,
+                'estado': 'pendente',
+                'data_reserva': agora
+            }
+        if not documentos:
+            return
+        try:
+            self._gravar(self.reservas, documentos)
+            # A próxima venda do tipo troca CAMPO_INCORPORADAS: a remoção das
+            # reservas vendidas precisa estar no disco antes
+            self._sincronizar(self.reservas, fsync=bool(vendas or liberacoes))
+        except Exception:
+            self._remover_reservas(reservas)
+            raise
+
+        for operacao in liberacoes.values():
+            with self._travar_tipos(operacao.quantidades):
+                for tipo, quantidade in operacao.quantidades.items():
+                    self.reservado[tipo] -= quantidade
+            self._concluir(operacao)
+        for operacao in reservas:
+            with self._travar_tipos(operacao.quantidades):
+                for tipo, quantidade in operacao.quantidades.items():
+                    self._nao_gravado[tipo] -= quantidade
+            with self.lock:
+                self.pendentes[operacao.pedido_id] = (operacao.doc_id, operacao.quantidades)
+            operacao.concluida = True
+
+    def _conferir(self, operacao: '_Operacao', aceitas: Dict[str, int]) -> bool:
+        """
+        Confere a reserva com o que todos os processos já gravaram e com as
+        reservas aceitas antes no mesmo lote; se não houver estoque, desfaz o
+        débito e guarda EstoqueInsuficiente na operação
+        """
+        quantidades = operacao.quantidades
+        with self._travar_tipos(quantidades):
+            for tipo, quantidade in quantidades.items():
+                # Sem os débitos deste processo ainda não gravados, menos os
+                # já aceitos no lote
+                disponivel = (self.disponivel(tipo) + self._nao_gravado.get(tipo, 0)
+                              - aceitas.get(tipo, 0))
+                if quantidade > disponivel:
+                    operacao.erro = EstoqueInsuficiente(tipo, quantidade, disponivel)
+                    self._devolver(operacao)
+                    return False
+            if not operacao.debitada:
+                self._debitar(operacao)
+            for tipo, quantidade in quantidades.items():
+                aceitas[tipo] = aceitas.get(tipo, 0) + quantidade
+        return True
+
+    def _debitar(self, operacao: '_Operacao'):
+        """Soma a reserva aos contadores; chamado com os locks dos tipos"""
+        for tipo, quantidade in operacao.quantidades.items():
+            self.reservado[tipo] = self.reservado.get(tipo, 0) + quantidade
+            self._nao_gravado[tipo] = self._nao_gravado.get(tipo, 0) + quantidade
+        operacao.debitada = True
+
+    def _desfazer(self, operacao: '_Operacao'):
+        """Devolve o débito de uma reserva que não foi gravada"""
+        if operacao.debitada:
+            with self._travar_tipos(operacao.quantidades):
+                self._devolver(operacao)
+
+    def _devolver(self, operacao: '_Operacao'):
+        """Tira a reserva dos contadores; chamado com os locks dos tipos"""
+        if not operacao.debitada:
+            return
+        for tipo, quantidade in operacao.quantidades.items():
+            self.reservado[tipo] -= quantidade
+            self._nao_gravado[tipo] -= quantidade
+        operacao.debitada = False
+
+    def _remover_reservas(self, reservas: List['_Operacao']):
+        """Remove da tabela em memória as reservas novas de uma gravação que falhou"""
+        if not reservas:
+            return
+        try:
+            self._gravar(self.reservas, {operacao.doc_id: None for operacao in reservas})
+        except Exception as e:
+            logger.error("Reservas não gravadas continuam na tabela em memória: %s", e)
+
+    def _concluir(self, operacao: '_Operacao'):
+        with self.lock:
+            self.pendentes.pop(operacao.pedido_id, None)
+        operacao.resultado = True
+        operacao.concluida = True
+
+    def _descontar(self, vendas: Dict[str, Dict[str, int]]):
+        """
+        Desconta do estoque as esfihas das reservas vendidas; chamado em transação
+        O estoque (com os pedidos em CAMPO_INCORPORADAS) vai para o disco
+        antes da remoção das reservas, feita pelo chamador: uma queda no meio
+        deixa as reservas, que a abertura reconhece como já descontadas, e
+        nunca remove uma reserva sem descontá-la
+        """
+        total: Dict[str, int] = {}
+        incorporadas: Dict[str, list] = {}
+        for pedido_id, quantidades in vendas.items():
+            for tipo, quantidade in quantidades.items():
+                total[tipo] = total.get(tipo, 0) + quantidade
+                incorporadas.setdefault(tipo, []).append(pedido_id)
+        if not total:
+            return
+
+        documentos = {}
+        with self._travar_tipos(total):
+            for tipo, quantidade in total.items():
+                doc_estoque, item = self._item_estoque(tipo, PRECO_PADRAO)
+                item['quantidade'] -= quantidade
+                item[CAMPO_INCORPORADAS] = incorporadas[tipo]
+                documentos[doc_estoque] = item
+        self._gravar(self.estoque, documentos)
+        self._sincronizar(self.estoque)
+        with self._travar_tipos(total):
+            for doc_estoque, item in documentos.items():
+                tipo = item['tipo']
+                self.quantidades[tipo] = item['quantidade']
+                self.reservado[tipo] = self.reservado.get(tipo, 0) - total[tipo]
+
+    def _ja_incorporada(self, reserva: dict) -> bool:
+        """Reserva ativa que já foi descontada do estoque (queda antes de ser removida)"""
+        if reserva['estado'] not in ESTADOS_ATIVOS or not reserva['itens']:
+            return False
+        tipo = next(iter(reserva['itens']))
+        doc_id = self._docs_estoque.get(tipo)
+        item = self._tabela_bruta(self.estoque).get(str(doc_id)) or {}
+        return reserva['pedido_id'] in item.get(CAMPO_INCORPORADAS, ())
+
+    @contextmanager
+    def _transacao(self):
+        """
+        Transação entre processos, na trava do banco de reservas
+        Aplica as reservas e depois o estoque gravados pelos outros
+        processos: uma venda desconta o estoque antes de remover a reserva,
+        então quem vê a remoção também vê o desconto
+        """
+        reservas, estoque = self.reservas.storage, self.estoque.storage
+        if not hasattr(reservas, 'transacao'):
+            yield
+            return
+        with reservas.transacao():
+            if hasattr(estoque, 'acompanhar'):
+                estoque.acompanhar()
+            yield
+            if hasattr(estoque, 'sincronizar'):
+                estoque.sincronizar(fsync=False)
+
+    def _aplicar_estoque_externo(self, tabela: Optional[str], alteracoes: list):
+        """Observador do storage: estoque alterado por outros processos"""
+        if tabela is None:
+            self.carregar()
+            return
+        if tabela != self.estoque.name:
+            return
+
+        for chave, anterior, novo in alteracoes:
+            if novo is None:
+                if anterior is not None:
+                    with self._travar_tipos({anterior['tipo']: 0}):
+                        self.quantidades.pop(anterior['tipo'], None)
+                continue
+            with self._travar_tipos({novo['tipo']: 0}):
+                self.quantidades[novo['tipo']] = novo['quantidade']
+            with self.lock:
+                self._docs_estoque[novo['tipo']] = int(chave)
+
+    def _aplicar_reservas_externas(self, tabela: Optional[str], alteracoes: list):
+        """Observador do storage: reservas criadas ou liquidadas por outros processos"""
+        if tabela is None:
+            self.carregar()
+            return
+        if tabela != self.reservas.name:
+            return
+
+        for chave, anterior, novo in alteracoes:
+            self._contabilizar(anterior, novo)
+            # Qualquer processo pode liquidar uma reserva pendente
+            with self.lock:
+                if novo is not None and novo['estado'] == 'pendente':
+                    self.pendentes[novo['pedido_id']] = (int(chave), novo['itens'])
+                elif (novo or anterior) is not None:
+                    self.pendentes.pop((novo or anterior)['pedido_id'], None)
+
+    def _contabilizar(self, anterior: Optional[dict], novo: Optional[dict]):
+        """Ajusta os contadores pela diferença entre duas versões de uma reserva"""
+        delta: Dict[str, int] = {}
+        for reserva, sinal in ((anterior, -1), (novo, 1)):
+            if reserva is not None and reserva['estado'] in ESTADOS_ATIVOS:
+                for tipo, quantidade in reserva['itens'].items():
+                    delta[tipo] = delta.get(tipo, 0) + sinal * quantidade
+
+        delta = {tipo: quantidade for tipo, quantidade in delta.items() if quantidade}
+        if not delta:
+            return
+        with self._travar_tipos(delta):
+            for tipo, quantidade in delta.items():
+                self.reservado[tipo] = self.reservado.get(tipo, 0) + quantidade
+
+    def _travar_tipos(self, quantidades: dict) -> '_LocksTipos':
+        with self.lock:
+            locks = [self._locks.setdefault(tipo, Lock()) for tipo in sorted(quantidades)]
+        return _LocksTipos(locks)
+
+    @staticmethod
+    def _agrupar(itens: list) -> Dict[str, int]:
+        """Soma as quantidades por tipo (um pedido pode repetir o mesmo tipo)"""
+        quantidades: Dict[str, int] = {}
+        for item in itens:
+            if not isinstance(item, dict):
+                raise ValueError(f"Item inválido no pedido: {item}")
+            tipo = item.get('tipo')
+            quantidade = item.get('quantidade', 1)
+            if not tipo or not isinstance(quantidade, int) or quantidade <= 0:
+                raise ValueError(f"Item inválido no pedido: {item}")
+            quantidades[tipo] = quantidades.get(tipo, 0) + quantidade
+        return quantidades
+
+    def _gravar(self, tabela, documentos: Dict[int, Optional[dict]]):
+        """Grava os documentos em uma única escrita; None remove o documento"""
+        documentos = {str(doc_id): doc for doc_id, doc in documentos.items()}
+        storage = tabela.storage
+        if hasattr(storage, 'gravar_documentos'):
+            storage.gravar_documentos(tabela.name, documentos)
+        else:
+            with self.lock:
+                tabelas = self._ler_tabelas(tabela)
+                docs = tabelas.setdefault(tabela.name, {})
+                for doc_id, doc in documentos.items():
+                    if doc is None:
+                        docs.pop(doc_id, None)
+                    else:
+                        docs[doc_id] = doc
+                storage.write(tabelas)
+        tabela.clear_cache()
+
+    @staticmethod
+    def _sincronizar(tabela, fsync: bool = True):
+        if hasattr(tabela.storage, 'sincronizar'):
+            tabela.storage.sincronizar(fsync=fsync)
+
+    def _tabela_bruta(self, tabela) -> dict:
+        return self._ler_tabelas(tabela).get(tabela.name, {})
+
+    @staticmethod
+    def _ler_tabelas(tabela) -> dict:
+        return tabela.storage.read() or {}
+
+
+class _LocksTipos:
+    """Adquire os locks de vários tipos em ordem e os libera na ordem inversa"""
+
+    def __init__(self, locks: List[Lock]):
+        self.locks = locks
+
+    def __enter__(self):
+        for lock in self.locks:
+            lock.acquire()
+        return self
+
+    def __exit__(self, *_):
+        for lock in reversed(self.locks):
+            lock.release()
+
+
+class _Operacao:
+    """Reserva, confirmação ou liberação aguardando a gravação do lote"""
+
+    __slots__ = ('acao', 'pedido_id', 'quantidades', 'doc_id', 'debitada', 'resultado', 'erro',
+                 'concluida')
+
+    def __init__(self, acao: str, pedido_id: str, quantidades: Optional[Dict[str, int]] = None,
+                 doc_id: Optional[int] = None):
+        self.acao = acao
+        self.pedido_id = pedido_id
+        self.quantidades = quantidades
+        self.doc_id = doc_id
+        # Reserva já somada a reservado e a _nao_gravado
+        self.debitada = False
+        self.resultado = None
+        self.erro = None
+        self.concluida = False
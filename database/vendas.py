@@ -0,0 +1,281 @@
+"""
+Agregados de vendas: quantidade e receita por tipo de esfiha e por hora
+Mantidos incrementalmente pelo assinante Agregar_Vendas do tópico
+Pagamento_Concluido e gravados em SQLite (data/vendas.db), fora da
+Tabela_Pedidos: cada pagamento soma seus itens com um único UPSERT, atômico
+entre processos, e os relatórios não disputam o banco de pedidos
+"""
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timedelta
+import sqlite3
+
+# Horas durante as quais um pedido contabilizado é lembrado para ignorar repetições
+JANELA_DEDUPLICACAO = 24
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS vendas (
+    hora INTEGER NOT NULL,
+    tipo TEXT NOT NULL,
+    quantidade INTEGER NOT NULL,
+    centavos INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (hora, tipo)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_vendas_seq ON vendas (seq);
+CREATE TABLE IF NOT EXISTS contabilizados (
+    pedido_id TEXT PRIMARY KEY,
+    hora INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_contabilizados_hora ON contabilizados (hora);
+CREATE TABLE IF NOT EXISTS meta (
+    chave TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+"""
+
+_UPSERT = """
+INSERT INTO vendas (hora, tipo, quantidade, centavos, seq) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (hora, tipo) DO UPDATE SET
+    quantidade = quantidade + excluded.quantidade,
+    centavos = centavos + excluded.centavos,
+    seq = excluded.seq
+"""
+
+
+def hora_do_momento(momento: str) -> int:
+    """Número da hora (horas desde 01/01/0001) de um momento ISO, sem fuso"""
+    data = datetime.fromisoformat(momento)
+    return data.toordinal() * 24 + data.hour
+
+
+def momento_da_hora(hora: int) -> str:
+    """Início da hora em ISO (ex.: '2026-10-18T09:00')"""
+    return (datetime.fromordinal(hora // 24) + timedelta(hours=hora % 24)).isoformat(timespec='minutes')
+
+
+def somar_itens(somas: Dict[tuple, list], hora: int, itens: list, precos: Dict[str, float],
+                preco_padrao: float):
+    """
+    Acumula em somas[(hora, tipo)] = [quantidade, centavos] os itens de um pedido
+    pelo preco_unitario cobrado; `precos` só vale para itens sem ele (pedidos
+    gravados antes de o preço ser guardado no item)
+    """
+    for item in itens:
+        tipo = item.get('tipo')
+        quantidade = item.get('quantidade', 1)
+        preco = item.get('preco_unitario')
+        if preco is None:
+            preco = precos.get(tipo, preco_padrao)
+        soma = somas.setdefault((hora, tipo), [0, 0])
+        soma[0] += quantidade
+        soma[1] += round(preco * 100) * quantidade
+
+
+class _Acumulado:
+    """
+    Somas acumuladas de um tipo, hora a hora a partir de `inicio`:
+    quantidade[i] e centavos[i] somam as vendas até a hora inicio + i
+    Um intervalo qualquer sai de duas posições; somar na hora mais recente
+    (o caso comum) custa O(1)
+    """
+
+    __slots__ = ('inicio', 'quantidade', 'centavos')
+
+    def __init__(self, hora: int):
+        self.inicio = hora
+        self.quantidade = [0]
+        self.centavos = [0]
+
+    def somar(self, hora: int, quantidade: int, centavos: int):
+        if hora < self.inicio:
+            falta = self.inicio - hora
+            self.quantidade[:0] = [0] * falta
+            self.centavos[:0] = [0] * falta
+            self.inicio = hora
+        falta = hora - (self.inicio + len(self.quantidade) - 1)
+        if falta > 0:
+            self.quantidade.extend([self.quantidade[-1]] * falta)
+            self.centavos.extend([self.centavos[-1]] * falta)
+        for i in range(hora - self.inicio, len(self.quantidade)):
+            self.quantidade[i] += quantidade
+            self.centavos[i] += centavos
+
+    def ate(self, hora: Optional[int]) -> Tuple[int, int]:
+        """Somas das horas <= hora (None = todas)"""
+        if hora is None or hora >= self.inicio + len(self.quantidade):
+            return self.quantidade[-1], self.centavos[-1]
+        if hora < self.inicio:
+            return 0, 0
+        return self.quantidade[hora - self.inicio], self.centavos[hora - self.inicio]
+
+    def entre(self, inicio: Optional[int], fim: Optional[int]) -> Tuple[int, int]:
+        """Somas das horas em [inicio, fim] (None = sem limite)"""
+        quantidade, centavos = self.ate(fim)
+        if inicio is not None:
+            antes = self.ate(inicio - 1)
+            quantidade, centavos = quantidade - antes[0], centavos - antes[1]
+        return quantidade, centavos
+
+
+class AgregadosVendas:
+    """
+    Vendas por (hora, tipo) em SQLite, com somas acumuladas em memória
+
+    Os pedidos contabilizados nas últimas JANELA_DEDUPLICACAO horas são
+    lembrados: um evento repetido, ou um pagamento que chega durante uma
+    reconstrução que já o incluiu, não é somado duas vezes.
+
+    Cada linha guarda o total de um tipo em uma hora e o `seq` da última
+    transação que a alterou. Antes de responder, o processo lê só as linhas
+    com seq maior que o último visto (PRAGMA data_version evita até essa
+    consulta quando nenhum outro processo gravou) e aplica a diferença às
+    somas acumuladas por tipo. Uma reconstrução troca a `geracao` e faz os
+    processos recarregarem tudo.
+    """
+
+    def __init__(self, caminho: str):
+        Path(caminho).parent.mkdir(parents=True, exist_ok=True)
+        self.caminho = caminho
+        self.lock = Lock()
+        self.conn = sqlite3.connect(caminho, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_ESQUEMA)
+        # Banco recém-criado: deve ser reconstruído a partir dos pedidos
+        self.novo = self.conn.execute(
+            "INSERT OR IGNORE INTO meta (chave, valor) VALUES ('geracao', 0)"
+        ).rowcount == 1
+
+        self._ultima_limpeza = 0
+        self._geracao = None
+        self._seq = 0
+        self._versao_dados = None
+        self._gravou = False
+        self._linhas: Dict[tuple, Tuple[int, int]] = {}
+        self._acumulados: Dict[str, _Acumulado] = {}
+
+    def registrar(self, pedido_id: str, hora: int, somas: Dict[tuple, list]) -> bool:
+        """
+        Soma as vendas {(hora, tipo): [quantidade, centavos]} de um pedido em uma transação
+        Retorna False se o pedido já foi contabilizado
+        """
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                if self.conn.execute('INSERT OR IGNORE INTO contabilizados (pedido_id, hora) VALUES (?, ?)',
+                                     (pedido_id, hora)).rowcount == 0:
+                    self.conn.execute('ROLLBACK')
+                    return False
+                if hora > self._ultima_limpeza:
+                    self.conn.execute('DELETE FROM contabilizados WHERE hora < ?', (hora - JANELA_DEDUPLICACAO,))
+                    self._ultima_limpeza = hora
+                seq = self._proximo_seq()
+                self.conn.executemany(_UPSERT, [(hora, tipo, quantidade, centavos, seq)
+                                                for (hora, tipo), (quantidade, centavos) in somas.items()])
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+            self._gravou = True
+            return True
+
+    def reconstruir(self, calcular: Callable[[], Tuple[Dict[tuple, list], Dict[str, int]]]):
+        """
+        Substitui todos os agregados pelos que calcular() retorna (ex.: a partir
+        da Tabela_Pedidos): (somas, {pedido_id: hora} dos pedidos incluídos)
+        calcular() roda dentro da transação: pagamentos registrados por outros
+        processos esperam por ela, então nenhum se perde nem é somado duas vezes
+        """
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                somas, contabilizados = calcular()
+                seq = self._proximo_seq()
+                self.conn.execute('DELETE FROM vendas')
+                self.conn.execute('DELETE FROM contabilizados')
+                recentes = max(contabilizados.values(), default=0) - JANELA_DEDUPLICACAO
+                self.conn.executemany('INSERT INTO contabilizados (pedido_id, hora) VALUES (?, ?)',
+                                      [item for item in contabilizados.items() if item[1] >= recentes])
+                self.conn.executemany(_UPSERT, [(hora, tipo, quantidade, centavos, seq)
+                                                for (hora, tipo), (quantidade, centavos) in somas.items()])
+                self.conn.execute("UPDATE meta SET valor = valor + 1 WHERE chave = 'geracao'")
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+            self.novo = False
+            self._gravou = True
+
+    def consultar(self, inicio: Optional[int] = None, fim: Optional[int] = None) -> Dict[str, Tuple[int, int]]:
+        """(quantidade, centavos) por tipo nas horas [inicio, fim] (None = sem limite)"""
+        with self.lock:
+            self._sincronizar()
+            resultado = {}
+            for tipo, acumulado in self._acumulados.items():
+                quantidade, centavos = acumulado.entre(inicio, fim)
+                if quantidade or centavos:
+                    resultado[tipo] = (quantidade, centavos)
+            return resultado
+
+    def consultar_por_hora(self, inicio: int, fim: int) -> List[Tuple[int, Dict[str, Tuple[int, int]]]]:
+        """Série hora a hora de [inicio, fim]: [(hora, {tipo: (quantidade, centavos)})]"""
+        with self.lock:
+            self._sincronizar()
+            serie = []
+            for hora in range(inicio, fim + 1):
+                por_tipo = {}
+                for tipo, acumulado in self._acumulados.items():
+                    quantidade, centavos = acumulado.entre(hora, hora)
+                    if quantidade or centavos:
+                        por_tipo[tipo] = (quantidade, centavos)
+                serie.append((hora, por_tipo))
+            return serie
+
+    def fechar(self):
+        self.conn.close()
+
+    def _proximo_seq(self) -> int:
+        return self.conn.execute('SELECT COALESCE(MAX(seq), 0) + 1 FROM vendas').fetchone()[0]
+
+    def _sincronizar(self):
+        """Aplica às somas em memória as linhas alteradas desde a última leitura (com o lock)"""
+        versao = self.conn.execute('PRAGMA data_version').fetchone()[0]
+        if versao == self._versao_dados and not self._gravou:
+            return
+        self._versao_dados = versao
+        self._gravou = False
+
+        geracao = self.conn.execute("SELECT valor FROM meta WHERE chave = 'geracao'").fetchone()[0]
+        if geracao != self._geracao:
+            self._geracao, self._seq = geracao, 0
+            self._linhas, self._acumulados = {}, {}
+
+        linhas = self.conn.execute(
+            'SELECT hora, tipo, quantidade, centavos, seq FROM vendas WHERE seq > ? ORDER BY seq', (self._seq,)
+        ).fetchall()
+        for hora, tipo, quantidade, centavos, seq in linhas:
+            anterior = self._linhas.get((hora, tipo), (0, 0))
+            self._linhas[(hora, tipo)] = (quantidade, centavos)
+            acumulado = self._acumulados.get(tipo)
+            if acumulado is None:
+                acumulado = self._acumulados[tipo] = _Acumulado(hora)
+            acumulado.somar(hora, quantidade - anterior[0], centavos - anterior[1])
+            self._seq = max(self._seq, seq)
+
+
+def agregar_pedidos(pedidos: Iterable[dict], precos: Dict[str, float],
+                    preco_padrao: float) -> Tuple[Dict[tuple, list], Dict[str, int]]:
+    """
+    Somas por (hora, tipo) de pedidos pagos, pela data_pagamento de cada um
+    Retorna (somas, {pedido_id: hora}) para AgregadosVendas.reconstruir
+    """
+    somas, contabilizados = {}, {}
+    for pedido in pedidos:
+        momento = pedido.get('data_pagamento') or pedido.get('data_criacao')
+        if momento:
+            hora = hora_do_momento(momento)
+            somar_itens(somas, hora, pedido.get('itens', []), precos, preco_padrao)
+            contabilizados[pedido.get('pedido_id')] = hora
+    return somas, contabilizados
@@ -0,0 +1,548 @@
+"""
+Storage do TinyDB baseado em write-ahead log (append-only)
+Substitui CachingMiddleware(JSONStorage) para que cada escrita custe o
+tamanho da alteração, e não o tamanho do banco inteiro
+"""
+from contextlib import contextmanager
+from threading import Condition, Event, Lock, RLock, Thread
+from pathlib import Path
+from tinydb.storages import Storage
+import atexit
+import json
+import logging
+import os
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem travas entre processos (uso em um único processo)
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def _travar(arquivo, exclusiva: bool = True, bloquear: bool = True) -> bool:
+    if fcntl is None:
+        return True
+    modo = fcntl.LOCK_EX if exclusiva else fcntl.LOCK_SH
+    if not bloquear:
+        modo |= fcntl.LOCK_NB
+    try:
+        fcntl.flock(arquivo.fileno(), modo)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def _destravar(arquivo):
+    if fcntl is not None:
+        fcntl.flock(arquivo.fileno(), fcntl.LOCK_UN)
+
+
+class WALStorage(Storage):
+    """
+    Mantém o banco em memória e registra cada alteração em um log:
+
+    - `<arquivo>`: snapshot no mesmo formato do JSONStorage
+    - `<arquivo>.wal.<n>`: segmentos do log, um registro JSON por linha
+
+    Os registros são acumulados e gravados com um único fsync a cada
+    `janela_commit` segundos (group commit). Com janela 0 cada escrita é
+    sincronizada antes de retornar. Quando o log passa do tamanho do
+    snapshot, os segmentos fechados são fundidos em um novo snapshot a
+    partir dos arquivos, sem bloquear as escritas.
+
+    Vários processos (API e workers) podem abrir o mesmo arquivo: todos
+    escrevem no último segmento sob flock, e uma thread de fundo acompanha
+    o log a cada `intervalo_acompanhamento` segundos, aplicando os
+    registros dos outros processos e avisando os observadores.
+
+    Todos os registros gravam o estado absoluto do documento (None para um
+    documento removido), então reaplicar um segmento já incorporado ao
+    snapshot é inofensivo.
+
+    read() devolve as tabelas em uso (_Tabela), que o TinyDB lê sem lock.
+    O storage é o único que as altera: cada escrita ou lote de registros de
+    outros processos muda só os documentos envolvidos, no próprio
+    dicionário e sob _lock_dados, então o custo não depende do tamanho da
+    tabela. Quem percorre uma tabela percorre uma cópia tirada sob o mesmo
+    lock, que nunca mostra um lote pela metade (a cópia custa o mesmo que a
+    iteração que a pede).
+    """
+
+    def __init__(self, path: str, janela_commit: float = 0.05,
+                 limite_compactacao: int = 4 * 1024 * 1024,
+                 intervalo_acompanhamento: float = 0.05):
+        super().__init__()
+        self.caminho = Path(path)
+        self.janela_commit = janela_commit
+        self.limite_compactacao = limite_compactacao
+        self.intervalo_acompanhamento = intervalo_acompanhamento
+        # Identifica os registros deste processo no log compartilhado
+        self.id = uuid.uuid4().hex
+
+        self.lock = Lock()
+        self._lock_arquivo = RLock()
+        self._lock_leitura = Lock()
+        # Serializa as alterações das tabelas com as cópias para iteração
+        self._lock_dados = RLock()
+        # Lotes já aplicados em _dados cujos observadores ainda não terminaram
+        self._notificando = 0
+        self._notificados = Condition()
+        self._lock_compactacao = Lock()
+        self._lock_ids = Lock()
+        self._lock_transacao = RLock()
+        self._pendentes = []
+        # Registros já escritos no segmento atual, mas ainda sem fsync
+        self._sem_fsync = False
+        self._observadores = []
+        self._acordar = Event()
+        self._fechado = False
+
+        self.caminho.parent.mkdir(parents=True, exist_ok=True)
+        # Trava compartilhada na carga, exclusiva na compactação
+        self._trava = open(self._caminho_auxiliar('lock'), 'a+b')
+        # Trava exclusiva das transações (transacao())
+        self._trava_transacao = open(self._caminho_auxiliar('tx'), 'a+b')
+        self._arquivo = None
+        self._leitura = None
+        self._resto = b''
+        self._segmento = None
+        self._carregar()
+
+        self._thread = Thread(target=self._executar, name=f"wal-{self.caminho.name}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def read(self):
+        return self._dados
+
+    def write(self, data):
+        """Escrita genérica do TinyDB: registra o banco inteiro"""
+        with self._lock_dados:
+            self._dados = {tabela: self._nova_tabela(documentos) for tabela, documentos in data.items()}
+        self._registrar({'op': 'full', 'd': data})
+
+    def gravar_documentos(self, tabela: str, documentos: dict):
+        """
+        Registra apenas os documentos alterados de uma tabela (None remove o documento)
+        Os documentos passam a ser os da tabela: o chamador não deve alterá-los depois
+        """
+        with self._lock_dados:
+            if tabela in self._dados:
+                _aplicar_documentos(self._dados, tabela, documentos)
+            else:
+                # Tabela nova: troca o dicionário das tabelas (são poucas)
+                dados = dict(self._dados)
+                _aplicar_documentos(dados, tabela, documentos, self._nova_tabela)
+                self._dados = dados
+        self._registrar({'op': 'docs', 't': tabela, 'd': documentos})
+
+    @contextmanager
+    def transacao(self):
+        """
+        Exclusão mútua entre threads e processos para ler, conferir e gravar
+        Na entrada aplica os registros que os outros processos já gravaram
+        (e avisa os observadores); na saída escreve os registros pendentes
+        no log, onde o próximo processo a entrar os encontra. O fsync fica
+        para quem precisa da escrita durável (sincronizar())
+        """
+        with self._lock_transacao:
+            _travar(self._trava_transacao)
+            try:
+                self.acompanhar()
+                # Inclusive os lotes lidos há pouco pela thread de fundo
+                self._aguardar_observadores()
+                yield self
+                self.sincronizar(fsync=False)
+            finally:
+                _destravar(self._trava_transacao)
+
+    def observar(self, callback):
+        """
+        Registra callback(tabela, alteracoes) chamado quando registros de
+        outros processos são aplicados. alteracoes é uma lista de
+        (doc_id, documento_anterior, documento_novo); tabela None indica
+        que o banco inteiro foi substituído
+        """
+        self._observadores.append(callback)
+
+    def reservar_ids(self, tabela: str, quantidade: int, minimo: int = 1) -> int:
+        """
+        Reserva um bloco de doc_ids únicos entre processos
+        Retorna o primeiro id do bloco [inicio, inicio + quantidade)
+        """
+        with self._lock_ids, open(self._caminho_auxiliar('ids'), 'a+b') as f:
+            _travar(f)
+            try:
+                f.seek(0)
+                conteudo = f.read()
+                contadores = json.loads(conteudo) if conteudo.strip() else {}
+                inicio = max(contadores.get(tabela, 1), minimo)
+                contadores[tabela] = inicio + quantidade
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(contadores).encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                _destravar(f)
+        return inicio
+
+    def sincronizar(self, fsync: bool = True):
+        """Grava os registros pendentes no log e faz fsync (fsync=False: só escreve)"""
+        with self._lock_arquivo:
+            with self.lock:
+                linhas, self._pendentes = self._pendentes, []
+            if not linhas:
+                if fsync and self._sem_fsync:
+                    os.fsync(self._arquivo.fileno())
+                    self._sem_fsync = False
+                return
+
+            conteudo = ''.join(linhas).encode('utf-8')
+            while True:
+                if self._arquivo is None:
+                    self._arquivo = open(self._caminho_segmento(self._segmento), 'a+b')
+                _travar(self._arquivo)
+                try:
+                    if (self._caminho_segmento(self._segmento + 1).exists()
+                            or not self._caminho_segmento(self._segmento).exists()):
+                        # Outro processo rotacionou o log: passa para o último segmento
+                        if self._sem_fsync:
+                            os.fsync(self._arquivo.fileno())
+                            self._sem_fsync = False
+                        self._arquivo.close()
+                        self._arquivo = None
+                        self._segmento = self._listar_segmentos()[-1][0]
+                        continue
+
+                    descritor = self._arquivo.fileno()
+                    tamanho = os.fstat(descritor).st_size
+                    # Isola uma linha truncada deixada por um processo que caiu
+                    if tamanho and hasattr(os, 'pread') and os.pread(descritor, 1, tamanho - 1) != b'\n':
+                        self._arquivo.write(b'\n')
+                    self._arquivo.write(conteudo)
+                    self._arquivo.flush()
+                    if fsync:
+                        os.fsync(descritor)
+                    self._sem_fsync = not fsync
+                    break
+                finally:
+                    if self._arquivo is not None:
+                        _destravar(self._arquivo)
+
+            self._tamanho_log += len(conteudo)
+
+    def compactar(self):
+        """Funde os segmentos fechados do log em um novo snapshot"""
+        with self._lock_compactacao:
+            # Só um processo compacta por vez; os demais tentam depois
+            if not _travar(self._trava, bloquear=False):
+                return
+            try:
+                with self._lock_arquivo:
+                    self.sincronizar()
+                    ultimo = self._listar_segmentos()[-1][0]
+                    # Cria o próximo segmento sob a trava do atual: depois disso
+                    # nenhum processo escreve mais nos segmentos <= ultimo
+                    with open(self._caminho_segmento(ultimo), 'ab') as f:
+                        _travar(f)
+                        try:
+                            self._caminho_segmento(ultimo + 1).touch()
+                        finally:
+                            _destravar(f)
+                    self._tamanho_log = 0
+
+                dados = self._carregar_snapshot()
+                segmentos = [(n, s) for n, s in self._listar_segmentos() if n <= ultimo]
+                for _, segmento in segmentos:
+                    self._aplicar_linhas(dados, segmento.read_bytes(), str(segmento))
+
+                conteudo = json.dumps(dados).encode('utf-8')
+                temporario = self._caminho_auxiliar('tmp')
+                with open(temporario, 'wb') as f:
+                    f.write(conteudo)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temporario, self.caminho)
+
+                for _, segmento in segmentos:
+                    try:
+                        segmento.unlink()
+                    except OSError as e:
+                        logger.warning("Não foi possível remover %s: %s", segmento, e)
+
+                self._tamanho_snapshot = len(conteudo)
+                logger.info("WAL compactado: %s (%d segmentos)", self.caminho, len(segmentos))
+            finally:
+                _destravar(self._trava)
+
+    def close(self):
+        if self._fechado:
+            return
+        self._fechado = True
+        self._acordar.set()
+        self._thread.join()
+        self.sincronizar()
+        for arquivo in (self._arquivo, self._leitura, self._trava, self._trava_transacao):
+            if arquivo is not None:
+                arquivo.close()
+
+    def _carregar(self):
+        """Carrega o snapshot e reaplica todos os segmentos do log"""
+        _travar(self._trava, exclusiva=False)
+        try:
+            dados = self._carregar_snapshot()
+            self._tamanho_snapshot = self.caminho.stat().st_size if self.caminho.exists() else 0
+
+            segmentos = self._listar_segmentos()
+            if not segmentos:
+                self._caminho_segmento(1).touch()
+                segmentos = self._listar_segmentos()
+
+            for _, segmento in segmentos[:-1]:
+                self._aplicar_linhas(dados, segmento.read_bytes(), str(segmento))
+
+            # O último segmento continua sendo lido pelo acompanhamento
+            self._segmento_leitura, ultimo = segmentos[-1]
+            if self._segmento is None:
+                self._segmento = self._segmento_leitura
+            if self._leitura is not None:
+                self._leitura.close()
+            self._leitura = open(ultimo, 'rb')
+            self._resto = b''
+            with self._lock_dados:
+                self._dados = {tabela: self._nova_tabela(documentos) for tabela, documentos in dados.items()}
+            # Na carga os registros deste processo também precisam ser aplicados
+            self._consumir(self._leitura.read(), ignorar_proprios=False)
+            self._tamanho_log = sum(s.stat().st_size for _, s in segmentos)
+        finally:
+            _destravar(self._trava)
+
+    def acompanhar(self):
+        """
+        Aplica os registros que outros processos acrescentaram ao log e
+        avisa os observadores (fora do lock de leitura: um observador pode
+        precisar de um lock que outra thread segura enquanto chama acompanhar())
+        """
+        alteracoes = {}
+        with self._lock_leitura:
+            while True:
+                proximo = self._caminho_segmento(self._segmento_leitura + 1)
+                existe_proximo = proximo.exists()
+                self._mesclar(alteracoes, self._consumir(self._leitura.read()))
+                if not existe_proximo:
+                    break
+
+                # Segmento atual encerrado por uma rotação: segue para o próximo
+                if self._resto:
+                    logger.warning("Registro incompleto ignorado em %s", self._leitura.name)
+                    self._resto = b''
+                try:
+                    proximo_arquivo = open(proximo, 'rb')
+                except FileNotFoundError:
+                    # Ficou para trás de mais de uma compactação: recarrega tudo
+                    logger.warning("WAL de %s recarregado a partir do snapshot", self.caminho)
+                    self._carregar()
+                    alteracoes = None
+                    break
+                self._leitura.close()
+                self._leitura = proximo_arquivo
+                self._segmento_leitura += 1
+
+            if alteracoes == {}:
+                return
+            with self._notificados:
+                self._notificando += 1
+
+        try:
+            if alteracoes is None:
+                for callback in self._observadores:
+                    callback(None, None)
+                return
+            for tabela, documentos in alteracoes.items():
+                for callback in self._observadores:
+                    callback(tabela, documentos)
+        finally:
+            with self._notificados:
+                self._notificando -= 1
+                self._notificados.notify_all()
+
+    def _aguardar_observadores(self):
+        """Espera os observadores de todos os lotes já aplicados em _dados"""
+        with self._notificados:
+            self._notificados.wait_for(lambda: self._notificando == 0)
+
+    def _consumir(self, novos: bytes, ignorar_proprios: bool = True) -> dict:
+        """Aplica as linhas completas lidas do log; guarda o trecho parcial"""
+        dados = self._resto + novos
+        fim = dados.rfind(b'\n')
+        if fim < 0:
+            self._resto = dados
+            return {}
+        self._resto = dados[fim + 1:]
+        with self._lock_dados:
+            # As tabelas existentes são alteradas no lugar; o dicionário das
+            # tabelas é copiado (são poucas) para receber tabelas novas
+            novos_dados = dict(self._dados)
+            alteracoes = self._aplicar_linhas(
+                novos_dados, dados[:fim + 1], self._leitura.name,
+                ignorar=self.id if ignorar_proprios else None, criar=self._nova_tabela
+            )
+            self._dados = novos_dados
+        return alteracoes
+
+    def _nova_tabela(self, documentos=()) -> '_Tabela':
+        return _Tabela(documentos, lock=self._lock_dados)
+
+    @staticmethod
+    def _mesclar(alteracoes: dict, novas: dict):
+        for tabela, documentos in novas.items():
+            alteracoes.setdefault(tabela, []).extend(documentos)
+
+    def _registrar(self, registro: dict):
+        registro['p'] = self.id
+        linha = json.dumps(registro) + '\n'
+        with self.lock:
+            primeiro = not self._pendentes
+            self._pendentes.append(linha)
+
+        if self.janela_commit <= 0:
+            self.sincronizar()
+            if self._precisa_compactar():
+                self._acordar.set()
+        elif primeiro:
+            self._acordar.set()
+
+    def _executar(self):
+        """Thread de fundo: group commit, compactação e acompanhamento do log"""
+        while not self._fechado:
+            acordado = self._acordar.wait(self.intervalo_acompanhamento)
+            if self._fechado:
+                break
+
+            try:
+                if acordado:
+                    self._acordar.clear()
+                    if self.janela_commit > 0:
+                        # Aguarda a janela para juntar mais escritas no mesmo fsync
+                        time.sleep(self.janela_commit)
+                        self.sincronizar()
+                    if self._precisa_compactar():
+                        self.compactar()
+                self.acompanhar()
+            except Exception as e:
+                logger.error("Erro no WAL de %s: %s", self.caminho, e)
+
+    def _precisa_compactar(self) -> bool:
+        return self._tamanho_log >= max(self.limite_compactacao, self._tamanho_snapshot)
+
+    def _caminho_segmento(self, numero: int) -> Path:
+        return self.caminho.with_name(f"{self.caminho.name}.wal.{numero:06d}")
+
+    def _caminho_auxiliar(self, sufixo: str) -> Path:
+        return self.caminho.with_name(f"{self.caminho.name}.{sufixo}")
+
+    def _listar_segmentos(self) -> list:
+        prefixo = self.caminho.name + '.wal.'
+        segmentos = []
+        for arquivo in self.caminho.parent.glob(prefixo + '*'):
+            sufixo = arquivo.name[len(prefixo):]
+            if sufixo.isdigit():
+                segmentos.append((int(sufixo), arquivo))
+        return sorted(segmentos)
+
+    def _carregar_snapshot(self) -> dict:
+        if not self.caminho.exists():
+            return {}
+        with open(self.caminho, 'r', encoding='utf-8') as f:
+            conteudo = f.read()
+        return json.loads(conteudo) if conteudo.strip() else {}
+
+    @staticmethod
+    def _aplicar_linhas(dados: dict, conteudo: bytes, origem: str, ignorar: str = None,
+                        criar=dict) -> dict:
+        """
+        Aplica registros do log em dados
+        criar(documentos): monta as tabelas novas (registros 'full' e tabelas
+        que ainda não existem)
+        Retorna {tabela: [(doc_id, anterior, novo), ...]} com o que mudou
+        """
+        alteracoes = {}
+        for linha in conteudo.splitlines():
+            if not linha.strip():
+                continue
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError:
+                # Linha truncada por uma queda no meio da escrita
+                logger.warning("Registro incompleto ignorado em %s", origem)
+                continue
+
+            if ignorar is not None and registro.get('p') == ignorar:
+                continue
+
+            if registro['op'] == 'full':
+                for tabela, documentos in dados.items():
+                    alteracoes.setdefault(tabela, []).extend(
+                        (doc_id, doc, None) for doc_id, doc in documentos.items()
+                    )
+                dados.clear()
+                dados.update((tabela, criar(documentos)) for tabela, documentos in registro['d'].items())
+                for tabela, documentos in dados.items():
+                    alteracoes.setdefault(tabela, []).extend(
+                        (doc_id, None, doc) for doc_id, doc in documentos.items()
+                    )
+            elif registro['op'] == 'docs':
+                tabela = dados.get(registro['t'], {})
+                lista = alteracoes.setdefault(registro['t'], [])
+                for doc_id, doc in registro['d'].items():
+                    lista.append((doc_id, tabela.get(doc_id), doc))
+                _aplicar_documentos(dados, registro['t'], registro['d'], criar)
+        return alteracoes
+
+
+def _aplicar_documentos(dados: dict, tabela: str, documentos: dict, criar=dict):
+    """Grava os documentos na tabela (criada com criar() se não existe); None remove o documento"""
+    atual = dados.get(tabela)
+    if atual is None:
+        atual = dados[tabela] = criar()
+    for doc_id, doc in documentos.items():
+        if doc is None:
+            atual.pop(doc_id, None)
+        else:
+            atual[doc_id] = doc
+
+
+class _Tabela(dict):
+    """
+    Tabela do WALStorage: o próprio dicionário para consultas por doc_id, e
+    uma cópia, tirada sob o lock das escritas, para quem a percorre
+    """
+
+    __slots__ = ('_lock',)
+
+    def __init__(self, documentos=(), lock=None):
+        super().__init__(documentos)
+        self._lock = lock
+
+    def _copia(self) -> dict:
+        with self._lock:
+            return dict(dict.items(self))
+
+    def __iter__(self):
+        return iter(self._copia())
+
+    def keys(self):
+        return self._copia().keys()
+
+    def values(self):
+        return self._copia().values()
+
+    def items(self):
+        return self._copia().items()
+
+    def copy(self) -> dict:
+        return self._copia()
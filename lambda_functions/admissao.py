@@ -0,0 +1,129 @@
+"""
+Controle de admissão de pedidos
+Com a Fila_Pagamentos muito atrasada, aceitar mais pedidos só aumenta a
+espera de todos; o controle recusa parte deles (429 com Retry-After) para
+manter a latência limitada, e limita cada cliente a uma taxa de pedidos
+"""
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, Tuple
+from monitoramento.metricas import contador
+import math
+import random
+import time
+
+_rejeicoes = contador(
+    'esfiharia_admissao_rejeicoes_total', 'Pedidos recusados pelo controle de admissão', ('motivo',)
+)
+
+
+class LimitadorClientes:
+    """
+    Token bucket por cliente: `rajada` pedidos seguidos e depois `taxa`
+    pedidos por segundo
+
+    Os baldes não são reabastecidos por nenhuma thread: cada acesso soma os
+    tokens do tempo decorrido. Só os `capacidade` clientes usados mais
+    recentemente são lembrados; um cliente descartado volta com o balde cheio,
+    o mesmo estado de quem ficou parado tempo suficiente.
+    """
+
+    def __init__(self, taxa: float, rajada: float, capacidade: int):
+        self.taxa = taxa
+        self.rajada = rajada
+        self.capacidade = capacidade
+        self.lock = Lock()
+        # cliente -> (tokens, atualizado em)
+        self.baldes: 'OrderedDict[str, tuple]' = OrderedDict()
+
+    def consumir(self, cliente: str) -> float:
+        """Gasta um token do cliente; retorna 0 ou, sem token, quantos segundos faltam para o próximo"""
+        agora = time.monotonic()
+        with self.lock:
+            balde = self.baldes.get(cliente)
+            if balde is None:
+                tokens = self.rajada
+            else:
+                tokens, atualizado_em = balde
+                tokens = min(self.rajada, tokens + (agora - atualizado_em) * self.taxa)
+                self.baldes.move_to_end(cliente)
+            if tokens >= 1:
+                self.baldes[cliente] = (tokens - 1, agora)
+                espera = 0.0
+            else:
+                self.baldes[cliente] = (tokens, agora)
+                espera = (1 - tokens) / self.taxa
+            while len(self.baldes) > self.capacidade:
+                self.baldes.popitem(last=False)
+        return espera
+
+
+class ControleAdmissao:
+    """
+    Admissão pela profundidade da fila e pela taxa de cada cliente
+
+    A profundidade (get_queue_size) é lida no máximo uma vez a cada
+    `intervalo` segundos. Até `limite_alerta` mensagens tudo é aceito; entre
+    `limite_alerta` e `limite_maximo` a fração recusada cresce linearmente
+    de 0 a 1, o que freia a chegada aos poucos em vez de alternar entre
+    aceitar tudo e recusar tudo; a partir de `limite_maximo` tudo é recusado.
+    Pedidos recusados pela fila não gastam tokens do cliente.
+
+    limite_maximo = 0 desliga o controle pela fila; limitador None, o por cliente.
+    """
+
+    def __init__(self, nome_fila: str, limite_alerta: int, limite_maximo: int, retry_after: int,
+                 limitador: LimitadorClientes = None, intervalo: float = 0.25):
+        self.nome_fila = nome_fila
+        self.limite_alerta = min(limite_alerta, limite_maximo)
+        self.limite_maximo = limite_maximo
+        self.retry_after = retry_after
+        self.limitador = limitador
+        self.intervalo = intervalo
+        self.lock = Lock()
+        self._profundidade = 0
+        self._medida_em = float('-inf')
+
+    def profundidade(self) -> int:
+        """Mensagens aguardando na fila, lidas no máximo uma vez por intervalo"""
+        agora = time.monotonic()
+        if agora - self._medida_em >= self.intervalo and self.lock.acquire(blocking=False):
+            # Só uma thread consulta a fila; as outras usam a última medida
+            try:
+                from messaging.sqs import get_queue
+                self._profundidade = get_queue(self.nome_fila).get_queue_size()
+                self._medida_em = agora
+            finally:
+                self.lock.release()
+        return self._profundidade
+
+    def admitir(self, cliente: Optional[str] = None) -> Optional[Tuple[str, int]]:
+        """
+        Retorna None se o pedido pode seguir, ou (motivo, Retry-After em segundos)
+        cliente None dispensa o limite por cliente (ex.: importação em lote)
+        """
+        if self.limite_maximo > 0:
+            profundidade = self.profundidade()
+            if profundidade > self.limite_alerta and (
+                    profundidade >= self.limite_maximo
+                    or random.random() < (profundidade - self.limite_alerta)
+                    / (self.limite_maximo - self.limite_alerta)):
+                _rejeicoes.inc(motivo='fila')
+                # Jitter: os clientes recusados juntos não voltam todos juntos
+                return 'fila', random.randint(self.retry_after, 2 * self.retry_after)
+
+        if self.limitador is not None and cliente is not None:
+            espera = self.limitador.consumir(cliente)
+            if espera > 0:
+                _rejeicoes.inc(motivo='cliente')
+                return 'cliente', math.ceil(espera)
+        return None
+
+
+def chave_cliente(cliente) -> Optional[str]:
+    """Identifica o cliente do pedido pelo email ou, sem email, pelo nome"""
+    if isinstance(cliente, dict):
+        cliente = cliente.get('email') or cliente.get('nome')
+    if not isinstance(cliente, str) or not cliente.strip():
+        return None
+    return cliente.strip().lower()
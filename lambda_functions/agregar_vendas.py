@@ -0,0 +1,41 @@
+"""
+Lambda Function: Agregar_Vendas
+Assinante do tópico Pagamento_Concluido: soma cada pedido pago aos
+agregados de vendas por tipo de esfiha e por hora (GET /relatorios/vendas)
+"""
+import logging
+from database.db import get_pedido, registrar_venda
+from monitoramento.metricas import medir_handler
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+@medir_handler('Agregar_Vendas')
+def agregar_vendas_handler(event: dict, context: dict) -> dict:
+    """Handler da função Lambda Agregar_Vendas"""
+    pedido_id = event.get('pedido_id')
+    try:
+        itens = event.get('itens')
+        if itens is None:
+            # Evento sem os itens (publicado por uma versão anterior): busca o pedido
+            pedido = get_pedido(pedido_id) if pedido_id else None
+            itens = pedido.get('itens', []) if pedido else []
+        if not registrar_venda(pedido_id, event.get('timestamp') or datetime.now().isoformat(), itens):
+            logger.info("Venda do pedido %s já contabilizada; evento repetido ignorado", pedido_id)
+        return {
+            'statusCode': 200,
+            'body': {
+                'pedido_id': pedido_id
+            }
+        }
+
+    except Exception as e:
+        # A venda fica fora dos agregados até a próxima reconstrução
+        logger.error("Erro ao agregar venda do pedido %s: %s", pedido_id, e)
+        return {
+            'statusCode': 500,
+            'body': {
+                'erro': f'Erro ao agregar venda: {str(e)}'
+            }
+        }
@@ -0,0 +1,353 @@
+"""
+Cliente HTTP do gateway de pagamentos
+Reaproveita conexões (keep-alive), limita cada cobrança a um prazo total,
+repete falhas temporárias com backoff e jitter, envia uma requisição de
+reforço (hedge) quando a primeira demora e, com um disjuntor (circuit
+breaker), falha na hora enquanto o gateway está degradado, em vez de
+prender os consumidores da Fila_Pagamentos esperando por ele
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as TempoEsgotado
+from threading import BoundedSemaphore, Lock
+from typing import Optional
+from requests.adapters import HTTPAdapter
+from monitoramento.metricas import contador, medidor
+import logging
+import os
+import random
+import requests
+import time
+
+logger = logging.getLogger(__name__)
+
+# URL do gateway (vazio = gateway simulado no próprio processo)
+URL_GATEWAY = os.environ.get('ESFIHARIA_URL_GATEWAY', '')
+# Prazo total (s) de uma cobrança, somando tentativas e esperas
+PRAZO_GATEWAY = float(os.environ.get('ESFIHARIA_PRAZO_GATEWAY', '5'))
+TENTATIVAS_GATEWAY = int(os.environ.get('ESFIHARIA_TENTATIVAS_GATEWAY', '3'))
+# Conexões mantidas abertas com o gateway, uma por consumidor; o worker
+# informa a própria concorrência (configurar_cliente_gateway)
+TAMANHO_POOL_GATEWAY = int(os.environ.get('ESFIHARIA_CONCORRENCIA', '8'))
+# Sem resposta após este tempo (s), uma segunda requisição idêntica (mesma
+# Idempotency-Key) é enviada e vale a primeira resposta (0 = desligado)
+ATRASO_HEDGE_GATEWAY = float(os.environ.get('ESFIHARIA_HEDGE_GATEWAY', '0.5'))
+# Tempo máximo (s) para abrir uma conexão
+TIMEOUT_CONEXAO = 1.0
+
+_tentativas = contador(
+    'esfiharia_gateway_tentativas_total', 'Requisições HTTP ao gateway por resultado', ('resultado',)
+)
+_hedges = contador(
+    'esfiharia_gateway_hedges_total', 'Requisições de reforço enviadas porque a primeira demorou'
+)
+
+
+class GatewayIndisponivel(Exception):
+    """O gateway falhou em todas as tentativas dentro do prazo, ou o disjuntor está aberto"""
+
+
+class CobrancaRejeitada(Exception):
+    """O gateway respondeu com um erro definitivo (4xx): repetir a mesma requisição não adianta"""
+
+
+class PoolEsgotado(requests.Timeout):
+    """Nenhuma conexão do pool ficou livre dentro do prazo da cobrança"""
+
+
+class Disjuntor:
+    """
+    Circuit breaker do gateway
+
+    fechado: as chamadas passam; limite_falhas falhas seguidas abrem o disjuntor.
+    aberto: as chamadas falham na hora durante tempo_aberto segundos.
+    meio_aberto: uma única chamada de teste passa; se der certo o disjuntor
+    fecha, se falhar volta a abrir.
+    """
+
+    FECHADO, ABERTO, MEIO_ABERTO = 'fechado', 'aberto', 'meio_aberto'
+
+    def __init__(self, limite_falhas: int = 5, tempo_aberto: float = 10.0):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto = tempo_aberto
+        self.lock = Lock()
+        self.estado = self.FECHADO
+        self.falhas = 0
+        self.reabrir_em = 0.0
+        self._testando = False
+
+    def permitir(self) -> bool:
+        """Indica se a chamada pode ser feita; quem recebe True deve registrar o resultado"""
+        with self.lock:
+            if self.estado == self.FECHADO:
+                return True
+            if self.estado == self.ABERTO:
+                if time.monotonic() < self.reabrir_em:
+                    return False
+                self.estado = self.MEIO_ABERTO
+                logger.info("Disjuntor do gateway meio aberto: testando o gateway")
+            if self._testando:
+                return False
+            self._testando = True
+            return True
+
+    def registrar_sucesso(self):
+        with self.lock:
+            if self.estado != self.FECHADO:
+                logger.info("Disjuntor do gateway fechado")
+            self.estado = self.FECHADO
+            self.falhas = 0
+            self._testando = False
+
+    def registrar_falha(self):
+        with self.lock:
+            self._testando = False
+            self.falhas += 1
+            if self.estado == self.MEIO_ABERTO or self.falhas >= self.limite_falhas:
+                if self.estado != self.ABERTO:
+                    logger.warning("Disjuntor do gateway aberto por %ss após %d falhas",
+                                   self.tempo_aberto, self.falhas)
+                self.estado = self.ABERTO
+                self.reabrir_em = time.monotonic() + self.tempo_aberto
+
+
+class ClienteGateway:
+    """
+    Cliente do gateway de pagamentos (POST {url}/pagamentos)
+
+    As conexões ficam em um pool (keep-alive): uma cobrança não paga um
+    novo handshake TCP/TLS. Cada tentativa usa o tempo que resta do prazo
+    como timeout. Erros de conexão, timeouts, 429 e 5xx são repetidos com
+    backoff exponencial e jitter total; como toda tentativa leva a mesma
+    chave no cabeçalho Idempotency-Key (o pedido_id ou, nas novas cobranças
+    de um pagamento recusado, a chave da cobrança), o gateway não cobra duas
+    vezes um pedido cuja resposta se perdeu.
+
+    São `tamanho_pool` conexões para as tentativas (uma por consumidor) e
+    outras tantas para os reforços. A espera por uma conexão livre também
+    conta no prazo: com o pool esgotado a tentativa falha (PoolEsgotado) em
+    vez de bloquear o consumidor sem limite.
+
+    Hedge: se uma tentativa não responde em `atraso_hedge` segundos, uma
+    segunda requisição idêntica é enviada e vale a primeira resposta boa.
+    Só há reforço se uma conexão de reforço estiver livre na hora, então ele
+    não disputa conexões com as tentativas nem se multiplica quando o
+    gateway está lento para todos.
+    """
+
+    def __init__(self, url: str, prazo: float = PRAZO_GATEWAY, tentativas: int = TENTATIVAS_GATEWAY,
+                 tamanho_pool: int = TAMANHO_POOL_GATEWAY, backoff_base: float = 0.05,
+                 backoff_maximo: float = 1.0, disjuntor: Disjuntor = None,
+                 atraso_hedge: float = ATRASO_HEDGE_GATEWAY):
+        self.url = url.rstrip('/')
+        self.prazo = prazo
+        self.tentativas = tentativas
+        self.tamanho_pool = tamanho_pool
+        self.backoff_base = backoff_base
+        self.backoff_maximo = backoff_maximo
+        self.disjuntor = disjuntor or Disjuntor()
+        self.atraso_hedge = atraso_hedge
+        self._conexoes = BoundedSemaphore(tamanho_pool)
+        self._conexoes_hedge = BoundedSemaphore(tamanho_pool)
+        # Com hedge, as requisições rodam no executor para que o reforço
+        # possa correr em paralelo com a primeira
+        self._executor = (ThreadPoolExecutor(2 * tamanho_pool, thread_name_prefix='gateway')
+                          if atraso_hedge > 0 else None)
+        self.sessao = requests.Session()
+        # Os semáforos acima limitam o uso: urllib3 sempre tem conexão livre
+        # e a espera por uma acontece neles, limitada pelo prazo
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=2 * tamanho_pool,
+                                pool_block=True, max_retries=0)
+        self.sessao.mount('http://', adaptador)
+        self.sessao.mount('https://', adaptador)
+
+    def cobrar(self, pedido_id: str, valor: float, forcar_status: str | None = None,
+               chave_idempotencia: str | None = None) -> dict:
+        """
+        Cobra o pedido; retorna a resposta do gateway (status 'aprovado' ou 'recusado')
+        chave_idempotencia: Idempotency-Key da cobrança (padrão: o pedido_id)
+        Lança GatewayIndisponivel se não houver resposta válida dentro do
+        prazo e CobrancaRejeitada se o gateway recusar a requisição (4xx)
+        """
+        if not self.disjuntor.permitir():
+            raise GatewayIndisponivel("Gateway de pagamentos indisponível (disjuntor aberto)")
+
+        # Quem passou por permitir() registra exatamente um resultado, qualquer
+        # que seja a saída (senão o disjuntor meio aberto ficaria esperando o teste)
+        respondeu = False
+        try:
+            corpo = self._cobrar(pedido_id, valor, forcar_status, chave_idempotencia)
+            respondeu = True
+            return corpo
+        except CobrancaRejeitada:
+            # O gateway está de pé: o erro é da requisição
+            respondeu = True
+            raise
+        finally:
+            if respondeu:
+                self.disjuntor.registrar_sucesso()
+            else:
+                self.disjuntor.registrar_falha()
+
+    def _cobrar(self, pedido_id: str, valor: float, forcar_status: str | None,
+                chave_idempotencia: str | None) -> dict:
+        limite = time.monotonic() + self.prazo
+        requisicao = (f"{self.url}/pagamentos",
+                      {'pedido_id': pedido_id, 'valor': valor, 'forcar_status': forcar_status},
+                      {'Idempotency-Key': chave_idempotencia or pedido_id})
+        erro = 'prazo esgotado'
+        for tentativa in range(self.tentativas):
+            if limite - time.monotonic() <= 0:
+                break
+            try:
+                resposta = self._tentar(requisicao, limite)
+            except requests.Timeout as e:
+                erro = f"timeout: {str(e)}"
+            except requests.RequestException as e:
+                erro = f"erro de conexão: {str(e)}"
+            else:
+                if _resposta_final(resposta):
+                    return _ler_resposta(resposta, pedido_id)
+                erro = f"HTTP {resposta.status_code}"
+
+            espera = random.uniform(0, min(self.backoff_maximo, self.backoff_base * 2 ** tentativa))
+            if tentativa + 1 == self.tentativas or time.monotonic() + espera >= limite:
+                break
+            logger.warning("Gateway falhou para o pedido %s (%s); nova tentativa em %.0fms",
+                           pedido_id, erro, espera * 1000)
+            time.sleep(espera)
+
+        raise GatewayIndisponivel(f"Gateway de pagamentos não respondeu para o pedido {pedido_id}: {erro}")
+
+    def _tentar(self, requisicao: tuple, limite: float) -> requests.Response:
+        """Uma tentativa, com reforço se a primeira requisição demorar"""
+        if self._executor is None:
+            return self._requisitar(requisicao, limite, self._conexoes)
+
+        primeira = self._executor.submit(self._requisitar, requisicao, limite, self._conexoes)
+        try:
+            return primeira.result(timeout=max(min(self.atraso_hedge, limite - time.monotonic()), 0))
+        except TempoEsgotado:
+            pass
+        if limite - time.monotonic() <= 0:
+            raise requests.Timeout("prazo esgotado")
+
+        pendentes = {primeira}
+        if self._conexoes_hedge.acquire(blocking=False):
+            _hedges.inc()
+            pendentes.add(self._executor.submit(self._requisitar, requisicao, limite,
+                                                self._conexoes_hedge, True))
+        resposta, falha = None, None
+        while pendentes:
+            prontas, pendentes = wait(pendentes, timeout=max(limite - time.monotonic(), 0),
+                                      return_when=FIRST_COMPLETED)
+            if not prontas:
+                break
+            for futura in prontas:
+                try:
+                    resposta = futura.result()
+                except requests.RequestException as e:
+                    falha = e
+                    continue
+                if _resposta_final(resposta):
+                    return resposta
+        # Nenhuma resposta boa: a requisição que ainda não respondeu termina
+        # sozinha (no máximo até o prazo) e devolve a sua conexão
+        if resposta is not None:
+            return resposta
+        raise falha or requests.Timeout("prazo esgotado")
+
+    def _requisitar(self, requisicao: tuple, limite: float, conexoes: BoundedSemaphore,
+                    reservada: bool = False) -> requests.Response:
+        """
+        Uma requisição HTTP com uma conexão de `conexoes` (reservada: já
+        adquirida por quem chamou); a espera pela conexão e a requisição
+        terminam até `limite`
+        """
+        url, corpo, cabecalhos = requisicao
+        if not reservada:
+            restante = limite - time.monotonic()
+            if restante <= 0 or not conexoes.acquire(timeout=restante):
+                _tentativas.inc(resultado='pool')
+                raise PoolEsgotado("nenhuma conexão livre com o gateway dentro do prazo")
+        try:
+            restante = max(limite - time.monotonic(), 0.001)
+            resposta = self.sessao.post(url, json=corpo, headers=cabecalhos,
+                                        timeout=(min(TIMEOUT_CONEXAO, restante), restante))
+        except requests.Timeout:
+            _tentativas.inc(resultado='timeout')
+            raise
+        except requests.RequestException:
+            _tentativas.inc(resultado='conexao')
+            raise
+        finally:
+            # Sem stream, o corpo já foi lido e a conexão voltou ao pool
+            conexoes.release()
+        _tentativas.inc(resultado=str(resposta.status_code))
+        return resposta
+
+    def fechar(self):
+        """Fecha as conexões do pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        self.sessao.close()
+
+
+def _resposta_final(resposta: requests.Response) -> bool:
+    """Resposta que encerra a cobrança; 429 e 5xx são temporários e repetidos"""
+    return resposta.status_code < 500 and resposta.status_code != 429
+
+
+def _ler_resposta(resposta: requests.Response, pedido_id: str) -> dict:
+    """
+    Corpo de uma resposta final: CobrancaRejeitada para 4xx e
+    GatewayIndisponivel para um corpo que não é um objeto JSON
+    """
+    if resposta.status_code >= 400:
+        raise CobrancaRejeitada(
+            f"Gateway recusou a cobrança do pedido {pedido_id}: HTTP {resposta.status_code} {resposta.text[:200]}"
+        )
+    try:
+        corpo = resposta.json()
+    except ValueError as e:
+        raise GatewayIndisponivel(f"Resposta inválida do gateway para o pedido {pedido_id}: {str(e)}") from e
+    if not isinstance(corpo, dict):
+        raise GatewayIndisponivel(f"Resposta inválida do gateway para o pedido {pedido_id}: {corpo!r}")
+    return corpo
+
+
+# Instância global do cliente (criada no primeiro uso)
+_cliente: Optional[ClienteGateway] = None
+_tamanho_pool = TAMANHO_POOL_GATEWAY
+_lock = Lock()
+
+
+def get_cliente_gateway() -> Optional[ClienteGateway]:
+    """Cliente do gateway em URL_GATEWAY; None se o gateway simulado estiver em uso"""
+    global _cliente
+    if not URL_GATEWAY:
+        return None
+    with _lock:
+        if _cliente is None:
+            _cliente = ClienteGateway(URL_GATEWAY, tamanho_pool=_tamanho_pool)
+        return _cliente
+
+
+def configurar_cliente_gateway(tamanho_pool: int):
+    """
+    Dimensiona o pool de conexões pela concorrência de quem cobra (o worker
+    chama com a sua, ex.: --concorrencia 32); recria o cliente se já existir
+    com outro tamanho
+    """
+    global _cliente, _tamanho_pool
+    with _lock:
+        _tamanho_pool = tamanho_pool
+        if _cliente is not None and _cliente.tamanho_pool != tamanho_pool:
+            _cliente.fechar()
+            _cliente = None
+
+
+medidor(
+    'esfiharia_gateway_disjuntor_aberto', 'Disjuntor do gateway aberto (1) ou meio aberto (0.5)', (),
+    lambda: {} if _cliente is None else {(): {Disjuntor.FECHADO: 0, Disjuntor.MEIO_ABERTO: 0.5,
+                                               Disjuntor.ABERTO: 1}[_cliente.disjuntor.estado]}
+)
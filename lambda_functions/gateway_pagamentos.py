@@ -0,0 +1,42 @@
+"""
+Gateway_Pagamentos (serviço externo simulado)
+Em produção, seria uma chamada HTTP real (Stripe, PagSeguro, etc.)
+Não depende do banco nem das filas, para poder rodar em outro processo
+"""
+import os
+import random
+import time
+
+# Latência simulada da chamada ao gateway, em segundos
+LATENCIA_GATEWAY = float(os.environ.get('ESFIHARIA_LATENCIA_GATEWAY', '0'))
+
+
+def simular_gateway_pagamentos(valor: float, forcar_status: str | None = None) -> dict:
+    """
+    Simula chamada ao gateway de pagamentos
+    Em produção, seria uma chamada HTTP real
+    """
+    if LATENCIA_GATEWAY > 0:
+        time.sleep(LATENCIA_GATEWAY)
+
+    # Se o status foi forçado (para fins de demonstração/teste), respeita-o
+    if forcar_status == 'aprovado':
+        aprovado = True
+    elif forcar_status == 'recusado':
+        aprovado = False
+    else:
+        # Caso não tenha sido forçado, simula 95% de aprovação
+        aprovado = random.random() > 0.05
+    
+    if aprovado:
+        return {
+            'status': 'aprovado',
+            'transacao_id': f"TXN-{random.randint(100000, 999999)}",
+            'valor': valor,
+            'metodo': 'cartao_credito'
+        }
+    else:
+        return {
+            'status': 'recusado',
+            'motivo': 'Saldo insuficiente ou cartão inválido'
+        }
@@ -0,0 +1,141 @@
+"""
+Gateway de pagamentos HTTP local (stub) para testes e benchmarks do ClienteGateway
+Responde POST /pagamentos com o resultado de simular_gateway_pagamentos e
+pode injetar latência e erros; os parâmetros podem ser alterados com o
+servidor rodando (ex.: servidor.latencia = 10 simula um gateway travado)
+
+Uso:
+    python -m lambda_functions.gateway_stub --porta 8099 --latencia 0.05 --taxa-erro 0.1
+    python -m lambda_functions.gateway_stub --porta 8099 --taxa-lenta 0.05 --latencia-lenta 2
+    ESFIHARIA_URL_GATEWAY=http://localhost:8099 python worker.py
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from lambda_functions.gateway_pagamentos import simular_gateway_pagamentos
+import argparse
+import json
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ServidorGatewayStub(ThreadingHTTPServer):
+    """
+    Servidor do stub; guarda a resposta de cada Idempotency-Key, como um
+    gateway real, para que retentativas não gerem uma segunda cobrança
+    """
+
+    daemon_threads = True
+
+    def __init__(self, endereco: tuple, latencia: float = 0.0, jitter: float = 0.0,
+                 taxa_erro: float = 0.0, taxa_lenta: float = 0.0, latencia_lenta: float = 0.0):
+        super().__init__(endereco, _HandlerGateway)
+        self.latencia = latencia
+        self.jitter = jitter
+        self.taxa_erro = taxa_erro
+        # Cauda de latência: uma fração taxa_lenta das requisições demora
+        # latencia_lenta segundos a mais
+        self.taxa_lenta = taxa_lenta
+        self.latencia_lenta = latencia_lenta
+        self.lock = Lock()
+        self.respostas = {}
+        # Estatísticas para os testes: conexões TCP aceitas e cobranças feitas
+        self.conexoes = 0
+        self.cobrancas = 0
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.conexoes += 1
+        super().process_request(request, client_address)
+
+    @property
+    def url(self) -> str:
+        host, porta = self.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def cobrar(self, chave: str, valor: float, forcar_status: str | None) -> dict:
+        with self.lock:
+            if chave and chave in self.respostas:
+                return self.respostas[chave]
+        resposta = simular_gateway_pagamentos(valor, forcar_status)
+        with self.lock:
+            if not chave:
+                self.cobrancas += 1
+                return resposta
+            # Duas tentativas simultâneas da mesma chave: vale a primeira gravada
+            if chave not in self.respostas:
+                self.respostas[chave] = resposta
+                self.cobrancas += 1
+            return self.respostas[chave]
+
+
+class _HandlerGateway(BaseHTTPRequestHandler):
+    # HTTP/1.1: a conexão continua aberta entre requisições (keep-alive)
+    protocol_version = 'HTTP/1.1'
+    # Cabeçalhos e corpo saem em escritas separadas: sem TCP_NODELAY, em uma
+    # conexão reaproveitada o corpo esperaria o ACK atrasado do cliente (~40ms)
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        corpo = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path != '/pagamentos':
+            self._responder(404, {'erro': 'Rota não encontrada'})
+            return
+
+        servidor = self.server
+        atraso = servidor.latencia + random.uniform(0, servidor.jitter)
+        if random.random() < servidor.taxa_lenta:
+            atraso += servidor.latencia_lenta
+        if atraso > 0:
+            time.sleep(atraso)
+        if random.random() < servidor.taxa_erro:
+            self._responder(503, {'erro': 'Gateway temporariamente indisponível'})
+            return
+
+        try:
+            dados = json.loads(corpo)
+            resposta = servidor.cobrar(self.headers.get('Idempotency-Key'),
+                                       dados['valor'], dados.get('forcar_status'))
+        except (ValueError, KeyError) as e:
+            self._responder(400, {'erro': f'Requisição inválida: {str(e)}'})
+            return
+        self._responder(200, resposta)
+
+    def _responder(self, status: int, corpo: dict):
+        dados = json.dumps(corpo).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, *_):
+        pass
+
+
+def iniciar_gateway_stub(porta: int = 0, host: str = '127.0.0.1', **opcoes) -> ServidorGatewayStub:
+    """Inicia o stub em uma thread (porta 0 = porta livre qualquer; ver servidor.url)"""
+    servidor = ServidorGatewayStub((host, porta), **opcoes)
+    Thread(target=servidor.serve_forever, name='gateway-stub', daemon=True).start()
+    logger.info("Gateway de pagamentos stub em %s", servidor.url)
+    return servidor
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Gateway de pagamentos stub')
+    parser.add_argument('--porta', type=int, default=8099)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--latencia', type=float, default=0.0, help='atraso fixo (s) por requisição')
+    parser.add_argument('--jitter', type=float, default=0.0, help='atraso aleatório extra (s), de 0 até este valor')
+    parser.add_argument('--taxa-erro', type=float, default=0.0, help='fração das requisições respondidas com 503')
+    parser.add_argument('--taxa-lenta', type=float, default=0.0, help='fração das requisições que demoram --latencia-lenta a mais')
+    parser.add_argument('--latencia-lenta', type=float, default=0.0, help='atraso extra (s) das requisições lentas')
+    args = parser.parse_args()
+    servidor = ServidorGatewayStub((args.host, args.porta), latencia=args.latencia,
+                                   jitter=args.jitter, taxa_erro=args.taxa_erro,
+                                   taxa_lenta=args.taxa_lenta, latencia_lenta=args.latencia_lenta)
+    logger.info("Gateway de pagamentos stub em %s", servidor.url)
+    servidor.serve_forever()
@@ -0,0 +1,91 @@
+"""
+Idempotência de requisições e mensagens
+Guarda o resultado de cada operação por chave (Idempotency-Key do cliente,
+pedido_id no pagamento) para que repetições devolvam o resultado original
+em vez de refazer o trabalho
+"""
+from collections import OrderedDict
+from threading import Event, Lock
+from typing import Any, Optional
+from monitoramento.metricas import contador
+import time
+
+_repeticoes = contador(
+    'esfiharia_idempotencia_repeticoes_total',
+    'Repetições atendidas com o resultado original, sem refazer o trabalho', ('cache',)
+)
+
+
+class Registro:
+    """Operação de uma chave: em andamento até concluido ser sinalizado"""
+
+    def __init__(self, impressao: Any, expira_em: float):
+        self.impressao = impressao
+        self.expira_em = expira_em
+        self.resultado = None
+        self.concluido = Event()
+
+
+class CacheIdempotencia:
+    """
+    Resultados por chave, limitados por quantidade (LRU) e idade (TTL)
+
+    iniciar() reserva a chave para quem chama primeiro; repetições recebem o
+    registro existente e podem esperar o resultado (concluido.wait()).
+    Registros em andamento nunca são descartados pelo LRU, senão uma
+    repetição concorrente refaria a operação. O TTL conta a partir da
+    reserva e só é verificado no acesso e no descarte.
+    """
+
+    def __init__(self, nome: str, capacidade: int, ttl: float):
+        self.nome = nome
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self.lock = Lock()
+        self.registros: 'OrderedDict[str, Registro]' = OrderedDict()
+
+    def iniciar(self, chave: str, impressao: Any = None) -> Optional[Registro]:
+        """
+        Reserva a chave e retorna None, ou retorna o registro já existente
+        Quem recebe None deve chamar concluir() ou cancelar() depois
+        """
+        agora = time.monotonic()
+        with self.lock:
+            registro = self.registros.get(chave)
+            if registro is not None and (registro.expira_em > agora or not registro.concluido.is_set()):
+                self.registros.move_to_end(chave)
+                _repeticoes.inc(cache=self.nome)
+                return registro
+            self.registros[chave] = Registro(impressao, agora + self.ttl)
+            self.registros.move_to_end(chave)
+            self._descartar(agora)
+            return None
+
+    def concluir(self, chave: str, resultado: Any):
+        """Guarda o resultado e libera quem está esperando por ele"""
+        with self.lock:
+            registro = self.registros.get(chave)
+        if registro is not None:
+            registro.resultado = resultado
+            registro.concluido.set()
+
+    def cancelar(self, chave: str):
+        """Libera a chave sem resultado (ex.: erro temporário); a próxima tentativa refaz a operação"""
+        with self.lock:
+            registro = self.registros.pop(chave, None)
+        if registro is not None:
+            registro.concluido.set()
+
+    def _descartar(self, agora: float):
+        # Do menos para o mais recentemente usado; chamado com o lock
+        for _ in range(len(self.registros)):
+            chave, registro = next(iter(self.registros.items()))
+            excedente = len(self.registros) > self.capacidade
+            if not registro.concluido.is_set():
+                if not excedente:
+                    return
+                self.registros.move_to_end(chave)
+            elif excedente or registro.expira_em <= agora:
+                del self.registros[chave]
+            else:
+                return
@@ -4,40 +4,192 @@ Processa pagamentos e publica evento de conclusão
 """
 import logging
 from messaging.sns import get_topic
-from database.db import atualizar_pedido
-from datetime import datetime
+from messaging.sqs import ATRASO_MAXIMO, get_queue
+from database.db import atualizar_pedido, confirmar_reserva, get_pedido, liberar_reserva
+from lambda_functions.cliente_gateway import CobrancaRejeitada, GatewayIndisponivel, get_cliente_gateway
+from lambda_functions.gateway_pagamentos import simular_gateway_pagamentos
+from lambda_functions.idempotencia import CacheIdempotencia
+from messaging.notificacoes import STATUS_FINAIS
+from monitoramento.logs import SEM_TRACE, registrar_payload, trace_id_atual
+from monitoramento.metricas import contador, histograma, medir_handler
+from datetime import datetime, timedelta
+import os
 import random
+import time
 
 logger = logging.getLogger(__name__)
 
+# Executor opcional para a chamada ao gateway (ex.: ProcessPoolExecutor do worker)
+_executor_gateway = None
 
+# Pagamentos já processados (ou em processamento) neste processo, por pedido_id
+CAPACIDADE_LEDGER = int(os.environ.get('ESFIHARIA_LEDGER_PAGAMENTOS_CAPACIDADE', '100000'))
+TTL_LEDGER = float(os.environ.get('ESFIHARIA_LEDGER_PAGAMENTOS_TTL', '3600'))
+
+ledger_pagamentos = CacheIdempotencia('pagamentos', CAPACIDADE_LEDGER, TTL_LEDGER)
+
+# Cobranças recusadas pelo gateway são tentadas de novo até este total de
+# tentativas, com backoff exponencial (base * 2^(n-1), até o máximo) e jitter
+TENTATIVAS_PAGAMENTO = int(os.environ.get('ESFIHARIA_TENTATIVAS_PAGAMENTO', '3'))
+BACKOFF_PAGAMENTO_BASE = float(os.environ.get('ESFIHARIA_BACKOFF_PAGAMENTO_BASE', '30'))
+BACKOFF_PAGAMENTO_MAXIMO = min(float(os.environ.get('ESFIHARIA_BACKOFF_PAGAMENTO_MAXIMO', '600')), ATRASO_MAXIMO)
+
+_duracao_gateway = histograma(
+    'esfiharia_gateway_duracao_segundos', 'Latência das chamadas ao gateway de pagamentos', ('resultado',)
+)
+_novas_tentativas = contador(
+    'esfiharia_pagamentos_novas_tentativas_total', 'Cobranças recusadas reagendadas com backoff'
+)
+
+
+def configurar_executor_gateway(executor):
+    """
+    Define onde a chamada ao gateway simulado é executada (None = na thread atual)
+    Com um gateway HTTP (ESFIHARIA_URL_GATEWAY) a chamada é só espera de
+    I/O e sempre roda na thread do consumidor
+    """
+    global _executor_gateway
+    _executor_gateway = executor
+
+
+def chamar_gateway(total: float, forcar_status: str | None = None, pedido_id: str | None = None,
+                   chave_idempotencia: str | None = None) -> dict:
+    """
+    Chama o gateway de pagamentos: o gateway HTTP configurado ou o simulado
+    (no executor configurado, se houver)
+    chave_idempotencia: Idempotency-Key da cobrança (padrão: o pedido_id)
+    Lança GatewayIndisponivel se o gateway HTTP não responder dentro do prazo
+    e CobrancaRejeitada se ele recusar a requisição (4xx)
+    """
+    inicio = time.perf_counter()
+    resultado = 'erro'
+    try:
+        cliente = get_cliente_gateway()
+        if cliente is not None:
+            resposta = cliente.cobrar(pedido_id, total, forcar_status, chave_idempotencia)
+        elif _executor_gateway is None:
+            resposta = simular_gateway_pagamentos(total, forcar_status)
+        else:
+            resposta = _executor_gateway.submit(simular_gateway_pagamentos, total, forcar_status).result()
+        resultado = resposta['status']
+        return resposta
+    finally:
+        _duracao_gateway.observar(time.perf_counter() - inicio, resultado=resultado)
+
+
+@medir_handler('Processar_Pagamento')
 def processar_pagamento_handler(event: dict, context: dict) -> dict:
     """
     Handler da função Lambda Processar_Pagamento
     Simula processamento de pagamento e publica evento de conclusão
+    Idempotente: mensagens repetidas da Fila_Pagamentos (reentregas após o
+    visibility timeout, duplicatas do SNS) não chamam o gateway de novo
+    Uma cobrança recusada volta para a Fila_Pagamentos com DelaySeconds
+    (backoff exponencial) até TENTATIVAS_PAGAMENTO; cada tentativa tem a sua
+    chave no ledger e no gateway
+    """
+    pedido_id = event.get('pedido_id')
+    if not pedido_id:
+        logger.error("Erro ao processar pagamento: pedido_id não fornecido")
+        return {
+            'statusCode': 500,
+            'body': {
+                'erro': 'Erro ao processar pagamento: pedido_id não fornecido'
+            }
+        }
+
+    chave = _chave_tentativa(pedido_id, event.get('tentativa_pagamento', 1))
+    registro = ledger_pagamentos.iniciar(chave)
+    if registro is not None:
+        if registro.resultado is not None:
+            logger.info("Pagamento do pedido %s já processado; mensagem repetida ignorada", pedido_id)
+            return registro.resultado
+        # Outra entrega da mesma mensagem está no gateway: esta volta para a
+        # fila e na próxima entrega encontra o resultado
+        logger.warning("Pagamento do pedido %s já em processamento", pedido_id)
+        return {
+            'statusCode': 409,
+            'body': {
+                'erro': 'Pagamento já em processamento',
+                'pedido_id': pedido_id
+            }
+        }
+
+    resultado = _processar_pagamento(pedido_id, event, chave)
+    if resultado['statusCode'] >= 500:
+        ledger_pagamentos.cancelar(chave)
+    else:
+        ledger_pagamentos.concluir(chave, resultado)
+    return resultado
+
+
+def _chave_tentativa(pedido_id: str, tentativa: int) -> str:
+    """Chave do ledger e Idempotency-Key de uma tentativa (a primeira é o próprio pedido_id)"""
+    return pedido_id if tentativa <= 1 else f"{pedido_id}#{tentativa}"
+
+
+def agendar_nova_tentativa(pedido_id: str, event: dict, tentativa: int) -> float:
     """
+    Reenvia o evento à Fila_Pagamentos como a tentativa seguinte, visível só
+    depois do backoff; retorna o atraso em segundos
+    O envelope é o mesmo do SNS (com o trace ID) e, na fila FIFO, o grupo é o
+    pedido, então nenhum outro evento do pedido passa na frente
+    """
+    atraso = min(BACKOFF_PAGAMENTO_BASE * 2 ** (tentativa - 1), BACKOFF_PAGAMENTO_MAXIMO)
+    # Jitter: espalha as novas tentativas de uma mesma rajada de recusas
+    atraso = random.uniform(atraso / 2, atraso)
+    envelope = {'Message': {**event, 'tentativa_pagamento': tentativa + 1}}
+    trace_id = trace_id_atual()
+    if trace_id != SEM_TRACE:
+        envelope['MessageAttributes'] = {'trace_id': {'Type': 'String', 'Value': trace_id}}
+    get_queue('Fila_Pagamentos').send_message(
+        envelope, message_group_id=pedido_id,
+        message_deduplication_id=f"{pedido_id}:tentativa:{tentativa + 1}", delay_seconds=atraso
+    )
+    _novas_tentativas.inc()
+    return atraso
+
+
+def _processar_pagamento(pedido_id: str, event: dict, chave: str) -> dict:
     try:
-        logger.info(f"Processando pagamento: {event}")
+        registrar_payload(logger, 'Processando pagamento', event)
         
-        pedido_id = event.get('pedido_id')
         total = event.get('total', 0)
         # Campo opcional vindo do pedido original para forçar o resultado
         # Valores esperados: "aprovado" ou "recusado"
         forcar_status = event.get('forcar_status_pagamento')
-        
-        if not pedido_id:
-            raise ValueError("pedido_id não fornecido")
+
+        # Pedido já pago ou recusado (ex.: reentrega depois que o worker
+        # reiniciou e perdeu o ledger em memória): não cobra de novo
+        pedido = get_pedido(pedido_id)
+        if pedido and pedido.get('status') in STATUS_FINAIS:
+            logger.info("Pedido %s já está %s; mensagem repetida ignorada", pedido_id, pedido['status'])
+            return {
+                'statusCode': 200 if pedido['status'] == 'pago' else 402,
+                'body': {
+                    'mensagem': 'Pagamento já processado',
+                    'pedido_id': pedido_id,
+                    'status': 'aprovado' if pedido['status'] == 'pago' else 'recusado',
+                    'transacao_id': pedido.get('pagamento_id')
+                }
+            }
         
         # Simula chamada ao gateway de pagamentos
         # Em produção, aqui seria uma chamada HTTP real
-        resultado_pagamento = simular_gateway_pagamentos(total, forcar_status)
+        resultado_pagamento = chamar_gateway(total, forcar_status, pedido_id, chave)
+        tentativa = event.get('tentativa_pagamento', 1)
         
         if resultado_pagamento['status'] == 'aprovado':
-            # Atualiza status do pedido
+            # As esfihas reservadas viram venda; se a reserva pendente está em
+            # outro processo (a API), ele a confirma ao ver o novo status
+            confirmar_reserva(pedido_id)
+
+            # Atualiza status do pedido; o evento leva o mesmo horário
+            data_pagamento = datetime.now().isoformat()
             atualizar_pedido(pedido_id, {
                 'status': 'pago',
                 'pagamento_id': resultado_pagamento['transacao_id'],
-                'data_pagamento': datetime.now().isoformat()
+                'data_pagamento': data_pagamento
             })
             
             # Publica evento no tópico "Pagamento_Concluido"
@@ -47,13 +199,14 @@ def processar_pagamento_handler(event: dict, context: dict) -> dict:
                 'pedido_id': pedido_id,
                 'transacao_id': resultado_pagamento['transacao_id'],
                 'total': total,
+                'itens': event.get('itens', []),
                 'status': 'aprovado',
-                'timestamp': datetime.now().isoformat()
+                'timestamp': data_pagamento
             }
             
             topic.publish(evento)
             
-            logger.info(f"Pagamento aprovado para pedido {pedido_id}")
+            logger.info("Pagamento aprovado para pedido %s", pedido_id)
             
             return {
                 'statusCode': 200,
@@ -64,14 +217,38 @@ def processar_pagamento_handler(event: dict, context: dict) -> dict:
                     'transacao_id': resultado_pagamento['transacao_id']
                 }
             }
+        elif forcar_status != 'recusado' and tentativa < TENTATIVAS_PAGAMENTO:
+            # Recusa possivelmente temporária: o pedido continua 'recebido',
+            # com as esfihas reservadas, até a próxima tentativa
+            atraso = agendar_nova_tentativa(pedido_id, event, tentativa)
+            atualizar_pedido(pedido_id, {
+                'tentativas_pagamento': tentativa,
+                'proxima_tentativa_pagamento': (datetime.now() + timedelta(seconds=atraso)).isoformat()
+            })
+
+            logger.warning("Pagamento recusado para pedido %s (tentativa %d de %d); nova tentativa em %.1fs",
+                           pedido_id, tentativa, TENTATIVAS_PAGAMENTO, atraso)
+
+            return {
+                'statusCode': 202,
+                'body': {
+                    'mensagem': 'Pagamento recusado; nova tentativa agendada',
+                    'pedido_id': pedido_id,
+                    'status': 'recusado',
+                    'tentativa': tentativa,
+                    'proxima_tentativa_em': atraso
+                }
+            }
         else:
-            # Pagamento recusado
+            # Recusa definitiva: devolve as esfihas ao estoque
+            liberar_reserva(pedido_id)
             atualizar_pedido(pedido_id, {
                 'status': 'pagamento_recusado',
+                'tentativas_pagamento': tentativa,
                 'data_pagamento': datetime.now().isoformat()
             })
             
-            logger.warning(f"Pagamento recusado para pedido {pedido_id}")
+            logger.warning("Pagamento recusado para pedido %s", pedido_id)
             
             return {
                 'statusCode': 402,
@@ -82,40 +259,33 @@ def processar_pagamento_handler(event: dict, context: dict) -> dict:
                 }
             }
             
-    except Exception as e:
-        logger.error(f"Erro ao processar pagamento: {str(e)}")
+    except GatewayIndisponivel as e:
+        # Pedido e reserva intactos: a mensagem volta para a fila e a nova
+        # tentativa leva a mesma Idempotency-Key, então não há cobrança dupla
+        logger.error("%s", e)
         return {
-            'statusCode': 500,
+            'statusCode': 503,
             'body': {
-                'erro': f'Erro ao processar pagamento: {str(e)}'
+                'erro': str(e)
             }
         }
 
-
-def simular_gateway_pagamentos(valor: float, forcar_status: str | None = None) -> dict:
-    """
-    Simula chamada ao gateway de pagamentos
-    Em produção, seria uma chamada HTTP real
-    """
-    # Se o status foi forçado (para fins de demonstração/teste), respeita-o
-    if forcar_status == 'aprovado':
-        aprovado = True
-    elif forcar_status == 'recusado':
-        aprovado = False
-    else:
-        # Caso não tenha sido forçado, simula 95% de aprovação
-        aprovado = random.random() > 0.05
-    
-    if aprovado:
+    except CobrancaRejeitada as e:
+        # Erro definitivo da requisição: as reentregas terminam na DLQ,
+        # onde a mensagem pode ser examinada
+        logger.error("%s", e)
         return {
-            'status': 'aprovado',
-            'transacao_id': f"TXN-{random.randint(100000, 999999)}",
-            'valor': valor,
-            'metodo': 'cartao_credito'
+            'statusCode': 500,
+            'body': {
+                'erro': str(e)
+            }
         }
-    else:
+
+    except Exception as e:
+        logger.error("Erro ao processar pagamento: %s", e)
         return {
-            'status': 'recusado',
-            'motivo': 'Saldo insuficiente ou cartão inválido'
+            'statusCode': 500,
+            'body': {
+                'erro': f'Erro ao processar pagamento: {str(e)}'
+            }
         }
-
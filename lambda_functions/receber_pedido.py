@@ -4,68 +4,67 @@ Recebe pedidos e publica evento no SNS
 """
 import logging
 from messaging.sns import get_topic
-from database.db import criar_pedido
+from monitoramento.logs import registrar_payload
+from monitoramento.metricas import medir_handler
+from database.db import (criar_pedido, criar_pedidos, precificar_itens, precificar_pedidos,
+                         reservar_estoque, liberar_reserva, EstoqueInsuficiente)
+from typing import Iterable, Iterator
+import json
+import os
 import uuid
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Modo de demonstração antigo: processa a Fila_Pagamentos dentro da própria
+# requisição. Por padrão o pedido só é salvo e publicado (202) e o pagamento
+# fica a cargo dos consumidores (worker)
+PROCESSAR_FILAS_INLINE = os.environ.get('ESFIHARIA_PROCESSAR_FILAS_INLINE') == '1'
+# Pedidos da importação em lote gravados e publicados de uma vez
+TAMANHO_BLOCO_IMPORTACAO = 500
 
+
+@medir_handler('Receber_Pedido')
 def receber_pedido_handler(event: dict, context: dict) -> dict:
     """
     Handler da função Lambda Receber_Pedido
     Recebe o pedido, salva no banco e publica evento no SNS
     """
     try:
-        logger.info(f"Processando pedido recebido: {event}")
+        registrar_payload(logger, 'Processando pedido recebido', event)
         
         # Gera ID único para o pedido
         pedido_id = str(uuid.uuid4())
         
-        # Campo opcional para forçar resultado do pagamento (apenas para testes/demo)
-        # Valores aceitos: "aprovado" ou "recusado"
-        forcar_status_pagamento = event.get('forcar_status_pagamento')
-
         # Prepara dados do pedido
-        pedido_data = {
-            'pedido_id': pedido_id,
-            'cliente': event.get('cliente'),
-            'itens': event.get('itens', []),
-            'status': 'recebido',
-            'data_criacao': datetime.now().isoformat(),
-            'total': calcular_total(event.get('itens', []))
-        }
+        pedido_data = montar_pedido(pedido_id, event, *precificar_itens(event.get('itens', [])))
         
+        # Reserva todas as esfihas do pedido antes de aceitá-lo
+        reservar_estoque(pedido_id, pedido_data['itens'])
+
         # Salva pedido no banco (status inicial)
-        criar_pedido(pedido_data)
+        try:
+            criar_pedido(pedido_data)
+        except Exception:
+            liberar_reserva(pedido_id)
+            raise
         
         # Publica evento no tópico SNS "Eventos_Pedidos"
+        # O pedido_id é o grupo FIFO: os eventos de um pedido saem em ordem
         topic = get_topic('Eventos_Pedidos')
-        evento = {
-            'tipo': 'pedido_recebido',
-            'pedido_id': pedido_id,
-            'forcar_status_pagamento': forcar_status_pagamento,
-            'cliente': event.get('cliente'),
-            'itens': event.get('itens', []),
-            'total': pedido_data['total'],
-            'timestamp': datetime.now().isoformat()
-        }
-        
-        topic.publish(evento)
+        topic.publish(montar_evento(pedido_data, event), message_group_id=pedido_id)
 
-        # Para fins de demonstração local, processamos imediatamente as filas SQS
-        # no mesmo processo, garantindo que o status do pedido seja atualizado
-        # logo após a criação.
-        try:
-            from config.setup import processar_filas
-            processar_filas()
-        except Exception as e:
-            logger.error(f'Erro ao processar filas após receber pedido: {e}')
+        if PROCESSAR_FILAS_INLINE:
+            try:
+                from config.setup import processar_filas
+                processar_filas()
+            except Exception as e:
+                logger.error('Erro ao processar filas após receber pedido: %s', e)
         
-        logger.info(f"Pedido {pedido_id} processado e evento publicado")
+        logger.info("Pedido %s salvo e evento publicado", pedido_id)
         
         return {
-            'statusCode': 201,
+            'statusCode': 201 if PROCESSAR_FILAS_INLINE else 202,
             'body': {
                 'mensagem': 'Pedido recebido com sucesso',
                 'pedido_id': pedido_id,
@@ -73,8 +72,27 @@ def receber_pedido_handler(event: dict, context: dict) -> dict:
             }
         }
         
+    except EstoqueInsuficiente as e:
+        logger.warning("Pedido recusado: %s", e)
+        return {
+            'statusCode': 409,
+            'body': {
+                'erro': str(e),
+                'tipo': e.tipo,
+                'disponivel': e.disponivel
+            }
+        }
+
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'body': {
+                'erro': str(e)
+            }
+        }
+
     except Exception as e:
-        logger.error(f"Erro ao processar pedido: {str(e)}")
+        logger.error("Erro ao processar pedido: %s", e)
         return {
             'statusCode': 500,
             'body': {
@@ -83,23 +101,111 @@ def receber_pedido_handler(event: dict, context: dict) -> dict:
         }
 
 
-def calcular_total(itens: list) -> float:
-    """Calcula o total do pedido"""
-    total = 0.0
-    precos = {
-        'esfiha_carne': 3.50,
-        'esfiha_frango': 3.50,
-        'esfiha_queijo': 3.00,
-        'esfiha_espinafre': 3.00,
-        'esfiha_pizza': 3.50,
-        'esfiha_4_queijos': 4.00
+def receber_pedidos_lote_handler(linhas: Iterable, context: dict) -> Iterator[dict]:
+    """
+    Importação em lote: recebe pedidos em NDJSON (um pedido JSON por linha)
+    As linhas são lidas e validadas conforme chegam, sem carregar o lote
+    inteiro; a cada TAMANHO_BLOCO_IMPORTACAO pedidos eles são gravados com
+    uma única escrita e publicados com um único publish_batch
+    Gera um resultado por linha, na ordem de entrada
+    """
+    bloco = []
+    for numero, linha in enumerate(linhas, start=1):
+        if not linha.strip():
+            continue
+        try:
+            event = json.loads(linha)
+            validar_pedido(event)
+            bloco.append((numero, event, None))
+        except ValueError as e:
+            bloco.append((numero, None, str(e)))
+
+        if len(bloco) >= TAMANHO_BLOCO_IMPORTACAO:
+            yield from _importar_bloco(bloco)
+            bloco = []
+    if bloco:
+        yield from _importar_bloco(bloco)
+
+
+def _importar_bloco(bloco: list) -> Iterator[dict]:
+    resultados = {}
+    aceitos = []
+    for numero, event, erro in bloco:
+        if erro is not None:
+            resultados[numero] = {'linha': numero, 'statusCode': 400, 'erro': erro}
+            continue
+        pedido_id = str(uuid.uuid4())
+        try:
+            reservar_estoque(pedido_id, event['itens'])
+        except EstoqueInsuficiente as e:
+            resultados[numero] = {'linha': numero, 'statusCode': 409, 'erro': str(e)}
+            continue
+        except ValueError as e:
+            resultados[numero] = {'linha': numero, 'statusCode': 400, 'erro': str(e)}
+            continue
+        aceitos.append((numero, pedido_id, event))
+
+    if aceitos:
+        precificados = precificar_pedidos([event['itens'] for _, _, event in aceitos])
+        pedidos = [montar_pedido(pedido_id, event, itens, total)
+                   for (_, pedido_id, event), (itens, total) in zip(aceitos, precificados)]
+        try:
+            criar_pedidos(pedidos)
+        except Exception as e:
+            logger.error("Erro ao gravar bloco de %d pedidos: %s", len(pedidos), e)
+            for numero, pedido_id, _ in aceitos:
+                liberar_reserva(pedido_id)
+                resultados[numero] = {'linha': numero, 'statusCode': 500,
+                                      'erro': f'Erro ao processar pedido: {str(e)}'}
+            aceitos = []
+        else:
+            get_topic('Eventos_Pedidos').publish_batch([
+                {'Id': str(numero), 'Message': montar_evento(pedido, event), 'MessageGroupId': pedido_id}
+                for (numero, pedido_id, event), pedido in zip(aceitos, pedidos)
+            ])
+            logger.info("%d pedidos importados e publicados", len(pedidos))
+
+        for numero, pedido_id, _ in aceitos:
+            resultados[numero] = {'linha': numero, 'statusCode': 202,
+                                  'pedido_id': pedido_id, 'status': 'recebido'}
+
+    for numero, _, _ in bloco:
+        yield resultados[numero]
+
+
+def validar_pedido(event) -> None:
+    """Confere os campos obrigatórios de um pedido; lança ValueError se faltar algum"""
+    if not isinstance(event, dict) or 'cliente' not in event or 'itens' not in event:
+        raise ValueError("Dados incompletos. Necessário: cliente, itens")
+    if not isinstance(event['itens'], list):
+        raise ValueError("itens deve ser uma lista")
+
+
+def montar_pedido(pedido_id: str, event: dict, itens: list, total: float) -> dict:
+    """
+    Registro do pedido na Tabela_Pedidos (status inicial)
+    itens e total vêm de precificar_itens: cada item leva o preco_unitario cobrado
+    """
+    return {
+        'pedido_id': pedido_id,
+        'cliente': event.get('cliente'),
+        'itens': itens,
+        'status': 'recebido',
+        'data_criacao': datetime.now().isoformat(),
+        'total': total
     }
-    
-    for item in itens:
-        tipo = item.get('tipo')
-        quantidade = item.get('quantidade', 1)
-        preco = precos.get(tipo, 3.00)
-        total += preco * quantidade
-    
-    return round(total, 2)
 
+
+def montar_evento(pedido: dict, event: dict) -> dict:
+    """Evento pedido_recebido publicado no tópico Eventos_Pedidos"""
+    return {
+        'tipo': 'pedido_recebido',
+        'pedido_id': pedido['pedido_id'],
+        # Campo opcional para forçar resultado do pagamento (apenas para testes/demo)
+        # Valores aceitos: "aprovado" ou "recusado"
+        'forcar_status_pagamento': event.get('forcar_status_pagamento'),
+        'cliente': pedido['cliente'],
+        'itens': pedido['itens'],
+        'total': pedido['total'],
+        'timestamp': datetime.now().isoformat()
+    }
@@ -0,0 +1,88 @@
+"""
+Codecs das mensagens SNS/SQS
+As mensagens circulam como objetos Python dentro do processo; só são
+serializadas ao atravessar uma fronteira de processo ou de armazenamento
+(ex.: o backend SQLite das filas)
+"""
+from threading import Lock
+from typing import Any, Dict
+import json
+import marshal
+import os
+
+# Codec usado para gravar novas mensagens: 'json' (padrão), 'marshal' ou 'msgpack'
+CODEC_MENSAGENS = os.environ.get('ESFIHARIA_CODEC_MENSAGENS', 'json')
+
+
+class CodecJSON:
+    """JSON da biblioteca padrão: legível e aceito por qualquer consumidor"""
+
+    nome = 'json'
+
+    def codificar(self, objeto: Any) -> bytes:
+        return json.dumps(objeto, separators=(',', ':')).encode('utf-8')
+
+    def decodificar(self, dados) -> Any:
+        return json.loads(dados)
+
+
+class CodecMarshal:
+    """
+    Binário compacto da biblioteca padrão (marshal)
+    Mais rápido que JSON, mas o formato depende da versão do Python: todos
+    os processos que compartilham as filas devem usar a mesma versão
+    """
+
+    nome = 'marshal'
+
+    def codificar(self, objeto: Any) -> bytes:
+        return marshal.dumps(objeto)
+
+    def decodificar(self, dados) -> Any:
+        return marshal.loads(dados)
+
+
+class CodecMsgpack:
+    """MessagePack (binário compacto e portável); requer o pacote msgpack"""
+
+    nome = 'msgpack'
+
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+
+    def codificar(self, objeto: Any) -> bytes:
+        return self._msgpack.packb(objeto, use_bin_type=True)
+
+    def decodificar(self, dados) -> Any:
+        return self._msgpack.unpackb(dados, raw=False)
+
+
+# Codecs disponíveis, por nome (criados no primeiro uso)
+_fabricas = {'json': CodecJSON, 'marshal': CodecMarshal, 'msgpack': CodecMsgpack}
+_codecs: Dict[str, Any] = {}
+_lock = Lock()
+
+
+def registrar_codec(nome: str, fabrica):
+    """Registra um codec: fabrica() retorna um objeto com codificar/decodificar"""
+    with _lock:
+        _fabricas[nome] = fabrica
+        _codecs.pop(nome, None)
+
+
+def get_codec(nome: str = None):
+    """
+    Obtém um codec pelo nome (padrão: CODEC_MENSAGENS)
+    Lança ValueError se o codec não existe ou sua dependência não está instalada
+    """
+    nome = nome or CODEC_MENSAGENS
+    with _lock:
+        if nome not in _codecs:
+            if nome not in _fabricas:
+                raise ValueError(f"Codec de mensagens desconhecido: {nome}")
+            try:
+                _codecs[nome] = _fabricas[nome]()
+            except ImportError as e:
+                raise ValueError(f"Codec de mensagens {nome} indisponível: {str(e)}") from e
+        return _codecs[nome]
@@ -0,0 +1,133 @@
+"""
+Políticas de filtro das assinaturas SNS (FilterPolicy)
+Mesmo formato do Amazon SNS com escopo no corpo da mensagem: cada chave da
+política é um campo do evento e cada valor, a lista de condições aceitas
+(basta uma casar). Todas as chaves precisam casar:
+
+    {
+        'tipo': ['pedido_recebido', 'pedido_cancelado'],      # valores exatos
+        'total': [{'numeric': ['>=', 50, '<', 200]}],         # faixa numérica
+        'cliente': {'email': [{'prefix': 'loja@'}]},          # campo aninhado
+        'forcar_status_pagamento': [{'exists': False}]        # campo ausente
+    }
+
+Um campo que é lista casa se algum elemento casar. A política é compilada
+uma vez, no subscribe, em uma função mensagem -> bool
+"""
+from typing import Any, Callable, Dict, List
+import operator
+
+_OPERADORES = {
+    '=': operator.eq,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+}
+
+# Marcador de campo ausente na mensagem
+_AUSENTE = object()
+_NUMEROS = (int, float)
+
+
+def compilar_politica(politica: Dict[str, Any]) -> Callable[[Any], bool]:
+    """
+    Compila uma política de filtro em uma função mensagem -> bool
+    Levanta ValueError se a política for inválida
+    """
+    if not isinstance(politica, dict) or not politica:
+        raise ValueError("A política de filtro deve ser um dicionário não vazio")
+    condicoes = [(chave, _compilar_chave(chave, valor)) for chave, valor in politica.items()]
+
+    def casar(mensagem: Any) -> bool:
+        if type(mensagem) is not dict:
+            return False
+        for chave, condicao in condicoes:
+            if not condicao(mensagem.get(chave, _AUSENTE)):
+                return False
+        return True
+
+    return casar
+
+
+def _compilar_chave(chave: str, valor: Any) -> Callable[[Any], bool]:
+    if isinstance(valor, dict):
+        # Campo aninhado: a sub-política vale para o objeto do campo
+        return compilar_politica(valor)
+    if not isinstance(valor, list) or not valor:
+        raise ValueError(f"Condições de '{chave}' devem ser uma lista não vazia")
+
+    exatos, prefixos, testes = set(), [], []
+    existe = None
+    for condicao in valor:
+        if isinstance(condicao, (str, int, float, bool, type(None))):
+            exatos.add(condicao)
+        elif not isinstance(condicao, dict):
+            raise ValueError(f"Condição inválida em '{chave}': {condicao!r}")
+        elif set(condicao) == {'prefix'} and isinstance(condicao['prefix'], str):
+            prefixos.append(condicao['prefix'])
+        elif set(condicao) == {'numeric'}:
+            testes.append(_compilar_faixa(chave, condicao['numeric']))
+        elif set(condicao) == {'exists'} and isinstance(condicao['exists'], bool):
+            existe = condicao['exists']
+        else:
+            raise ValueError(f"Condição inválida em '{chave}': {condicao!r}")
+
+    if exatos:
+        testes.insert(0, _teste_exatos(exatos))
+    if prefixos:
+        prefixos = tuple(prefixos)
+        testes.insert(0, lambda campo: type(campo) is str and campo.startswith(prefixos))
+
+    # Cada teste já rejeita _AUSENTE e valores de outro tipo
+    if len(testes) == 1:
+        casar_escalar = testes[0]
+    else:
+        def casar_escalar(campo: Any) -> bool:
+            for teste in testes:
+                if teste(campo):
+                    return True
+            return False
+
+    def casar(campo: Any) -> bool:
+        if type(campo) is list:
+            for elemento in campo:
+                if casar_escalar(elemento):
+                    return True
+            return False
+        return casar_escalar(campo)
+
+    if existe is None:
+        return casar
+    if existe:
+        return lambda campo: campo is not _AUSENTE or casar(campo)
+    return lambda campo: campo is _AUSENTE or casar(campo)
+
+
+def _teste_exatos(exatos: set) -> Callable[[Any], bool]:
+    def casar(campo: Any) -> bool:
+        try:
+            return campo in exatos
+        except TypeError:
+            # Valor não hashable (ex.: objeto): não é igual a nenhum escalar
+            return False
+    return casar
+
+
+def _compilar_faixa(chave: str, termos: List[Any]) -> Callable[[float], bool]:
+    """['>=', 50, '<', 200] -> função que testa os dois limites"""
+    if not isinstance(termos, list) or not termos or len(termos) % 2 or len(termos) > 4:
+        raise ValueError(f"Faixa numérica inválida em '{chave}': {termos!r}")
+    comparacoes = []
+    for i in range(0, len(termos), 2):
+        simbolo, limite = termos[i], termos[i + 1]
+        if simbolo not in _OPERADORES or isinstance(limite, bool) or not isinstance(limite, (int, float)):
+            raise ValueError(f"Faixa numérica inválida em '{chave}': {termos!r}")
+        comparacoes.append((_OPERADORES[simbolo], limite))
+
+    # type() e não isinstance: bool não é número para o filtro
+    if len(comparacoes) == 1:
+        comparar, limite = comparacoes[0]
+        return lambda campo: type(campo) in _NUMEROS and comparar(campo, limite)
+    (comparar_1, limite_1), (comparar_2, limite_2) = comparacoes
+    return lambda campo: type(campo) in _NUMEROS and comparar_1(campo, limite_1) and comparar_2(campo, limite_2)
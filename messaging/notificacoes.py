@@ -0,0 +1,53 @@
+"""
+Notificações de mudança de status de pedidos
+Alimenta o stream Server-Sent Events de GET /pedidos/<pedido_id>/eventos
+"""
+from queue import Queue
+from threading import Lock
+from typing import Dict, Set
+
+# Status a partir dos quais o pedido não muda mais
+STATUS_FINAIS = frozenset({'pago', 'pagamento_recusado'})
+
+
+class CanalStatusPedidos:
+    """Entrega mudanças de status aos clientes que acompanham cada pedido"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.assinantes: Dict[str, Set[Queue]] = {}
+
+    def assinar(self, pedido_id: str) -> Queue:
+        """Retorna uma fila que recebe as mudanças de status do pedido"""
+        fila = Queue()
+        with self.lock:
+            self.assinantes.setdefault(pedido_id, set()).add(fila)
+        return fila
+
+    def cancelar(self, pedido_id: str, fila: Queue):
+        """Remove a assinatura (cliente desconectou ou stream terminou)"""
+        with self.lock:
+            filas = self.assinantes.get(pedido_id)
+            if filas is not None:
+                filas.discard(fila)
+                if not filas:
+                    del self.assinantes[pedido_id]
+
+    def publicar(self, pedido_id: str, pedido: dict):
+        """Observador de database.db: repassa o novo status aos assinantes"""
+        with self.lock:
+            filas = list(self.assinantes.get(pedido_id, ()))
+        if not filas:
+            return
+
+        evento = {
+            'pedido_id': pedido_id,
+            'status': pedido.get('status'),
+            'data_pagamento': pedido.get('data_pagamento')
+        }
+        for fila in filas:
+            fila.put(evento)
+
+
+# Instância global do canal
+canal_status = CanalStatusPedidos()
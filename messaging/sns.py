@@ -2,79 +2,295 @@
 Simulação de Amazon SNS (Simple Notification Service)
 Implementa tópicos para publicação/assinatura de eventos
 """
-from typing import Dict, List, Callable, Any
-from threading import Lock
-import json
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Lock
+from typing import Dict, List, Callable, Any, Optional
+from messaging.filtros import compilar_politica
+from monitoramento.logs import trace_id_atual, SEM_TRACE
+from monitoramento.metricas import contador, histograma, medidor
+import contextvars
 import logging
+import os
+import time
 
 logger = logging.getLogger(__name__)
 
+# Entregas assíncronas aguardando cada assinante; com o buffer cheio quem
+# publica faz a entrega na própria thread
+CAPACIDADE_BUFFER_ENTREGAS = int(os.environ.get('ESFIHARIA_CAPACIDADE_BUFFER_SNS', '1000'))
+
+_duracao_entrega = histograma(
+    'esfiharia_sns_entrega_segundos', 'Tempo de entrega de uma publicação a cada assinante',
+    ('topico', 'assinante')
+)
+_falhas_entrega = contador(
+    'esfiharia_sns_falhas_total', 'Entregas a assinantes que falharam', ('topico', 'assinante')
+)
+_buffer_cheio = contador(
+    'esfiharia_sns_buffer_cheio_total',
+    'Entregas assíncronas feitas por quem publicou porque o buffer do assinante estava cheio',
+    ('topico', 'assinante')
+)
+
+
+class _Despachante:
+    """
+    Entregas assíncronas a um assinante: executor próprio e buffer limitado
+
+    Cada entrega roda em uma cópia do contexto de quem publicou (o trace ID
+    segue junto). Com concorrencia=1 as entregas saem na ordem de publicação.
+    submeter() retorna False com o buffer cheio ou o despachante encerrado:
+    quem publica entrega na própria thread, então nada se perde e um
+    assinante lento freia os publicadores em vez de acumular memória
+    """
+
+    def __init__(self, nome: str, concorrencia: int, capacidade: int):
+        self.capacidade = capacidade
+        self.pendentes = 0
+        self._condicao = Condition()
+        self._executor = ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix=f'sns-{nome}')
+
+    def submeter(self, entrega: Callable[[], None]) -> bool:
+        with self._condicao:
+            if self.pendentes >= self.capacidade:
+                return False
+            self.pendentes += 1
+        try:
+            self._executor.submit(self._executar, contextvars.copy_context(), entrega)
+        except RuntimeError:
+            # Executor encerrado (fim do processo)
+            self._concluir()
+            return False
+        return True
+
+    def aguardar(self, timeout: Optional[float] = None) -> bool:
+        """Espera as entregas pendentes; retorna False se o timeout expirou antes"""
+        with self._condicao:
+            return self._condicao.wait_for(lambda: self.pendentes == 0, timeout)
+
+    def _executar(self, contexto: contextvars.Context, entrega: Callable[[], None]):
+        try:
+            contexto.run(entrega)
+        finally:
+            self._concluir()
+
+    def _concluir(self):
+        with self._condicao:
+            self.pendentes -= 1
+            if self.pendentes == 0:
+                self._condicao.notify_all()
+
 
 class SNSTopic:
-    """Simula um tópico SNS"""
+    """
+    Simula um tópico SNS
+
+    publish não segura o lock do tópico durante o fan-out: a lista de
+    assinantes é trocada inteira a cada subscribe (cópia na escrita), e quem
+    publica só lê a lista atual. Assinantes síncronos recebem a mensagem na
+    thread de quem publica; assíncronos, pelo próprio _Despachante. A falha
+    de um assinante é contada e registrada sem afetar os outros
+
+    Assinantes com política de filtro (messaging.filtros) só recebem as
+    mensagens que casam com ela; o envelope de uma mensagem só é montado se
+    alguma fila assinante for recebê-la
+    """
     
     def __init__(self, topic_name: str):
         self.topic_name = topic_name
         self.subscribers: List[Dict[str, Any]] = []  # Lista de assinantes (filas SQS ou funções)
         self.lock = Lock()
-        logger.info(f"Tópico SNS criado: {topic_name}")
+        logger.info("Tópico SNS criado: %s", topic_name)
     
-    def publish(self, message: Dict[Any, Any]) -> Dict[str, str]:
+    def publish(self, message: Dict[Any, Any], assincrono: Optional[bool] = None,
+                message_group_id: str = None, message_deduplication_id: str = None) -> Dict[str, str]:
         """
         Publica mensagem no tópico
         Envia para todos os assinantes (fan-out)
+        A mensagem não é copiada nem serializada aqui: o envelope leva o
+        próprio objeto, compartilhado por todos os assinantes, que não devem
+        alterá-lo. Só as filas que gravam fora do processo a serializam
+        O trace ID atual vai no atributo trace_id do envelope
+        assincrono: None usa o modo de cada assinante; True ou False vale
+        para todos (False: todas as entregas terminam antes do retorno)
+        message_group_id e message_deduplication_id seguem para as filas
+        FIFO assinantes (ex.: o pedido_id como grupo)
         """
-        with self.lock:
-            message_id = f"{self.topic_name}-{id(message)}"
-            message_body = {
-                'Message': json.dumps(message),
-                'MessageId': message_id,
-                'TopicArn': f"arn:aws:sns:us-east-1:123456789012:{self.topic_name}"
-            }
-            
-            logger.info(f"Mensagem publicada no tópico {self.topic_name}: {message_id}")
-            
-            # Fan-out: envia para todos os assinantes
-            for subscriber in self.subscribers:
-                try:
-                    if subscriber['type'] == 'sqs':
-                        # Envia para fila SQS
-                        # SNS envia mensagens para SQS no formato: {"Message": "...", "MessageId": "...", ...}
-                        from messaging.sqs import get_queue
-                        queue = get_queue(subscriber['target'])
-                        # Envia o envelope SNS completo (como AWS faz)
-                        queue.send_message(message_body)
-                        logger.info(f"Mensagem enviada para fila SQS: {subscriber['target']}")
-                    
-                    elif subscriber['type'] == 'lambda':
-                        # Invoca função Lambda diretamente
-                        handler = subscriber['handler']
-                        # Passa o conteúdo da mensagem, não o envelope SNS
-                        handler(message, {})
-                        logger.info(f"Função Lambda invocada: {subscriber['target']}")
-                    
-                except Exception as e:
-                    logger.error(f"Erro ao enviar mensagem para {subscriber['target']}: {str(e)}")
-            
-            return {
-                'MessageId': message_id
-            }
+        message_id = f"{self.topic_name}-{id(message)}"
+        message_body = None
+        
+        logger.debug("Mensagem publicada no tópico %s: %s", self.topic_name, message_id)
+        
+        # Fan-out: envia para os assinantes cuja política de filtro casa
+        for subscriber in self.subscribers:
+            filtro = subscriber['filtro']
+            if filtro is not None and not filtro(message):
+                continue
+            if subscriber['type'] == 'sqs':
+                # SNS envia mensagens para SQS no formato: {"Message": "...", "MessageId": "...", ...}
+                # Envia o envelope SNS completo (como AWS faz)
+                if message_body is None:
+                    message_body = self._envelope(message, message_id, trace_id_atual())
+                entrega = (self._enviar_sqs, message_body, message_group_id, message_deduplication_id)
+            else:
+                # Passa o conteúdo da mensagem, não o envelope SNS
+                entrega = (self._invocar_lambda, [message])
+            self._despachar(subscriber, assincrono, *entrega)
+        
+        return {
+            'MessageId': message_id
+        }
     
-    def subscribe(self, subscriber_type: str, target: str, handler: Callable = None):
+    def publish_batch(self, entries: List[Dict[str, Any]], assincrono: Optional[bool] = None) -> Dict[str, list]:
+        """
+        Publica várias mensagens no tópico de uma vez
+        entries: lista de {'Id': ..., 'Message': {...}}, com 'MessageGroupId' e
+        'MessageDeduplicationId' opcionais para as filas FIFO assinantes
+        Filas SQS assinantes recebem em um único send_message_batch as
+        mensagens do lote que casam com a sua política de filtro
+        assincrono: como em publish
+        """
+        message_ids = [f"{self.topic_name}-{id(entry['Message'])}" for entry in entries]
+        envelopes = [None] * len(entries)
+        trace_id = trace_id_atual()
+
+        logger.debug("%d mensagens publicadas no tópico %s", len(entries), self.topic_name)
+
+        for subscriber in self.subscribers:
+            filtro = subscriber['filtro']
+            indices = [i for i, entry in enumerate(entries) if filtro is None or filtro(entry['Message'])]
+            if not indices:
+                continue
+            if subscriber['type'] == 'sqs':
+                for i in indices:
+                    if envelopes[i] is None:
+                        envelopes[i] = {
+                            'Id': entries[i]['Id'],
+                            'MessageBody': self._envelope(entries[i]['Message'], message_ids[i], trace_id)
+                        }
+                        for atributo in ('MessageGroupId', 'MessageDeduplicationId'):
+                            if atributo in entries[i]:
+                                envelopes[i][atributo] = entries[i][atributo]
+                entrega = (self._enviar_lote_sqs, [envelopes[i] for i in indices])
+            else:
+                entrega = (self._invocar_lambda, [entries[i]['Message'] for i in indices])
+            self._despachar(subscriber, assincrono, *entrega)
+
+        successful = [{'Id': entry['Id'], 'MessageId': message_id}
+                      for entry, message_id in zip(entries, message_ids)]
+
+        return {'Successful': successful, 'Failed': []}
+
+    def _despachar(self, subscriber: Dict[str, Any], assincrono: Optional[bool], funcao: Callable, *args):
+        """Entrega agora ou pelo despachante do assinante, conforme o modo"""
+        despachante = subscriber['despachante']
+        if assincrono is None:
+            assincrono = despachante is not None
+        elif assincrono and despachante is None:
+            # Assinante síncrono recebendo uma publicação assíncrona
+            with self.lock:
+                if subscriber['despachante'] is None:
+                    subscriber['despachante'] = self._criar_despachante(subscriber)
+                despachante = subscriber['despachante']
+        if assincrono:
+            if despachante.submeter(lambda: self._entregar(subscriber, funcao, *args)):
+                return
+            _buffer_cheio.inc(topico=self.topic_name, assinante=subscriber['target'])
+        self._entregar(subscriber, funcao, *args)
+
+    def _entregar(self, subscriber: Dict[str, Any], funcao: Callable, *args):
+        """Executa uma entrega, medindo a duração e isolando a falha"""
+        inicio = time.perf_counter()
+        try:
+            funcao(subscriber, *args)
+        except Exception as e:
+            _falhas_entrega.inc(topico=self.topic_name, assinante=subscriber['target'])
+            logger.error("Erro ao enviar mensagem para %s: %s", subscriber['target'], e)
+        _duracao_entrega.observar(
+            time.perf_counter() - inicio, topico=self.topic_name, assinante=subscriber['target']
+        )
+
+    @staticmethod
+    def _enviar_sqs(subscriber: Dict[str, Any], message_body: Dict[str, Any], message_group_id: str = None,
+                    message_deduplication_id: str = None):
+        from messaging.sqs import get_queue
+        get_queue(subscriber['target']).send_message(message_body, message_group_id, message_deduplication_id)
+        logger.debug("Mensagem enviada para fila SQS: %s", subscriber['target'])
+
+    @staticmethod
+    def _enviar_lote_sqs(subscriber: Dict[str, Any], envelopes: List[Dict[str, Any]]):
+        from messaging.sqs import get_queue
+        resultado = get_queue(subscriber['target']).send_message_batch(envelopes)
+        if resultado['Failed']:
+            raise ValueError(f"{len(resultado['Failed'])} mensagens recusadas: {resultado['Failed'][0]['Message']}")
+        logger.debug("Lote enviado para fila SQS: %s", subscriber['target'])
+
+    @staticmethod
+    def _invocar_lambda(subscriber: Dict[str, Any], mensagens: List[Any]):
+        # Handlers Lambda sinalizam erro com statusCode >= 500 em vez de levantar
+        falhas = 0
+        for mensagem in mensagens:
+            resultado = subscriber['handler'](mensagem, {})
+            if isinstance(resultado, dict) and resultado.get('statusCode', 200) >= 500:
+                falhas += 1
+        logger.debug("Função Lambda invocada %d vezes: %s", len(mensagens), subscriber['target'])
+        if falhas:
+            raise RuntimeError(f"{falhas} de {len(mensagens)} invocações retornaram erro")
+
+    def _envelope(self, message: Any, message_id: str, trace_id: str) -> Dict[str, Any]:
+        envelope = {
+            'Message': message,
+            'MessageId': message_id,
+            'TopicArn': f"arn:aws:sns:us-east-1:123456789012:{self.topic_name}"
+        }
+        if trace_id != SEM_TRACE:
+            envelope['MessageAttributes'] = {'trace_id': {'Type': 'String', 'Value': trace_id}}
+        return envelope
+
+    def _criar_despachante(self, subscriber: Dict[str, Any], concorrencia: int = 1,
+                           capacidade: int = None) -> _Despachante:
+        return _Despachante(f"{self.topic_name}-{subscriber['target']}", concorrencia,
+                            capacidade or CAPACIDADE_BUFFER_ENTREGAS)
+
+    def subscribe(self, subscriber_type: str, target: str, handler: Callable = None,
+                  assincrono: bool = False, concorrencia: int = 1, capacidade: int = None,
+                  filter_policy: Dict[str, Any] = None):
         """
         Adiciona um assinante ao tópico
         subscriber_type: 'sqs' ou 'lambda'
         target: nome da fila ou função
         handler: função Lambda (se tipo for 'lambda')
+        assincrono: entrega pelo executor do assinante, com `concorrencia`
+        threads e até `capacidade` entregas pendentes
+        (padrão CAPACIDADE_BUFFER_ENTREGAS), sem esperar o handler
+        filter_policy: política de filtro (messaging.filtros); compilada
+        aqui, levanta ValueError se for inválida
         """
+        subscriber = {
+            'type': subscriber_type,
+            'target': target,
+            'handler': handler,
+            'despachante': None,
+            'filter_policy': filter_policy,
+            'filtro': compilar_politica(filter_policy) if filter_policy is not None else None
+        }
+        if assincrono:
+            subscriber['despachante'] = self._criar_despachante(subscriber, concorrencia, capacidade)
         with self.lock:
-            subscriber = {
-                'type': subscriber_type,
-                'target': target,
-                'handler': handler
-            }
-            self.subscribers.append(subscriber)
-            logger.info(f"Assinante adicionado ao tópico {self.topic_name}: {target} ({subscriber_type})")
+            # Lista nova: publicações em andamento continuam com a anterior
+            self.subscribers = self.subscribers + [subscriber]
+        logger.info("Assinante adicionado ao tópico %s: %s (%s%s%s)", self.topic_name, target, subscriber_type,
+                    ', assíncrono' if assincrono else '', ', com filtro' if filter_policy else '')
+
+    def aguardar_entregas(self, timeout: Optional[float] = None) -> bool:
+        """Espera as entregas assíncronas pendentes; False se o timeout expirou"""
+        limite = None if timeout is None else time.monotonic() + timeout
+        for subscriber in self.subscribers:
+            despachante = subscriber['despachante']
+            restante = None if limite is None else max(limite - time.monotonic(), 0)
+            if despachante is not None and not despachante.aguardar(restante):
+                return False
+        return True
 
 
 # Instâncias globais dos tópicos
@@ -94,3 +310,20 @@ def get_all_topics() -> Dict[str, SNSTopic]:
     """Retorna todos os tópicos criados"""
     return _topicos
 
+
+def aguardar_entregas(timeout: Optional[float] = None) -> bool:
+    """Espera as entregas assíncronas de todos os tópicos (ex.: ao encerrar o worker)"""
+    limite = None if timeout is None else time.monotonic() + timeout
+    for topico in list(_topicos.values()):
+        if not topico.aguardar_entregas(None if limite is None else max(limite - time.monotonic(), 0)):
+            return False
+    return True
+
+
+medidor(
+    'esfiharia_sns_entregas_pendentes', 'Entregas assíncronas aguardando cada assinante',
+    ('topico', 'assinante'),
+    lambda: {(nome, subscriber['target']): subscriber['despachante'].pendentes
+             for nome, topico in list(_topicos.items())
+             for subscriber in topico.subscribers if subscriber['despachante'] is not None}
+)
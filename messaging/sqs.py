@@ -2,64 +2,519 @@
 Simulação de Amazon SQS (Simple Queue Service)
 Implementa filas de mensagens para processamento assíncrono
 """
-from queue import Queue
-from threading import Lock
-from typing import Dict, Any
+from collections import OrderedDict, deque
+from threading import Condition, Lock
+from typing import Dict, Any, List, Optional
+import hashlib
+import heapq
+import itertools
 import json
 import logging
+import os
+import time
+import uuid
+from messaging.codec import get_codec
+from monitoramento.metricas import contador, histograma, medidor
 
 logger = logging.getLogger(__name__)
 
+# Backend das filas:
+# - 'sqlite': durável e compartilhado entre processos (API e workers)
+# - 'memoria': filas locais ao processo
+BACKEND_FILAS = os.environ.get('ESFIHARIA_BACKEND_FILAS', 'sqlite')
+ARQUIVO_FILAS = os.environ.get('ESFIHARIA_ARQUIVO_FILAS', 'data/filas.db')
+# Janela (s) em que uma mensagem repetida de uma fila FIFO é descartada
+JANELA_DEDUPLICACAO_FIFO = float(os.environ.get('ESFIHARIA_JANELA_DEDUPLICACAO_FIFO', '300'))
+# Maior DelaySeconds aceito (15 minutos, como no SQS)
+ATRASO_MAXIMO = 900
+
+tempo_na_fila = histograma(
+    'esfiharia_sqs_tempo_na_fila_segundos', 'Tempo entre o envio e o recebimento de uma mensagem', ('fila',)
+)
+duplicadas = contador(
+    'esfiharia_sqs_duplicadas_total', 'Mensagens descartadas pela deduplicação das filas FIFO', ('fila',)
+)
+
+
+def id_deduplicacao(message_body: Any) -> str:
+    """
+    MessageDeduplicationId pelo conteúdo (content_based_deduplication):
+    SHA-256 do corpo em JSON canônico, igual em qualquer processo ou codec
+    """
+    canonico = json.dumps(message_body, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonico.encode('utf-8')).hexdigest()
+
+
+def md5_corpo(corpo: bytes) -> str:
+    """MD5OfBody: MD5 (hexadecimal) do corpo codificado, como no SQS real"""
+    return hashlib.md5(corpo).hexdigest()
+
+
+class _MD5SobDemanda(dict):
+    """
+    Mensagem ou resposta de envio da fila em memória: o MD5OfBody só é
+    calculado (codificando o corpo) na primeira leitura, então o envio e a
+    entrega dentro do processo continuam sem serialização
+    """
+
+    # Respostas de envio não têm 'Body': o corpo fica em _corpo
+    __slots__ = ('_corpo',)
+
+    def __missing__(self, chave):
+        if chave != 'MD5OfBody':
+            raise KeyError(chave)
+        corpo = dict.get(self, 'Body') if dict.__contains__(self, 'Body') else self._corpo
+        md5 = self['MD5OfBody'] = md5_corpo(get_codec().codificar(corpo))
+        return md5
+
+    def __contains__(self, chave) -> bool:
+        return chave == 'MD5OfBody' or super().__contains__(chave)
+
+    def get(self, chave, padrao=None):
+        return self[chave] if chave in self else padrao
+
+
+def _resposta_envio(corpo: Any, campos: dict) -> _MD5SobDemanda:
+    resposta = _MD5SobDemanda(campos)
+    resposta._corpo = corpo
+    return resposta
+
+
+def validar_atraso(queue_name: str, delay_seconds: Optional[float], padrao: float) -> float:
+    """DelaySeconds de uma mensagem (None = o da fila); levanta ValueError fora de [0, ATRASO_MAXIMO]"""
+    if delay_seconds is None:
+        return padrao
+    if not 0 <= delay_seconds <= ATRASO_MAXIMO:
+        raise ValueError(f"DelaySeconds deve estar entre 0 e {ATRASO_MAXIMO} na fila {queue_name}")
+    return delay_seconds
+
+
+def validar_fifo(queue_name: str, message_body: Any, message_group_id: Optional[str],
+                 message_deduplication_id: Optional[str], content_based_deduplication: bool) -> str:
+    """
+    Confere os atributos de uma mensagem enviada a uma fila FIFO
+    Retorna o MessageDeduplicationId (o informado ou o do conteúdo)
+    Levanta ValueError se faltar MessageGroupId ou MessageDeduplicationId
+    """
+    if not message_group_id:
+        raise ValueError(f"MessageGroupId é obrigatório na fila FIFO {queue_name}")
+    if message_deduplication_id:
+        return message_deduplication_id
+    if not content_based_deduplication:
+        raise ValueError(f"MessageDeduplicationId é obrigatório na fila FIFO {queue_name} "
+                         f"(sem content_based_deduplication)")
+    return id_deduplicacao(message_body)
+
+
+def observar_recebimento(queue_name: str, messages: list):
+    """Registra o tempo que cada mensagem recebida esperou na fila"""
+    agora = time.time() * 1000
+    for message in messages:
+        tempo_na_fila.observar(
+            max(agora - message['Attributes']['SentTimestamp'], 0) / 1000, fila=queue_name
+        )
+
 
 class SQSQueue:
-    """Simula uma fila SQS"""
-    
-    def __init__(self, queue_name: str):
+    """
+    Simula uma fila SQS
+
+    Mensagens recebidas ficam "em voo" (invisíveis) até serem removidas com
+    o ReceiptHandle ou até o visibility timeout expirar, quando voltam para
+    a fila. Após max_receive_count recebimentos sem remoção, a mensagem vai
+    para a dead-letter queue (se configurada).
+
+    As mensagens nunca saem do processo, então não são serializadas: o
+    Body entregue é o próprio objeto enviado (consumidores não devem
+    alterá-lo). O MD5OfBody das respostas e mensagens é o do corpo
+    codificado com o codec padrão, como no backend SQLite, mas só é
+    calculado se alguém o ler (_MD5SobDemanda).
+
+    Mensagens enviadas com DelaySeconds (ou com o delay_seconds da fila)
+    esperam em um heap por prazo: agendar custa O(log n) e nenhuma thread
+    acorda periodicamente. Quem está em long polling dorme até o menor
+    prazo (de uma atrasada ou de uma mensagem em voo) e, ao receber, as
+    atrasadas vencidas passam para a fila.
+    """
+
+    def __init__(self, queue_name: str, visibility_timeout: float = 30,
+                 max_receive_count: int = None, dead_letter_queue: str = None, delay_seconds: float = 0):
         self.queue_name = queue_name
-        self.queue = Queue()
+        self.visibility_timeout = visibility_timeout
+        self.max_receive_count = max_receive_count
+        self.dead_letter_queue = dead_letter_queue
+        self.delay_seconds = validar_atraso(queue_name, delay_seconds, 0)
+        self.queue = deque()
         self.lock = Lock()
-        logger.info(f"Fila SQS criada: {queue_name}")
-    
-    def send_message(self, message_body: Dict[Any, Any]) -> Dict[str, str]:
+        # Acorda consumidores em long polling assim que chega mensagem
+        self.disponivel = Condition(self.lock)
+        # receipt_handle -> (mensagem, prazo de visibilidade)
+        self.em_voo: Dict[str, tuple] = {}
+        # Heap de (prazo, receipt_handle); entradas removidas ou com prazo
+        # alterado são descartadas ao chegar no topo
+        self._prazos: List[tuple] = []
+        # Heap de (visível em, sequência, item) das mensagens atrasadas
+        self._atrasadas: List[tuple] = []
+        self._sequencia = itertools.count()
+        logger.info("Fila SQS criada: %s", queue_name)
+
+    def send_message(self, message_body: Dict[Any, Any], message_group_id: str = None,
+                     message_deduplication_id: str = None, delay_seconds: float = None) -> Dict[str, str]:
         """
         Envia mensagem para a fila
+        message_group_id e message_deduplication_id só valem para filas FIFO
+        delay_seconds: a mensagem só fica visível depois desse tempo
+        (None = delay_seconds da fila; máximo ATRASO_MAXIMO)
         Retorna um dicionário com MessageId similar ao SQS real
         """
         with self.lock:
-            message = {
-                'Body': json.dumps(message_body),
-                'MessageId': f"{self.queue_name}-{id(message_body)}"
-            }
-            self.queue.put(message)
-            logger.info(f"Mensagem enviada para {self.queue_name}: {message['MessageId']}")
-            return {
-                'MessageId': message['MessageId'],
-                'MD5OfBody': str(hash(json.dumps(message_body)))
-            }
-    
-    def receive_message(self, max_number_of_messages: int = 1) -> list:
+            message_id = self._enviar(message_body, message_group_id, message_deduplication_id,
+                                      validar_atraso(self.queue_name, delay_seconds, self.delay_seconds))
+        logger.debug("Mensagem enviada para %s: %s", self.queue_name, message_id)
+        return _resposta_envio(message_body, {
+            'MessageId': message_id
+        })
+
+    def send_message_batch(self, entries: List[Dict[str, Any]]) -> Dict[str, list]:
+        """
+        Envia várias mensagens com uma única aquisição do lock
+        entries: lista de {'Id': ..., 'MessageBody': {...}}, com 'DelaySeconds'
+        opcional e, em filas FIFO, 'MessageGroupId' e 'MessageDeduplicationId'
+        """
+        successful, failed = [], []
+        with self.lock:
+            for entry in entries:
+                try:
+                    atraso = validar_atraso(self.queue_name, entry.get('DelaySeconds'), self.delay_seconds)
+                except ValueError as e:
+                    failed.append({'Id': entry['Id'], 'Code': 'InvalidParameterValue', 'Message': str(e)})
+                    continue
+                try:
+                    message_id = self._enviar(entry['MessageBody'], entry.get('MessageGroupId'),
+                                              entry.get('MessageDeduplicationId'), atraso)
+                except ValueError as e:
+                    failed.append({'Id': entry['Id'], 'Code': 'MissingParameter', 'Message': str(e)})
+                    continue
+                successful.append(_resposta_envio(entry['MessageBody'], {
+                    'Id': entry['Id'],
+                    'MessageId': message_id
+                }))
+        logger.debug("%d mensagens enviadas para %s", len(successful), self.queue_name)
+        return {'Successful': successful, 'Failed': failed}
+
+    def receive_message(self, max_number_of_messages: int = 1, wait_time_seconds: float = 0,
+                        visibility_timeout: float = None) -> list:
         """
         Recebe mensagens da fila
+        Com wait_time_seconds > 0 aguarda (long polling) até chegar ao menos
+        uma mensagem ou o tempo esgotar
+        As mensagens ficam invisíveis por visibility_timeout segundos e devem
+        ser removidas com delete_message(ReceiptHandle)
         Retorna lista de mensagens no formato SQS
         """
+        if visibility_timeout is None:
+            visibility_timeout = self.visibility_timeout
+
         messages = []
         with self.lock:
-            for _ in range(max_number_of_messages):
-                if not self.queue.empty():
-                    message = self.queue.get()
-                    messages.append(message)
-                    logger.info(f"Mensagem recebida de {self.queue_name}: {message['MessageId']}")
-        
+            mortas = self._recuperar_expiradas()
+            if wait_time_seconds > 0:
+                prazo = time.monotonic() + wait_time_seconds
+                while not self.queue:
+                    agora = time.monotonic()
+                    restante = prazo - agora
+                    if restante <= 0:
+                        break
+                    # Acorda também quando a próxima mensagem em voo expirar
+                    # ou a próxima atrasada ficar visível
+                    if self._prazos:
+                        restante = min(restante, max(self._prazos[0][0] - agora, 0))
+                    if self._atrasadas:
+                        restante = min(restante, max(self._atrasadas[0][0] - agora, 0))
+                    self.disponivel.wait(restante)
+                    mortas += self._recuperar_expiradas()
+
+            agora = time.monotonic()
+            while self.queue and len(messages) < max_number_of_messages:
+                message = self._proxima()
+                message['Attributes']['ApproximateReceiveCount'] += 1
+                receipt_handle = str(uuid.uuid4())
+                deadline = agora + visibility_timeout
+                self.em_voo[receipt_handle] = (message, deadline)
+                heapq.heappush(self._prazos, (deadline, receipt_handle))
+                messages.append(self._entregar(message, receipt_handle))
+
+            if messages and self._prazos[0][0] == deadline:
+                # O novo prazo é o mais próximo: consumidores em espera recalculam o timeout
+                self.disponivel.notify_all()
+
+        self._mover_para_dlq(mortas)
+        observar_recebimento(self.queue_name, messages)
+        if messages and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Mensagens recebidas de %s: %s", self.queue_name,
+                         [message['MessageId'] for message in messages])
         return messages
-    
-    def delete_message(self, receipt_handle: str):
-        """Remove mensagem da fila (simulado)"""
-        logger.info(f"Mensagem deletada de {self.queue_name}: {receipt_handle}")
-        # Em uma implementação real, precisaríamos rastrear receipt_handles
-    
+
+    def delete_message(self, receipt_handle: str) -> bool:
+        """
+        Remove definitivamente uma mensagem recebida
+        Retorna False se o receipt_handle não é válido (ex.: visibilidade expirou)
+        """
+        with self.lock:
+            removida = self.em_voo.pop(receipt_handle, None)
+            if removida is not None:
+                self._liberar(removida[0])
+        if removida is None:
+            logger.warning("ReceiptHandle inválido em %s: %s", self.queue_name, receipt_handle)
+            return False
+        logger.debug("Mensagem deletada de %s: %s", self.queue_name, removida[0]['MessageId'])
+        return True
+
+    def delete_message_batch(self, entries: List[Dict[str, str]]) -> Dict[str, list]:
+        """
+        Remove várias mensagens da fila
+        entries: lista de {'Id': ..., 'ReceiptHandle': ...}
+        """
+        successful, failed = [], []
+        with self.lock:
+            for entry in entries:
+                removida = self.em_voo.pop(entry['ReceiptHandle'], None)
+                if removida is not None:
+                    self._liberar(removida[0])
+                    successful.append({'Id': entry['Id']})
+                else:
+                    failed.append({'Id': entry['Id'], 'Code': 'ReceiptHandleIsInvalid'})
+        logger.debug("%d mensagens deletadas de %s", len(successful), self.queue_name)
+        return {'Successful': successful, 'Failed': failed}
+
+    def change_message_visibility(self, receipt_handle: str, visibility_timeout: float) -> bool:
+        """Altera o prazo de visibilidade de uma mensagem em voo"""
+        with self.lock:
+            if receipt_handle not in self.em_voo:
+                return False
+            message, _ = self.em_voo[receipt_handle]
+            deadline = time.monotonic() + visibility_timeout
+            self.em_voo[receipt_handle] = (message, deadline)
+            heapq.heappush(self._prazos, (deadline, receipt_handle))
+            self.disponivel.notify_all()
+        if visibility_timeout <= 0:
+            # Devolve a mensagem imediatamente para a fila
+            self._mover_para_dlq(self._recuperar_com_lock())
+        return True
+
+    def get_queue_size(self) -> int:
+        """Retorna o tamanho atual da fila (mensagens visíveis)"""
+        return len(self.queue)
+
+    def get_in_flight_count(self) -> int:
+        """Retorna a quantidade de mensagens recebidas e ainda não removidas"""
+        return len(self.em_voo)
+
+    def get_delayed_count(self) -> int:
+        """Retorna a quantidade de mensagens atrasadas (DelaySeconds) ainda não visíveis"""
+        return len(self._atrasadas)
+
+    def _enviar(self, message_body: Any, message_group_id: Optional[str],
+                message_deduplication_id: Optional[str], delay_seconds: float) -> str:
+        """Cria e enfileira (ou agenda) uma mensagem (com o lock); retorna o MessageId"""
+        message = self._criar_mensagem(message_body)
+        if delay_seconds > 0:
+            self._agendar(time.monotonic() + delay_seconds, message)
+        else:
+            self._enfileirar(message)
+        return message['MessageId']
+
+    def _agendar(self, visivel_em: float, item: Any):
+        """Guarda um item até visivel_em; ao vencer, vai para _vencer (com o lock)"""
+        entrada = (visivel_em, next(self._sequencia), item)
+        heapq.heappush(self._atrasadas, entrada)
+        if self._atrasadas[0] is entrada:
+            # Novo menor prazo: consumidores em espera recalculam o timeout
+            self.disponivel.notify_all()
+
+    def _vencer(self, item: Any):
+        """Mensagem atrasada cujo prazo chegou (com o lock)"""
+        self._enfileirar(item)
+
+    def _enfileirar(self, message: Dict[str, Any]):
+        """Torna uma mensagem nova visível (com o lock)"""
+        self.queue.append(message)
+        self.disponivel.notify()
+
+    def _proxima(self) -> Dict[str, Any]:
+        """Retira a próxima mensagem visível (com o lock e self.queue não vazia)"""
+        return self.queue.popleft()
+
+    def _devolver(self, message: Dict[str, Any]):
+        """Devolve à frente da fila uma mensagem cuja visibilidade expirou (com o lock)"""
+        self.queue.appendleft(message)
+        self.disponivel.notify()
+
+    def _liberar(self, message: Dict[str, Any]):
+        """Mensagem em voo removida ou movida para a DLQ (com o lock)"""
+
+    def _criar_mensagem(self, message_body: Dict[Any, Any]) -> Dict[str, Any]:
+        return _MD5SobDemanda({
+            'Body': message_body,
+            'MessageId': f"{self.queue_name}-{uuid.uuid4()}",
+            'Attributes': {
+                'ApproximateReceiveCount': 0,
+                'SentTimestamp': int(time.time() * 1000)
+            }
+        })
+
+    @staticmethod
+    def _entregar(message: Dict[str, Any], receipt_handle: str) -> Dict[str, Any]:
+        entregue = _MD5SobDemanda(message)
+        entregue['ReceiptHandle'] = receipt_handle
+        entregue['Attributes'] = dict(message['Attributes'])
+        return entregue
+
+    def _recuperar_com_lock(self) -> list:
+        with self.lock:
+            return self._recuperar_expiradas()
+
+    def _recuperar_expiradas(self) -> list:
+        """
+        Devolve para a fila as mensagens cuja visibilidade expirou e as
+        atrasadas cujo prazo chegou
+        Custo O(k log n) para k expiradas; deve ser chamado com o lock
+        Retorna as mensagens que excederam max_receive_count
+        """
+        agora = time.monotonic()
+        while self._atrasadas and self._atrasadas[0][0] <= agora:
+            self._vencer(heapq.heappop(self._atrasadas)[2])
+
+        mortas = []
+        while self._prazos and self._prazos[0][0] <= agora:
+            deadline, receipt_handle = heapq.heappop(self._prazos)
+            em_voo = self.em_voo.get(receipt_handle)
+            if em_voo is None or em_voo[1] != deadline:
+                continue  # Já removida ou com visibilidade alterada
+            del self.em_voo[receipt_handle]
+            message = em_voo[0]
+
+            if (self.max_receive_count is not None and self.dead_letter_queue
+                    and message['Attributes']['ApproximateReceiveCount'] >= self.max_receive_count):
+                mortas.append(message)
+                self._liberar(message)
+            else:
+                self._devolver(message)
+        return mortas
+
+    def _mover_para_dlq(self, mensagens: list):
+        """Envia mensagens esgotadas para a dead-letter queue (fora do lock da fila)"""
+        if not mensagens:
+            return
+        dlq = get_queue(self.dead_letter_queue)
+        with dlq.lock:
+            for message in mensagens:
+                dlq._enfileirar(message)
+        for message in mensagens:
+            logger.warning("Mensagem %s movida de %s para a DLQ %s",
+                           message['MessageId'], self.queue_name, self.dead_letter_queue)
+
+
+class SQSQueueFIFO(SQSQueue):
+    """
+    Fila SQS FIFO em memória
+
+    Cada mensagem pertence a um grupo (MessageGroupId, ex.: o pedido_id).
+    Dentro de um grupo as mensagens são entregues na ordem de envio e só uma
+    fica em voo por vez: a seguinte só é entregue depois que a anterior for
+    removida, ou volta a ser a primeira se a visibilidade expirar. Grupos
+    diferentes são entregues em paralelo, na ordem em que ficaram prontos.
+
+    Mensagens com o mesmo MessageDeduplicationId (ou, com
+    content_based_deduplication, o mesmo conteúdo) enviadas dentro de
+    JANELA_DEDUPLICACAO_FIFO segundos são aceitas mas não enfileiradas de novo.
+
+    Uma mensagem atrasada (DelaySeconds) no início do grupo segura as
+    seguintes até ficar visível, preservando a ordem; o heap de atrasadas
+    guarda o grupo, então get_delayed_count conta os grupos bloqueados.
+
+    self.queue guarda os grupos prontos (com mensagens e nenhuma em voo);
+    as mensagens ficam em uma deque por grupo, como (visível em, mensagem).
+    """
+
+    def __init__(self, queue_name: str, visibility_timeout: float = 30, max_receive_count: int = None,
+                 dead_letter_queue: str = None, delay_seconds: float = 0,
+                 content_based_deduplication: bool = False):
+        super().__init__(queue_name, visibility_timeout, max_receive_count, dead_letter_queue, delay_seconds)
+        self.content_based_deduplication = content_based_deduplication
+        self.grupos: Dict[str, deque] = {}
+        self._em_voo_grupos = set()
+        self._aguardando = 0
+        # MessageDeduplicationId -> (MessageId, expira em), em ordem de envio
+        self._deduplicacao: OrderedDict = OrderedDict()
+
     def get_queue_size(self) -> int:
-        """Retorna o tamanho atual da fila"""
-        return self.queue.qsize()
+        """Retorna o tamanho atual da fila (mensagens aguardando, inclusive de grupos com mensagem em voo)"""
+        return self._aguardando
+
+    def _enviar(self, message_body: Any, message_group_id: Optional[str],
+                message_deduplication_id: Optional[str], delay_seconds: float) -> str:
+        dedup_id = validar_fifo(self.queue_name, message_body, message_group_id, message_deduplication_id,
+                                self.content_based_deduplication)
+        agora = time.monotonic()
+        while self._deduplicacao:
+            _, (_, expira) = next(iter(self._deduplicacao.items()))
+            if expira > agora:
+                break
+            self._deduplicacao.popitem(last=False)
+        anterior = self._deduplicacao.get(dedup_id)
+        if anterior is not None:
+            duplicadas.inc(fila=self.queue_name)
+            return anterior[0]
+
+        message = self._criar_mensagem(message_body)
+        message['Attributes']['MessageGroupId'] = message_group_id
+        message['Attributes']['MessageDeduplicationId'] = dedup_id
+        self._deduplicacao[dedup_id] = (message['MessageId'], agora + JANELA_DEDUPLICACAO_FIFO)
+        self._enfileirar(message, agora + delay_seconds if delay_seconds > 0 else 0)
+        return message['MessageId']
+
+    def _enfileirar(self, message: Dict[str, Any], visivel_em: float = 0):
+        grupo = message['Attributes']['MessageGroupId']
+        mensagens = self.grupos.get(grupo)
+        if mensagens is None:
+            mensagens = self.grupos[grupo] = deque()
+        mensagens.append((visivel_em, message))
+        self._aguardando += 1
+        if len(mensagens) == 1 and grupo not in self._em_voo_grupos:
+            self._vencer(grupo)
+
+    def _vencer(self, grupo: str):
+        """A primeira mensagem do grupo mudou ou ficou visível: pronto ou agendado (com o lock)"""
+        visivel_em = self.grupos[grupo][0][0]
+        if visivel_em > time.monotonic():
+            self._agendar(visivel_em, grupo)
+        else:
+            self.queue.append(grupo)
+            self.disponivel.notify()
+
+    def _proxima(self) -> Dict[str, Any]:
+        grupo = self.queue.popleft()
+        self._em_voo_grupos.add(grupo)
+        self._aguardando -= 1
+        return self.grupos[grupo].popleft()[1]
+
+    def _devolver(self, message: Dict[str, Any]):
+        # Volta a ser a primeira do grupo, que fica pronto de novo
+        grupo = message['Attributes']['MessageGroupId']
+        self.grupos[grupo].appendleft((0, message))
+        self._aguardando += 1
+        self._em_voo_grupos.discard(grupo)
+        self.queue.appendleft(grupo)
+        self.disponivel.notify()
+
+    def _liberar(self, message: Dict[str, Any]):
+        grupo = message['Attributes']['MessageGroupId']
+        self._em_voo_grupos.discard(grupo)
+        if self.grupos[grupo]:
+            self._vencer(grupo)
+        else:
+            del self.grupos[grupo]
 
 
 # Instâncias globais das filas
@@ -67,11 +522,24 @@ _filas = {}
 _lock = Lock()
 
 
-def get_queue(queue_name: str) -> SQSQueue:
-    """Obtém ou cria uma fila SQS"""
+def get_queue(queue_name: str, **atributos) -> SQSQueue:
+    """
+    Obtém ou cria uma fila SQS no backend configurado (BACKEND_FILAS)
+    atributos (visibility_timeout, max_receive_count, dead_letter_queue,
+    delay_seconds, fifo, content_based_deduplication) só são usados na
+    criação da fila
+    Filas com nome terminado em '.fifo' são FIFO, como no SQS
+    """
     with _lock:
         if queue_name not in _filas:
-            _filas[queue_name] = SQSQueue(queue_name)
+            fifo = atributos.pop('fifo', False) or queue_name.endswith('.fifo')
+            if BACKEND_FILAS == 'sqlite':
+                from messaging.sqs_sqlite import SQSQueueSQLite
+                _filas[queue_name] = SQSQueueSQLite(queue_name, ARQUIVO_FILAS, fifo=fifo, **atributos)
+            elif fifo:
+                _filas[queue_name] = SQSQueueFIFO(queue_name, **atributos)
+            else:
+                _filas[queue_name] = SQSQueue(queue_name, **atributos)
         return _filas[queue_name]
 
 
@@ -79,3 +547,16 @@ def get_all_queues() -> Dict[str, SQSQueue]:
     """Retorna todas as filas criadas"""
     return _filas
 
+
+medidor(
+    'esfiharia_sqs_mensagens_visiveis', 'Mensagens aguardando recebimento (get_queue_size)', ('fila',),
+    lambda: {(nome,): fila.get_queue_size() for nome, fila in list(_filas.items())}
+)
+medidor(
+    'esfiharia_sqs_mensagens_em_voo', 'Mensagens recebidas e ainda não removidas', ('fila',),
+    lambda: {(nome,): fila.get_in_flight_count() for nome, fila in list(_filas.items())}
+)
+medidor(
+    'esfiharia_sqs_mensagens_atrasadas', 'Mensagens enviadas com DelaySeconds ainda não visíveis', ('fila',),
+    lambda: {(nome,): fila.get_delayed_count() for nome, fila in list(_filas.items())}
+)
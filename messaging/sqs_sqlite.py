@@ -0,0 +1,378 @@
+"""
+Backend durável das filas SQS em SQLite (data/filas.db)
+Permite que vários processos (API e workers) produzam e consumam as
+mesmas filas com segurança
+"""
+from pathlib import Path
+from threading import Condition, local
+from typing import Dict, Any, List
+import logging
+import sqlite3
+import time
+import uuid
+from messaging.codec import get_codec
+from messaging.sqs import (JANELA_DEDUPLICACAO_FIFO, duplicadas, md5_corpo, observar_recebimento,
+                           validar_atraso, validar_fifo)
+
+logger = logging.getLogger(__name__)
+
+# Intervalo máximo (s) entre verificações de mensagens vindas de outros processos
+# durante o long polling; mensagens do próprio processo acordam na hora
+INTERVALO_MAXIMO_POLLING = 0.05
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS mensagens (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fila TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    body TEXT NOT NULL,
+    codec TEXT NOT NULL DEFAULT 'json',
+    md5 TEXT NOT NULL,
+    enviada_em INTEGER NOT NULL,
+    visivel_em REAL NOT NULL,
+    recebimentos INTEGER NOT NULL DEFAULT 0,
+    receipt_handle TEXT,
+    grupo TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_mensagens_visiveis ON mensagens (fila, visivel_em, id);
+CREATE INDEX IF NOT EXISTS idx_mensagens_receipt ON mensagens (receipt_handle);
+CREATE TABLE IF NOT EXISTS deduplicacao (
+    fila TEXT NOT NULL,
+    dedup_id TEXT NOT NULL,
+    message_id TEXT NOT NULL,
+    expira_em REAL NOT NULL,
+    PRIMARY KEY (fila, dedup_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_deduplicacao_expira ON deduplicacao (fila, expira_em);
+"""
+
+# Mensagens visíveis que podem ser entregues. Em filas FIFO só a primeira
+# mensagem de cada grupo: enquanto ela estiver em voo (ainda na tabela) as
+# seguintes não são as de menor id. Mensagens sem grupo (gravadas antes de a
+# fila ser FIFO) não bloqueiam nada
+_ENTREGAVEIS = 'FROM mensagens WHERE fila = ? AND visivel_em <= ?'
+_ENTREGAVEIS_FIFO = (
+    'FROM mensagens AS m WHERE fila = ? AND visivel_em <= ? AND (grupo IS NULL OR id = '
+    '(SELECT MIN(id) FROM mensagens WHERE fila = m.fila AND grupo = m.grupo))'
+)
+
+# Uma conexão por thread e arquivo
+_conexoes = local()
+
+
+def _conectar(caminho: str) -> sqlite3.Connection:
+    por_arquivo = getattr(_conexoes, 'por_arquivo', None)
+    if por_arquivo is None:
+        por_arquivo = _conexoes.por_arquivo = {}
+
+    conn = por_arquivo.get(caminho)
+    if conn is None:
+        Path(caminho).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(caminho, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Em modo WAL, NORMAL só faz fsync nos checkpoints: commits em lote baratos
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_ESQUEMA)
+        colunas = {linha[1] for linha in conn.execute('PRAGMA table_info(mensagens)')}
+        if 'codec' not in colunas:
+            # Banco criado antes dos codecs: todas as mensagens estão em JSON
+            conn.execute("ALTER TABLE mensagens ADD COLUMN codec TEXT NOT NULL DEFAULT 'json'")
+        if 'grupo' not in colunas:
+            # Banco criado antes das filas FIFO
+            conn.execute('ALTER TABLE mensagens ADD COLUMN grupo TEXT')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_mensagens_grupo ON mensagens (fila, grupo, id)')
+        por_arquivo[caminho] = conn
+    return conn
+
+
+class SQSQueueSQLite:
+    """
+    Fila SQS persistida em SQLite, com a mesma interface de SQSQueue
+
+    Cada mensagem é uma linha; `visivel_em` guarda quando ela pode ser
+    recebida de novo, então o visibility timeout e a reentrega não precisam
+    de nenhuma varredura: o recebimento é uma consulta pelo índice
+    (fila, visivel_em). O recebimento usa BEGIN IMMEDIATE, de modo que
+    consumidores em processos diferentes nunca recebem a mesma mensagem.
+
+    O corpo é serializado uma única vez, ao ser gravado, com o codec
+    configurado (messaging.codec); cada linha guarda o nome do seu codec e é
+    decodificada no recebimento, então o Body entregue é o objeto enviado.
+
+    Com fifo=True vale a semântica de SQSQueueFIFO: cada linha guarda o
+    grupo, só a primeira mensagem de cada grupo pode ser recebida e os
+    MessageDeduplicationId da janela ficam na tabela deduplicacao, então a
+    ordem e a deduplicação valem entre processos.
+
+    DelaySeconds só adianta o `visivel_em` da linha: o próprio índice
+    (fila, visivel_em) é a fila de prioridade dos timers, sem nenhuma
+    thread de agendamento. Na FIFO, uma primeira mensagem atrasada segura
+    o resto do grupo.
+    """
+
+    def __init__(self, queue_name: str, caminho: str = 'data/filas.db', visibility_timeout: float = 30,
+                 max_receive_count: int = None, dead_letter_queue: str = None, delay_seconds: float = 0,
+                 fifo: bool = False, content_based_deduplication: bool = False):
+        self.queue_name = queue_name
+        self.caminho = caminho
+        self.visibility_timeout = visibility_timeout
+        self.max_receive_count = max_receive_count
+        self.dead_letter_queue = dead_letter_queue
+        self.delay_seconds = validar_atraso(queue_name, delay_seconds, 0)
+        self.fifo = fifo
+        self.content_based_deduplication = content_based_deduplication
+        self._entregaveis = _ENTREGAVEIS_FIFO if fifo else _ENTREGAVEIS
+        self.codec = get_codec()
+        # Acorda consumidores deste processo quando uma mensagem é enviada
+        self.disponivel = Condition()
+        _conectar(caminho)
+        logger.info("Fila SQS criada: %s (%s)", queue_name, caminho)
+
+    def send_message(self, message_body: Dict[Any, Any], message_group_id: str = None,
+                     message_deduplication_id: str = None, delay_seconds: float = None) -> Dict[str, str]:
+        """
+        Envia mensagem para a fila
+        message_group_id e message_deduplication_id só valem para filas FIFO
+        delay_seconds: a mensagem só fica visível depois desse tempo
+        (None = delay_seconds da fila; máximo ATRASO_MAXIMO)
+        Retorna um dicionário com MessageId similar ao SQS real
+        """
+        entry = {'Id': '0', 'MessageBody': message_body, 'MessageGroupId': message_group_id,
+                 'MessageDeduplicationId': message_deduplication_id, 'DelaySeconds': delay_seconds}
+        resultado = self.send_message_batch([entry])
+        if resultado['Failed']:
+            raise ValueError(resultado['Failed'][0]['Message'])
+        enviada = resultado['Successful'][0]
+        return {'MessageId': enviada['MessageId'], 'MD5OfBody': enviada['MD5OfBody']}
+
+    def send_message_batch(self, entries: List[Dict[str, Any]]) -> Dict[str, list]:
+        """
+        Envia várias mensagens em uma única transação
+        entries: lista de {'Id': ..., 'MessageBody': {...}}, com 'DelaySeconds'
+        opcional e, em filas FIFO, 'MessageGroupId' e 'MessageDeduplicationId'
+        """
+        agora = time.time()
+        linhas, successful, failed = [], [], []
+        for entry in entries:
+            try:
+                atraso = validar_atraso(self.queue_name, entry.get('DelaySeconds'), self.delay_seconds)
+            except ValueError as e:
+                failed.append({'Id': entry['Id'], 'Code': 'InvalidParameterValue', 'Message': str(e)})
+                continue
+            grupo = dedup_id = None
+            if self.fifo:
+                try:
+                    dedup_id = validar_fifo(self.queue_name, entry['MessageBody'], entry.get('MessageGroupId'),
+                                            entry.get('MessageDeduplicationId'),
+                                            self.content_based_deduplication)
+                except ValueError as e:
+                    failed.append({'Id': entry['Id'], 'Code': 'MissingParameter', 'Message': str(e)})
+                    continue
+                grupo = entry['MessageGroupId']
+            body = self.codec.codificar(entry['MessageBody'])
+            message_id = f"{self.queue_name}-{uuid.uuid4()}"
+            md5 = md5_corpo(body)
+            linhas.append((dedup_id, (self.queue_name, message_id, body, self.codec.nome, md5,
+                                      int(agora * 1000), agora + atraso, grupo)))
+            successful.append({'Id': entry['Id'], 'MessageId': message_id, 'MD5OfBody': md5})
+
+        conn = _conectar(self.caminho)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if self.fifo:
+                linhas = self._deduplicar(conn, agora, linhas, successful)
+            conn.executemany(
+                'INSERT INTO mensagens (fila, message_id, body, codec, md5, enviada_em, visivel_em, grupo) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', [linha for _, linha in linhas]
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        with self.disponivel:
+            self.disponivel.notify_all()
+        logger.debug("%d mensagens enviadas para %s", len(successful), self.queue_name)
+        return {'Successful': successful, 'Failed': failed}
+
+    def _deduplicar(self, conn: sqlite3.Connection, agora: float, linhas: list, successful: list) -> list:
+        """
+        Registra os MessageDeduplicationId da janela (na transação do envio)
+        Retorna só as linhas novas; as repetidas recebem o MessageId da original
+        """
+        conn.execute('DELETE FROM deduplicacao WHERE fila = ? AND expira_em <= ?', (self.queue_name, agora))
+        novas = []
+        for (dedup_id, linha), enviada in zip(linhas, successful):
+            message_id = linha[1]
+            if conn.execute(
+                'INSERT OR IGNORE INTO deduplicacao (fila, dedup_id, message_id, expira_em) VALUES (?, ?, ?, ?)',
+                (self.queue_name, dedup_id, message_id, agora + JANELA_DEDUPLICACAO_FIFO)
+            ).rowcount:
+                novas.append((dedup_id, linha))
+                continue
+            enviada['MessageId'] = conn.execute(
+                'SELECT message_id FROM deduplicacao WHERE fila = ? AND dedup_id = ?', (self.queue_name, dedup_id)
+            ).fetchone()[0]
+            duplicadas.inc(fila=self.queue_name)
+        return novas
+
+    def receive_message(self, max_number_of_messages: int = 1, wait_time_seconds: float = 0,
+                        visibility_timeout: float = None) -> list:
+        """
+        Recebe mensagens da fila
+        Com wait_time_seconds > 0 aguarda (long polling) até chegar ao menos
+        uma mensagem ou o tempo esgotar
+        Retorna lista de mensagens no formato SQS
+        """
+        if visibility_timeout is None:
+            visibility_timeout = self.visibility_timeout
+
+        prazo = time.monotonic() + wait_time_seconds
+        intervalo = 0.005
+        while True:
+            messages = self._receber(max_number_of_messages, visibility_timeout)
+            restante = prazo - time.monotonic()
+            if messages or restante <= 0:
+                break
+            with self.disponivel:
+                self.disponivel.wait(min(intervalo, restante))
+            intervalo = min(intervalo * 2, INTERVALO_MAXIMO_POLLING)
+
+        observar_recebimento(self.queue_name, messages)
+        if messages and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Mensagens recebidas de %s: %s", self.queue_name,
+                         [message['MessageId'] for message in messages])
+        return messages
+
+    def delete_message(self, receipt_handle: str) -> bool:
+        """
+        Remove definitivamente uma mensagem recebida
+        Retorna False se o receipt_handle não é válido (ex.: visibilidade expirou)
+        """
+        resultado = self.delete_message_batch([{'Id': '0', 'ReceiptHandle': receipt_handle}])
+        if resultado['Failed']:
+            logger.warning("ReceiptHandle inválido em %s: %s", self.queue_name, receipt_handle)
+            return False
+        return True
+
+    def delete_message_batch(self, entries: List[Dict[str, str]]) -> Dict[str, list]:
+        """
+        Remove várias mensagens da fila em uma única transação
+        entries: lista de {'Id': ..., 'ReceiptHandle': ...}
+        """
+        agora = time.time()
+        successful, failed = [], []
+        conn = _conectar(self.caminho)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for entry in entries:
+                cursor = conn.execute(
+                    'DELETE FROM mensagens WHERE receipt_handle = ? AND fila = ? AND visivel_em > ?',
+                    (entry['ReceiptHandle'], self.queue_name, agora)
+                )
+                if cursor.rowcount:
+                    successful.append({'Id': entry['Id']})
+                else:
+                    failed.append({'Id': entry['Id'], 'Code': 'ReceiptHandleIsInvalid'})
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        logger.debug("%d mensagens deletadas de %s", len(successful), self.queue_name)
+        return {'Successful': successful, 'Failed': failed}
+
+    def change_message_visibility(self, receipt_handle: str, visibility_timeout: float) -> bool:
+        """Altera o prazo de visibilidade de uma mensagem em voo"""
+        agora = time.time()
+        conn = _conectar(self.caminho)
+        cursor = conn.execute(
+            'UPDATE mensagens SET visivel_em = ? WHERE receipt_handle = ? AND fila = ? AND visivel_em > ?',
+            (agora + visibility_timeout, receipt_handle, self.queue_name, agora)
+        )
+        if cursor.rowcount and visibility_timeout <= 0:
+            with self.disponivel:
+                self.disponivel.notify_all()
+        return bool(cursor.rowcount)
+
+    def get_queue_size(self) -> int:
+        """Retorna o tamanho atual da fila (mensagens visíveis)"""
+        conn = _conectar(self.caminho)
+        return conn.execute(
+            'SELECT COUNT(*) FROM mensagens WHERE fila = ? AND visivel_em <= ?',
+            (self.queue_name, time.time())
+        ).fetchone()[0]
+
+    def get_in_flight_count(self) -> int:
+        """Retorna a quantidade de mensagens recebidas e ainda não removidas"""
+        conn = _conectar(self.caminho)
+        return conn.execute(
+            'SELECT COUNT(*) FROM mensagens WHERE fila = ? AND visivel_em > ? AND receipt_handle IS NOT NULL',
+            (self.queue_name, time.time())
+        ).fetchone()[0]
+
+    def get_delayed_count(self) -> int:
+        """Retorna a quantidade de mensagens atrasadas (DelaySeconds) ainda não visíveis"""
+        conn = _conectar(self.caminho)
+        return conn.execute(
+            'SELECT COUNT(*) FROM mensagens WHERE fila = ? AND visivel_em > ? AND receipt_handle IS NULL',
+            (self.queue_name, time.time())
+        ).fetchone()[0]
+
+    def _receber(self, max_number_of_messages: int, visibility_timeout: float) -> list:
+        conn = _conectar(self.caminho)
+        agora = time.time()
+
+        # Leitura sem lock de escrita: fila vazia (ou, na FIFO, com todos os
+        # grupos em voo) não disputa o banco
+        if conn.execute(
+            f'SELECT 1 {self._entregaveis} LIMIT 1', (self.queue_name, agora)
+        ).fetchone() is None:
+            return []
+
+        messages, mortas = [], []
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            linhas = conn.execute(
+                'SELECT id, message_id, body, codec, md5, enviada_em, recebimentos, grupo '
+                f'{self._entregaveis} ORDER BY visivel_em, id LIMIT ?',
+                (self.queue_name, agora, max_number_of_messages)
+            ).fetchall()
+
+            for id_, message_id, body, codec, md5, enviada_em, recebimentos, grupo in linhas:
+                if (self.max_receive_count is not None and self.dead_letter_queue
+                        and recebimentos >= self.max_receive_count):
+                    conn.execute(
+                        'UPDATE mensagens SET fila = ?, visivel_em = ?, receipt_handle = NULL WHERE id = ?',
+                        (self.dead_letter_queue, agora, id_)
+                    )
+                    mortas.append(message_id)
+                    continue
+
+                receipt_handle = str(uuid.uuid4())
+                conn.execute(
+                    'UPDATE mensagens SET visivel_em = ?, recebimentos = recebimentos + 1, '
+                    'receipt_handle = ? WHERE id = ?',
+                    (agora + visibility_timeout, receipt_handle, id_)
+                )
+                message = {
+                    'Body': get_codec(codec).decodificar(body),
+                    'MessageId': message_id,
+                    'MD5OfBody': md5,
+                    'ReceiptHandle': receipt_handle,
+                    'Attributes': {
+                        'ApproximateReceiveCount': recebimentos + 1,
+                        'SentTimestamp': enviada_em
+                    }
+                }
+                if grupo is not None:
+                    message['Attributes']['MessageGroupId'] = grupo
+                messages.append(message)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        for message_id in mortas:
+            logger.warning("Mensagem %s movida de %s para a DLQ %s",
+                           message_id, self.queue_name, self.dead_letter_queue)
+        return messages
@@ -0,0 +1,2 @@
+# Monitoramento Package
+
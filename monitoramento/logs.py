@@ -0,0 +1,150 @@
+"""
+Configuração dos logs
+- Quem registra um log só enfileira o registro: formatação e escrita rodam
+  em uma thread própria (QueueListener), fora das requisições e dos locks
+- As mensagens usam os argumentos do logging (logger.info("Pedido %s", id)):
+  só são formatadas se o nível estiver ativo, e já na thread dos logs
+- Payloads completos (pedidos, eventos) são registrados por amostragem
+- Cada pedido tem um trace ID, criado em POST /pedidos e levado pelo SNS e
+  pelo SQS até o pagamento; todas as linhas do pedido mostram o mesmo ID
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+from threading import Lock
+from monitoramento.metricas import contador
+import atexit
+import logging
+import os
+import random
+import re
+import sys
+import zlib
+
+NIVEL_LOGS = os.environ.get('ESFIHARIA_NIVEL_LOGS', 'INFO').upper()
+# Fração dos pedidos cujos payloads completos são registrados (0 a 1)
+TAXA_AMOSTRA_PAYLOADS = float(os.environ.get('ESFIHARIA_AMOSTRA_PAYLOADS', '0.01'))
+# Registros aguardando a thread dos logs; com a fila cheia os novos são descartados
+CAPACIDADE_FILA_LOGS = int(os.environ.get('ESFIHARIA_CAPACIDADE_FILA_LOGS', '10000'))
+
+FORMATO = '%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s'
+# Trace IDs aceitos de fora (cabeçalho X-Trace-Id)
+_TRACE_ID_VALIDO = re.compile(r'[0-9A-Za-z_.-]{1,64}')
+SEM_TRACE = '-'
+
+_trace_id: ContextVar[str] = ContextVar('trace_id', default=SEM_TRACE)
+
+_descartados = contador(
+    'esfiharia_logs_descartados_total', 'Registros de log descartados com a fila dos logs cheia'
+)
+
+
+def novo_trace_id() -> str:
+    return os.urandom(8).hex()
+
+
+def validar_trace_id(valor: str | None) -> str | None:
+    """O trace ID recebido, se tiver um formato aceito; None caso contrário"""
+    return valor if valor and _TRACE_ID_VALIDO.fullmatch(valor) else None
+
+
+def trace_id_atual() -> str:
+    return _trace_id.get()
+
+
+def definir_trace_id(trace_id: str):
+    """Define o trace ID do contexto atual; retorna o token para restaurar_trace_id"""
+    return _trace_id.set(trace_id or SEM_TRACE)
+
+
+def restaurar_trace_id(token):
+    _trace_id.reset(token)
+
+
+@contextmanager
+def rastrear(trace_id: str | None):
+    """Logs e publicações dentro do bloco levam o trace_id"""
+    token = definir_trace_id(trace_id)
+    try:
+        yield
+    finally:
+        restaurar_trace_id(token)
+
+
+def amostrado() -> bool:
+    """
+    Indica se os payloads do pedido atual devem ser registrados
+    A decisão vem do trace ID: um pedido amostrado tem os payloads
+    registrados em todas as etapas, não só em algumas
+    """
+    if TAXA_AMOSTRA_PAYLOADS <= 0:
+        return False
+    trace_id = _trace_id.get()
+    if trace_id == SEM_TRACE:
+        return random.random() < TAXA_AMOSTRA_PAYLOADS
+    return zlib.crc32(trace_id.encode()) < TAXA_AMOSTRA_PAYLOADS * 0x100000000
+
+
+def registrar_payload(logger: logging.Logger, descricao: str, payload):
+    """
+    Registra o payload completo: em INFO para os pedidos amostrados e em
+    DEBUG (se ativo) para os demais
+    O payload é formatado depois, na thread dos logs: não deve ser alterado
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug('%s: %s', descricao, payload)
+    elif amostrado() and logger.isEnabledFor(logging.INFO):
+        logger.info('%s: %s', descricao, payload)
+
+
+class _FiltroTraceId(logging.Filter):
+    """Copia o trace ID do contexto para o registro, na thread que o criou"""
+
+    def filter(self, record):
+        record.trace_id = _trace_id.get()
+        return True
+
+
+class _HandlerFila(QueueHandler):
+    """
+    Enfileira o registro como está, sem formatar (o QueueHandler padrão
+    formata na thread de quem registrou) e sem bloquear com a fila cheia
+    """
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            _descartados.inc()
+
+
+_listener = None
+_lock = Lock()
+
+
+def configurar_logs(nivel: str = NIVEL_LOGS, fluxo=None):
+    """
+    Configura o logger raiz para escrever em fluxo (padrão: stderr) pela thread dos logs
+    Chamadas repetidas não fazem nada
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        saida = logging.StreamHandler(fluxo or sys.stderr)
+        saida.setFormatter(logging.Formatter(FORMATO))
+        fila = Queue(CAPACIDADE_FILA_LOGS)
+        handler = _HandlerFila(fila)
+        handler.addFilter(_FiltroTraceId())
+
+        raiz = logging.getLogger()
+        for antigo in list(raiz.handlers):
+            raiz.removeHandler(antigo)
+        raiz.addHandler(handler)
+        raiz.setLevel(nivel)
+
+        _listener = QueueListener(fila, saida, respect_handler_level=True)
+        _listener.start()
+        # Escreve os registros pendentes antes de o processo terminar
+        atexit.register(_listener.stop)
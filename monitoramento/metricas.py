@@ -0,0 +1,229 @@
+"""
+Métricas da aplicação: contadores, histogramas e medidores
+Exportadas no formato texto do Prometheus (GET /metrics)
+"""
+from bisect import bisect_left
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Callable, Dict, Iterable, Tuple
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Limites (s) dos buckets dos histogramas de duração
+BUCKETS_PADRAO = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                  0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE_PROMETHEUS = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Contador:
+    """Valor que só cresce (ex.: total de falhas), uma série por combinação de rótulos"""
+
+    tipo = 'counter'
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self.lock = Lock()
+        self.valores: Dict[tuple, float] = {}
+
+    def inc(self, valor: float = 1, **rotulos):
+        chave = tuple(str(rotulos[r]) for r in self.rotulos)
+        with self.lock:
+            self.valores[chave] = self.valores.get(chave, 0) + valor
+
+    def amostras(self) -> Iterable[tuple]:
+        with self.lock:
+            valores = list(self.valores.items())
+        for chave, valor in valores:
+            yield self.nome, dict(zip(self.rotulos, chave)), valor
+
+
+class Histograma:
+    """
+    Distribuição de valores (ex.: durações) em buckets fixos
+    Observar custa uma busca binária e três incrementos sob um lock curto
+    """
+
+    tipo = 'histogram'
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = BUCKETS_PADRAO):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self.buckets = tuple(sorted(buckets))
+        self.lock = Lock()
+        # rótulos -> [contagem por bucket (+Inf no fim), soma, total]
+        self.series: Dict[tuple, list] = {}
+
+    def observar(self, valor: float, **rotulos):
+        chave = tuple(str(rotulos[r]) for r in self.rotulos)
+        posicao = bisect_left(self.buckets, valor)
+        with self.lock:
+            serie = self.series.get(chave)
+            if serie is None:
+                serie = self.series[chave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][posicao] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def cronometrar(self, **rotulos) -> '_Cronometro':
+        """Context manager que observa a duração do bloco"""
+        return _Cronometro(self, rotulos)
+
+    def amostras(self) -> Iterable[tuple]:
+        with self.lock:
+            series = [(chave, list(contagens), soma, total)
+                      for chave, (contagens, soma, total) in self.series.items()]
+        for chave, contagens, soma, total in series:
+            rotulos = dict(zip(self.rotulos, chave))
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + (float('inf'),), contagens):
+                acumulado += contagem
+                le = '+Inf' if limite == float('inf') else repr(limite)
+                yield f"{self.nome}_bucket", dict(rotulos, le=le), acumulado
+            yield f"{self.nome}_sum", rotulos, soma
+            yield f"{self.nome}_count", rotulos, total
+
+
+class Medidor:
+    """Valor instantâneo (ex.: profundidade das filas), calculado na coleta"""
+
+    tipo = 'gauge'
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...], funcao: Callable[[], dict]):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        # funcao() -> {(valores dos rótulos): valor}
+        self.funcao = funcao
+
+    def amostras(self) -> Iterable[tuple]:
+        for chave, valor in self.funcao().items():
+            yield self.nome, dict(zip(self.rotulos, chave)), valor
+
+
+class _Cronometro:
+    def __init__(self, histograma: Histograma, rotulos: dict):
+        self.histograma = histograma
+        self.rotulos = rotulos
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self.histograma.observar(time.perf_counter() - self.inicio, **self.rotulos)
+
+
+# Registro global das métricas
+_metricas = {}
+_lock = Lock()
+
+
+def _registrar(classe, nome: str, *args):
+    with _lock:
+        if nome not in _metricas:
+            _metricas[nome] = classe(nome, *args)
+        return _metricas[nome]
+
+
+def contador(nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()) -> Contador:
+    """Obtém ou cria um contador"""
+    return _registrar(Contador, nome, ajuda, rotulos)
+
+
+def histograma(nome: str, ajuda: str, rotulos: Tuple[str, ...] = (),
+               buckets: Tuple[float, ...] = BUCKETS_PADRAO) -> Histograma:
+    """Obtém ou cria um histograma"""
+    return _registrar(Histograma, nome, ajuda, rotulos, buckets)
+
+
+def medidor(nome: str, ajuda: str, rotulos: Tuple[str, ...], funcao: Callable[[], dict]) -> Medidor:
+    """Obtém ou cria um medidor calculado por funcao() a cada coleta"""
+    return _registrar(Medidor, nome, ajuda, rotulos, funcao)
+
+
+_duracao_handlers = histograma(
+    'esfiharia_handler_duracao_segundos', 'Duração dos handlers Lambda', ('handler', 'status')
+)
+
+
+def medir_handler(nome: str):
+    """Decorador de handlers Lambda: observa a duração por statusCode retornado"""
+    def decorador(handler):
+        @wraps(handler)
+        def medido(event, context):
+            inicio = time.perf_counter()
+            status = 'erro'
+            try:
+                resultado = handler(event, context)
+                status = resultado.get('statusCode', 'erro')
+                return resultado
+            finally:
+                _duracao_handlers.observar(time.perf_counter() - inicio, handler=nome, status=status)
+        return medido
+    return decorador
+
+
+def exportar() -> str:
+    """Todas as métricas no formato texto do Prometheus"""
+    with _lock:
+        metricas = list(_metricas.values())
+
+    linhas = []
+    for metrica in metricas:
+        linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+        linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+        try:
+            for nome, rotulos, valor in metrica.amostras():
+                linhas.append(f"{nome}{_formatar_rotulos(rotulos)} {_formatar_valor(valor)}")
+        except Exception as e:
+            logger.error("Erro ao coletar a métrica %s: %s", metrica.nome, e)
+    return '\n'.join(linhas) + '\n'
+
+
+def _formatar_rotulos(rotulos: dict) -> str:
+    if not rotulos:
+        return ''
+    pares = ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in rotulos.items())
+    return '{' + pares + '}'
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _formatar_valor(valor: float) -> str:
+    if isinstance(valor, int):
+        return str(valor)
+    return repr(float(valor))
+
+
+class _HandlerMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        corpo = exportar().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE_PROMETHEUS)
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *_):
+        pass
+
+
+def iniciar_servidor_metricas(porta: int, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """Serve GET /metrics em uma thread (para processos sem Flask, como o worker)"""
+    servidor = ThreadingHTTPServer((host, porta), _HandlerMetricas)
+    Thread(target=servidor.serve_forever, name='servidor-metricas', daemon=True).start()
+    logger.info("Métricas disponíveis em http://%s:%s/metrics", host, porta)
+    return servidor
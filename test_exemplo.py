@@ -63,7 +63,7 @@ def testar_sistema():
     resultado = response.json()
     print(f"Resposta: {json.dumps(resultado, indent=2, ensure_ascii=False)}")
     
-    if response.status_code == 201:
+    if response.status_code in (201, 202):
         pedido_id = resultado['body']['pedido_id']
         print(f"\n✅ Pedido criado com ID: {pedido_id}")
         
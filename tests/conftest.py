@@ -0,0 +1,34 @@
+"""
+Fixtures dos testes: cada teste usa um diretório de dados novo e filas em memória
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def ambiente(tmp_path, monkeypatch):
+    """Bancos em tmp_path (abertos no primeiro uso), filas e tópicos vazios"""
+    import database.db as db
+    import messaging.sns as sns
+    import messaging.sqs as sqs
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sqs, 'BACKEND_FILAS', 'memoria')
+    monkeypatch.setattr(sqs, '_filas', {})
+    monkeypatch.setattr(sns, '_topicos', {})
+    for singleton in ('_banco_pedidos', '_banco_estoque', '_agregados_vendas'):
+        monkeypatch.setattr(db, singleton, None)
+    db.cache_leitura.invalidar_tudo()
+    yield tmp_path
+    if db._agregados_vendas is not None:
+        db._agregados_vendas.fechar()
+    for banco in (db._banco_pedidos, db._banco_estoque):
+        if banco is None:
+            continue
+        for tinydb in vars(banco).values():
+            if hasattr(tinydb, 'close') and hasattr(tinydb, 'storage'):
+                tinydb.close()
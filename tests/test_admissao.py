@@ -0,0 +1,60 @@
+"""Controle de admissão de POST /pedidos: só pedidos novos são recusados"""
+import hashlib
+import json
+
+import pytest
+
+CORPO = {'cliente': {'nome': 'Ana'}, 'itens': [{'tipo': 'esfiha_carne', 'quantidade': 1}]}
+
+
+@pytest.fixture
+def cliente(ambiente, monkeypatch):
+    """API com cache de idempotência vazio e um pedido por cliente até o próximo token"""
+    import app
+    from lambda_functions.admissao import ControleAdmissao, LimitadorClientes
+    from lambda_functions.idempotencia import CacheIdempotencia
+
+    monkeypatch.setattr(app, 'respostas_idempotentes', CacheIdempotencia('teste', 100, 60))
+    monkeypatch.setattr(app, 'controle_admissao', ControleAdmissao(
+        'Fila_Pagamentos', 0, 0, 1, limitador=LimitadorClientes(taxa=0.001, rajada=1, capacidade=100)
+    ))
+    monkeypatch.setattr(app, 'ESPERA_IDEMPOTENCIA', 0.01)
+    return app.create_app().test_client()
+
+
+def test_repeticao_idempotente_nao_passa_pela_admissao(cliente):
+    original = cliente.post('/pedidos', json=CORPO, headers={'Idempotency-Key': 'k1'})
+    assert original.status_code == 202
+
+    # O cliente já gastou o seu token: a repetição recebe a resposta guardada
+    repetida = cliente.post('/pedidos', json=CORPO, headers={'Idempotency-Key': 'k1'})
+    assert repetida.status_code == 202
+    assert repetida.headers['Idempotent-Replayed'] == 'true'
+    assert repetida.json == original.json
+
+    # Um pedido novo do mesmo cliente é recusado
+    novo = cliente.post('/pedidos', json=CORPO, headers={'Idempotency-Key': 'k2'})
+    assert novo.status_code == 429
+    assert 'Retry-After' in novo.headers
+
+
+def test_chave_em_processamento_recebe_409_sem_admissao(cliente):
+    import app
+
+    # Gasta o token do cliente e deixa a chave em processamento
+    assert cliente.post('/pedidos', json=CORPO).status_code == 202
+    corpo = json.dumps(CORPO).encode()
+    app.respostas_idempotentes.iniciar('k1', hashlib.sha256(corpo).hexdigest())
+
+    resposta = cliente.post('/pedidos', data=corpo, content_type='application/json',
+                            headers={'Idempotency-Key': 'k1'})
+    assert resposta.status_code == 409
+
+
+def test_recusa_libera_a_chave(cliente):
+    import app
+
+    assert cliente.post('/pedidos', json=CORPO).status_code == 202
+    assert cliente.post('/pedidos', json=CORPO, headers={'Idempotency-Key': 'k1'}).status_code == 429
+    # A recusa não fica guardada: a próxima tentativa com a chave é um pedido novo
+    assert app.respostas_idempotentes.iniciar('k1') is None
@@ -0,0 +1,157 @@
+"""Rotas da API: importação em lote, listagem paginada, idempotência e cache HTTP"""
+import json
+import time
+
+import pytest
+
+CORPO = {'cliente': {'nome': 'Ana'}, 'itens': [{'tipo': 'esfiha_carne', 'quantidade': 1}]}
+
+
+@pytest.fixture
+def cliente(ambiente, monkeypatch):
+    """API com filas e assinaturas recriadas, cache de idempotência vazio e sem limite por cliente"""
+    import app
+    import config.setup as setup
+    from lambda_functions.admissao import ControleAdmissao
+    from lambda_functions.idempotencia import CacheIdempotencia
+
+    monkeypatch.setattr(setup, '_configurada', False)
+    monkeypatch.setattr(app, 'respostas_idempotentes', CacheIdempotencia('teste', 100, 60))
+    monkeypatch.setattr(app, 'controle_admissao', ControleAdmissao('Fila_Pagamentos', 1000, 1000, 1))
+    return app.create_app().test_client()
+
+
+def _ndjson(resposta) -> list:
+    return [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+
+
+def test_importacao_em_lote_com_linha_invalida_no_meio_do_bloco(cliente, monkeypatch):
+    import lambda_functions.receber_pedido as receber_pedido
+    from messaging.sqs import get_queue
+
+    # Dois blocos: a linha inválida fica no meio do primeiro
+    monkeypatch.setattr(receber_pedido, 'TAMANHO_BLOCO_IMPORTACAO', 3)
+    linhas = [json.dumps(CORPO), '{"cliente": {"nome": "Bia"}, "itens": [', '',
+              json.dumps({'cliente': {'nome': 'Caio'}}), json.dumps(CORPO)]
+    resposta = cliente.post('/pedidos/lote', data='\n'.join(linhas) + '\n',
+                            content_type='application/x-ndjson')
+
+    assert resposta.status_code == 200
+    assert resposta.mimetype == 'application/x-ndjson'
+    resultados = _ndjson(resposta)
+    # Um resultado por linha não vazia, na ordem de entrada
+    assert [(r['linha'], r['statusCode']) for r in resultados] == [(1, 202), (2, 400), (4, 400), (5, 202)]
+    for resultado in (resultados[0], resultados[3]):
+        assert cliente.get(f"/pedidos/{resultado['pedido_id']}").json['status'] == 'recebido'
+    # Só os pedidos aceitos foram publicados para pagamento
+    assert get_queue('Fila_Pagamentos').get_queue_size() == 2
+
+
+def _criar_pedidos(cliente, quantidade: int, nome: str = 'Ana') -> list:
+    corpo = dict(CORPO, cliente={'nome': nome})
+    return [cliente.post('/pedidos', json=corpo).json['body']['pedido_id'] for _ in range(quantidade)]
+
+
+def test_cursor_percorre_as_paginas_com_insercoes_no_meio(cliente):
+    primeiros = _criar_pedidos(cliente, 5)
+
+    pagina = cliente.get('/pedidos?limite=2').json
+    vistos = [p['pedido_id'] for p in pagina['pedidos']]
+    assert vistos == primeiros[:2]
+
+    # Pedidos criados entre as páginas entram no fim, sem repetir nem pular nenhum
+    novos = _criar_pedidos(cliente, 2)
+    while pagina['proximo_cursor']:
+        pagina = cliente.get(f"/pedidos?limite=2&cursor={pagina['proximo_cursor']}").json
+        assert len(pagina['pedidos']) <= 2
+        vistos += [p['pedido_id'] for p in pagina['pedidos']]
+    assert vistos == primeiros + novos
+
+
+def test_listagem_filtra_por_status_e_cliente(cliente):
+    from database.db import atualizar_pedido
+
+    ana = _criar_pedidos(cliente, 2)
+    bia = _criar_pedidos(cliente, 1, nome='Bia')
+    atualizar_pedido(ana[1], {'status': 'pago'})
+
+    assert [p['pedido_id'] for p in cliente.get('/pedidos?status=pago').json['pedidos']] == [ana[1]]
+    assert [p['pedido_id'] for p in cliente.get('/pedidos?cliente=Bia').json['pedidos']] == bia
+    assert cliente.get('/pedidos?cursor=invalido').status_code == 400
+
+
+def test_repeticao_com_a_mesma_idempotency_key_recebe_a_resposta_original(cliente):
+    original = cliente.post('/pedidos', json=CORPO, headers={'Idempotency-Key': 'k1'})
+    repetida = cliente.post('/pedidos', json=CORPO, headers={'Idempotency-Key': 'k1'})
+
+    assert original.status_code == repetida.status_code == 202
+    assert repetida.json == original.json
+    assert repetida.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in original.headers
+    # Nenhum pedido novo
+    assert len(cliente.get('/pedidos').json['pedidos']) == 1
+
+    # A mesma chave com outro corpo é recusada
+    outro = dict(CORPO, itens=[{'tipo': 'esfiha_queijo', 'quantidade': 2}])
+    conflito = cliente.post('/pedidos', json=outro, headers={'Idempotency-Key': 'k1'})
+    assert conflito.status_code == 422
+    assert len(cliente.get('/pedidos').json['pedidos']) == 1
+
+
+def test_cache_de_idempotencia_descarta_por_lru_e_ttl():
+    from lambda_functions.idempotencia import CacheIdempotencia
+
+    cache = CacheIdempotencia('teste', capacidade=2, ttl=0.2)
+    for chave in ('a', 'b'):
+        assert cache.iniciar(chave) is None
+        cache.concluir(chave, chave.upper())
+
+    # 'a' é usada de novo; 'c' descarta a menos recente, 'b'
+    assert cache.iniciar('a').resultado == 'A'
+    assert cache.iniciar('c') is None
+    assert list(cache.registros) == ['a', 'c']
+
+    # Depois do TTL a chave concluída é uma operação nova
+    time.sleep(0.25)
+    assert cache.iniciar('a') is None
+
+
+def test_etag_do_estoque_responde_304_ate_uma_escrita(cliente, monkeypatch):
+    import database.db as db
+
+    leituras = []
+    get_estoque = db.get_estoque
+    monkeypatch.setattr(db, 'get_estoque', lambda: leituras.append(1) or get_estoque())
+
+    primeira = cliente.get('/estoque')
+    etag = primeira.headers['ETag']
+    assert primeira.status_code == 200
+    assert primeira.headers['Cache-Control'].startswith('public, max-age=')
+
+    repetida = cliente.get('/estoque', headers={'If-None-Match': etag})
+    assert repetida.status_code == 304
+    assert repetida.get_data() == b''
+    assert repetida.headers['ETag'] == etag
+    # Leituras repetidas não voltam ao banco
+    assert len(leituras) == 1
+
+    db.adicionar_estoque('esfiha_carne', 5)
+    depois = cliente.get('/estoque', headers={'If-None-Match': etag})
+    assert depois.status_code == 200
+    assert depois.headers['ETag'] != etag
+    assert depois.json != primeira.json
+
+
+def test_etag_do_pedido_muda_com_o_status(cliente):
+    from database.db import atualizar_pedido
+
+    pedido_id = _criar_pedidos(cliente, 1)[0]
+    primeira = cliente.get(f'/pedidos/{pedido_id}')
+    etag = primeira.headers['ETag']
+    assert primeira.headers['Cache-Control'] == 'private, no-cache'
+    assert cliente.get(f'/pedidos/{pedido_id}', headers={'If-None-Match': etag}).status_code == 304
+
+    atualizar_pedido(pedido_id, {'status': 'pago'})
+    depois = cliente.get(f'/pedidos/{pedido_id}', headers={'If-None-Match': etag})
+    assert depois.status_code == 200
+    assert depois.json['status'] == 'pago'
@@ -0,0 +1,53 @@
+"""Cliente do gateway: toda cobrança registra um resultado no disjuntor"""
+import pytest
+import requests
+
+from lambda_functions.cliente_gateway import (ClienteGateway, CobrancaRejeitada, Disjuntor,
+                                              GatewayIndisponivel)
+
+
+def _resposta(status_code: int, corpo: bytes) -> requests.Response:
+    resposta = requests.Response()
+    resposta.status_code = status_code
+    resposta._content = corpo
+    return resposta
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    """Cliente com o disjuntor meio aberto: a próxima chamada é a de teste"""
+    disjuntor = Disjuntor(limite_falhas=1, tempo_aberto=0)
+    disjuntor.registrar_falha()
+    cliente = ClienteGateway('http://gateway', tentativas=1, disjuntor=disjuntor, atraso_hedge=0)
+    yield cliente
+    cliente.fechar()
+
+
+def test_resposta_sem_json_conta_como_falha(cliente, monkeypatch):
+    monkeypatch.setattr(cliente, '_tentar', lambda *_: _resposta(200, b'<html>ok</html>'))
+    with pytest.raises(GatewayIndisponivel):
+        cliente.cobrar('p1', 10.0)
+    assert cliente.disjuntor.estado == Disjuntor.ABERTO
+    # O teste terminou: a chamada seguinte pode testar o gateway de novo
+    assert cliente.disjuntor.permitir()
+
+
+def test_4xx_levanta_cobranca_rejeitada_e_fecha_o_disjuntor(cliente, monkeypatch):
+    monkeypatch.setattr(cliente, '_tentar', lambda *_: _resposta(422, b'{"erro": "valor invalido"}'))
+    with pytest.raises(CobrancaRejeitada):
+        cliente.cobrar('p1', -1.0)
+    assert cliente.disjuntor.estado == Disjuntor.FECHADO
+
+
+def test_erro_inesperado_nao_prende_o_disjuntor(cliente, monkeypatch):
+    def falhar(*_):
+        raise RuntimeError('bug')
+
+    monkeypatch.setattr(cliente, '_tentar', falhar)
+    with pytest.raises(RuntimeError):
+        cliente.cobrar('p1', 10.0)
+
+    # A chamada seguinte é a nova chamada de teste
+    monkeypatch.setattr(cliente, '_tentar', lambda *_: _resposta(200, b'{"status": "aprovado"}'))
+    assert cliente.cobrar('p1', 10.0) == {'status': 'aprovado'}
+    assert cliente.disjuntor.estado == Disjuntor.FECHADO
@@ -0,0 +1,184 @@
+"""Filas SQS: os dois backends seguem a mesma semântica e devolvem o mesmo MD5OfBody"""
+import hashlib
+import time
+
+import pytest
+
+from messaging import sqs
+from messaging.codec import get_codec
+from messaging.sqs import SQSQueue, SQSQueueFIFO
+from messaging.sqs_sqlite import SQSQueueSQLite
+
+CORPO = {'pedido_id': 'p1', 'itens': [{'tipo': 'esfiha_carne', 'quantidade': 2}], 'total': 7.0}
+
+
+@pytest.fixture(params=['memoria', 'memoria_fifo', 'sqlite'])
+def fila(request, tmp_path):
+    if request.param == 'memoria':
+        return SQSQueue('Fila_Teste')
+    if request.param == 'memoria_fifo':
+        return SQSQueueFIFO('Fila_Teste.fifo', content_based_deduplication=True)
+    return SQSQueueSQLite('Fila_Teste', str(tmp_path / 'filas.db'))
+
+
+@pytest.fixture(params=['memoria', 'sqlite'])
+def criar_fila(request, tmp_path, monkeypatch):
+    """get_queue no backend do parâmetro, sem nenhuma fila criada"""
+    monkeypatch.setattr(sqs, 'BACKEND_FILAS', request.param)
+    monkeypatch.setattr(sqs, 'ARQUIVO_FILAS', str(tmp_path / 'filas.db'))
+    monkeypatch.setattr(sqs, '_filas', {})
+    return sqs.get_queue
+
+
+def test_md5_do_corpo_codificado(fila):
+    esperado = hashlib.md5(get_codec().codificar(CORPO)).hexdigest()
+    grupo = {'message_group_id': 'g1'} if isinstance(fila, SQSQueueFIFO) else {}
+
+    assert fila.send_message(CORPO, **grupo)['MD5OfBody'] == esperado
+    entrada = {'Id': '1', 'MessageBody': dict(CORPO, pedido_id='p2'), 'MessageGroupId': 'g2'}
+    enviadas = fila.send_message_batch([entrada])['Successful']
+    assert enviadas[0]['MD5OfBody'] == hashlib.md5(get_codec().codificar(entrada['MessageBody'])).hexdigest()
+
+    recebida = fila.receive_message()[0]
+    assert recebida['Body'] == CORPO
+    assert recebida['MD5OfBody'] == esperado
+
+
+def test_fila_em_memoria_nao_codifica_o_corpo_no_envio():
+    # Um corpo que nenhum codec serializa passa pela fila em memória
+    corpo = {'pedido': object()}
+    fila = SQSQueue('Fila_Teste')
+    resposta = fila.send_message(corpo)
+    recebida = fila.receive_message()[0]
+    assert recebida['Body'] is corpo
+    assert recebida['MessageId'] == resposta['MessageId']
+    # Só quem lê o MD5OfBody paga a codificação
+    with pytest.raises(TypeError):
+        recebida.get('MD5OfBody')
+
+
+def test_mensagem_nao_removida_volta_e_esgotada_vai_para_a_dlq(criar_fila):
+    fila = criar_fila('Fila_Teste', visibility_timeout=0.05, max_receive_count=2,
+                      dead_letter_queue='Fila_Teste_DLQ')
+    fila.send_message(CORPO)
+
+    primeira = fila.receive_message()[0]
+    # Invisível enquanto está em voo
+    assert fila.receive_message() == []
+    time.sleep(0.1)
+    segunda = fila.receive_message()[0]
+    assert segunda['MessageId'] == primeira['MessageId']
+    assert segunda['ReceiptHandle'] != primeira['ReceiptHandle']
+    assert segunda['Attributes']['ApproximateReceiveCount'] == 2
+    # O receipt handle de um recebimento expirado não remove a mensagem
+    assert not fila.delete_message(primeira['ReceiptHandle'])
+
+    time.sleep(0.1)
+    assert fila.receive_message() == []
+    morta = criar_fila('Fila_Teste_DLQ').receive_message()
+    assert [m['MessageId'] for m in morta] == [primeira['MessageId']]
+    assert morta[0]['Body'] == CORPO
+
+
+def test_mensagem_removida_nao_volta(criar_fila):
+    fila = criar_fila('Fila_Teste', visibility_timeout=0.05)
+    fila.send_message(CORPO)
+
+    assert fila.delete_message(fila.receive_message()[0]['ReceiptHandle'])
+    time.sleep(0.1)
+    assert fila.receive_message() == []
+    assert fila.get_in_flight_count() == 0
+
+
+def test_fifo_entrega_cada_grupo_em_ordem_e_grupos_em_paralelo(criar_fila):
+    fila = criar_fila('Fila_Teste.fifo', content_based_deduplication=True)
+    for evento in range(3):
+        fila.send_message({'pedido_id': 'p1', 'evento': evento}, message_group_id='p1')
+    fila.send_message({'pedido_id': 'p2', 'evento': 0}, message_group_id='p2')
+
+    # Uma mensagem em voo por grupo
+    recebidas = fila.receive_message(max_number_of_messages=10)
+    assert sorted((m['Body']['pedido_id'], m['Body']['evento']) for m in recebidas) == [('p1', 0), ('p2', 0)]
+    assert fila.receive_message(max_number_of_messages=10) == []
+
+    for msg in recebidas:
+        fila.delete_message(msg['ReceiptHandle'])
+    eventos = []
+    while True:
+        recebidas = fila.receive_message(max_number_of_messages=10)
+        if not recebidas:
+            break
+        assert len(recebidas) == 1
+        eventos.append(recebidas[0]['Body']['evento'])
+        fila.delete_message(recebidas[0]['ReceiptHandle'])
+    assert eventos == [1, 2]
+
+
+def test_fifo_devolve_a_mensagem_expirada_antes_das_seguintes(criar_fila):
+    fila = criar_fila('Fila_Teste.fifo', visibility_timeout=0.05, content_based_deduplication=True)
+    for evento in range(2):
+        fila.send_message({'pedido_id': 'p1', 'evento': evento}, message_group_id='p1')
+
+    assert fila.receive_message()[0]['Body']['evento'] == 0
+    time.sleep(0.1)
+    assert fila.receive_message(max_number_of_messages=10)[0]['Body']['evento'] == 0
+
+
+def test_fifo_descarta_repetida_dentro_da_janela(criar_fila, monkeypatch):
+    from messaging import sqs_sqlite
+
+    for modulo in (sqs, sqs_sqlite):
+        monkeypatch.setattr(modulo, 'JANELA_DEDUPLICACAO_FIFO', 0.1)
+    fila = criar_fila('Fila_Teste.fifo', content_based_deduplication=True)
+
+    primeira = fila.send_message(CORPO, message_group_id='p1')
+    assert fila.send_message(CORPO, message_group_id='p1')['MessageId'] == primeira['MessageId']
+    outra = fila.send_message(CORPO, message_group_id='p1', message_deduplication_id='outra')
+    assert outra['MessageId'] != primeira['MessageId']
+    with pytest.raises(ValueError):
+        fila.send_message(CORPO)
+
+    # Fora da janela o mesmo conteúdo é uma mensagem nova
+    time.sleep(0.15)
+    depois = fila.send_message(CORPO, message_group_id='p1')
+    assert depois['MessageId'] != primeira['MessageId']
+
+    recebidas = []
+    while True:
+        msg = fila.receive_message()
+        if not msg:
+            break
+        recebidas.append(msg[0]['MessageId'])
+        fila.delete_message(msg[0]['ReceiptHandle'])
+    assert recebidas == [primeira['MessageId'], outra['MessageId'], depois['MessageId']]
+
+
+def test_mensagem_atrasada_so_aparece_quando_vence(criar_fila):
+    fila = criar_fila('Fila_Teste')
+    fila.send_message(CORPO, delay_seconds=0.2)
+    fila.send_message(dict(CORPO, pedido_id='p2'))
+
+    assert [m['Body']['pedido_id'] for m in fila.receive_message(max_number_of_messages=10)] == ['p2']
+    assert fila.get_delayed_count() == 1
+    assert fila.receive_message() == []
+
+    # O long polling acorda quando a atrasada vence
+    inicio = time.monotonic()
+    recebidas = fila.receive_message(wait_time_seconds=2)
+    assert [m['Body'] for m in recebidas] == [CORPO]
+    assert time.monotonic() - inicio < 1
+    assert fila.get_delayed_count() == 0
+
+
+def test_atraso_padrao_da_fila_e_limite(criar_fila):
+    fila = criar_fila('Fila_Teste', delay_seconds=0.1)
+    fila.send_message(CORPO)
+    fila.send_message_batch([{'Id': '1', 'MessageBody': CORPO, 'DelaySeconds': 0}])
+    assert len(fila.receive_message(max_number_of_messages=10)) == 1
+
+    time.sleep(0.15)
+    assert len(fila.receive_message(max_number_of_messages=10)) == 1
+    with pytest.raises(ValueError):
+        fila.send_message(CORPO, delay_seconds=sqs.ATRASO_MAXIMO + 1)
+    resposta = fila.send_message_batch([{'Id': '1', 'MessageBody': CORPO, 'DelaySeconds': -1}])
+    assert [f['Id'] for f in resposta['Failed']] == ['1']
@@ -0,0 +1,67 @@
+"""Políticas de filtro das assinaturas SNS"""
+import pytest
+
+from messaging.filtros import compilar_politica
+
+
+def test_prefixo_e_valores_exatos():
+    casar = compilar_politica({
+        'tipo': ['pedido_recebido', {'prefix': 'pedido_cancel'}],
+        'cliente': {'email': [{'prefix': 'loja@'}]},
+    })
+
+    assert casar({'tipo': 'pedido_recebido', 'cliente': {'email': 'loja@x.com'}})
+    assert casar({'tipo': 'pedido_cancelado', 'cliente': {'email': 'loja@y.com'}})
+    assert not casar({'tipo': 'pedido_pago', 'cliente': {'email': 'loja@x.com'}})
+    assert not casar({'tipo': 'pedido_recebido', 'cliente': {'email': 'ana@x.com'}})
+    assert not casar({'tipo': 'pedido_recebido'})
+    # Um campo lista casa se algum elemento casar
+    assert casar({'tipo': ['outro', 'pedido_recebido'], 'cliente': {'email': 'loja@x.com'}})
+
+
+def test_faixa_numerica():
+    casar = compilar_politica({'total': [{'numeric': ['>=', 50, '<', 200]}, {'numeric': ['=', 0]}]})
+
+    assert casar({'total': 50})
+    assert casar({'total': 199.99})
+    assert casar({'total': 0})
+    assert not casar({'total': 200})
+    assert not casar({'total': 10})
+    # Texto e bool não são números
+    assert not casar({'total': '100'})
+    assert not casar({'total': True})
+
+
+def test_exists():
+    sem_campo = compilar_politica({'forcar_status_pagamento': [{'exists': False}]})
+    com_campo = compilar_politica({'trace_id': [{'exists': True}]})
+
+    assert sem_campo({'tipo': 'pedido_recebido'})
+    assert not sem_campo({'forcar_status_pagamento': 'aprovado'})
+    assert com_campo({'trace_id': 'abc'})
+    assert not com_campo({'tipo': 'pedido_recebido'})
+
+
+@pytest.mark.parametrize('politica', [
+    {}, {'tipo': []}, {'tipo': 'pedido_recebido'}, {'total': [{'numeric': ['>', 'x']}]},
+    {'total': [{'numeric': ['~', 1]}]}, {'tipo': [{'prefix': 1}]}, {'tipo': [{'exists': 'sim'}]},
+])
+def test_politica_invalida(politica):
+    with pytest.raises(ValueError):
+        compilar_politica(politica)
+
+
+def test_publish_so_entrega_aos_assinantes_que_casam(ambiente):
+    from messaging.sns import get_topic
+
+    recebidos = {'todos': [], 'grandes': []}
+    topico = get_topic('Topico_Teste')
+    topico.subscribe('lambda', 'todos', lambda event, ctx: recebidos['todos'].append(event))
+    topico.subscribe('lambda', 'grandes', lambda event, ctx: recebidos['grandes'].append(event),
+                     filter_policy={'total': [{'numeric': ['>=', 100]}]})
+
+    topico.publish({'pedido_id': 'p1', 'total': 30})
+    topico.publish({'pedido_id': 'p2', 'total': 150})
+
+    assert [e['pedido_id'] for e in recebidos['todos']] == ['p1', 'p2']
+    assert [e['pedido_id'] for e in recebidos['grandes']] == ['p2']
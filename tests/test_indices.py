@@ -0,0 +1,54 @@
+"""Índices da Tabela_Pedidos"""
+from threading import Event, Thread
+
+from tinydb import TinyDB
+from tinydb.storages import MemoryStorage
+
+from database.indices import IndicePedidos
+from database.wal import WALStorage
+
+
+def test_indice_por_data_fica_ordenado_com_pedidos_fora_de_ordem():
+    db = TinyDB(storage=MemoryStorage)
+    indice = IndicePedidos(db.table(db.default_table_name))
+    for pedido_id, data in (('a', '2024-01-02'), ('b', '2024-01-03'), ('c', '2024-01-01'),
+                            ('d', '2024-01-03'), ('e', '2024-01-04')):
+        indice.inserir({'pedido_id': pedido_id, 'status': 'recebido', 'data_criacao': data})
+
+    assert indice.por_data == sorted(indice.por_data)
+    assert [p['pedido_id'] for p in indice.listar_por_periodo('2024-01-02', '2024-01-03')] == ['a', 'b', 'd']
+
+
+def test_iteracao_da_tabela_durante_insercoes_ve_lotes_inteiros(tmp_path):
+    db = TinyDB(str(tmp_path / 'pedidos.json'), storage=WALStorage, intervalo_acompanhamento=60)
+    tabela = db.table(db.default_table_name)
+    indice = IndicePedidos(tabela)
+    parar = Event()
+    tamanhos, erros = [], []
+
+    def consultar():
+        while not parar.is_set():
+            try:
+                tamanhos.append(len(tabela.all()))
+                sum(1 for pedido in tabela if pedido['status'] == 'pago')
+            except Exception as e:
+                erros.append(e)
+                return
+
+    leitor = Thread(target=consultar)
+    leitor.start()
+    try:
+        for lote in range(300):
+            pedidos = [{'pedido_id': f'p{lote}-{i}', 'status': 'recebido',
+                        'data_criacao': f'2024-01-01T00:{lote // 60:02d}:{lote % 60:02d}'} for i in range(10)]
+            indice.inserir_varios(pedidos)
+            indice.atualizar(f'p{lote}-0', {'status': 'pago'})
+    finally:
+        parar.set()
+        leitor.join()
+        db.close()
+
+    assert erros == []
+    # Cada lote de 10 pedidos aparece inteiro ou não aparece
+    assert tamanhos and all(tamanho % 10 == 0 for tamanho in tamanhos)
+    assert len(indice.listar_por_status('pago')) == 300
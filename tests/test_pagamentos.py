@@ -0,0 +1,55 @@
+"""Pagamento concluído: o assinante Atualizar_Pedido não reescreve o pagamento"""
+import pytest
+
+
+@pytest.fixture
+def atualizar_pedido_handler(ambiente, monkeypatch):
+    """Handler do assinante Atualizar_Pedido do tópico Pagamento_Concluido"""
+    import config.setup as setup
+    from messaging.sns import get_topic
+
+    monkeypatch.setattr(setup, '_configurada', False)
+    setup.configurar_arquitetura()
+    assinantes = get_topic('Pagamento_Concluido').subscribers
+    return next(s['handler'] for s in assinantes if s['target'] == 'Atualizar_Pedido')
+
+
+def _novo_pedido() -> str:
+    from lambda_functions.receber_pedido import receber_pedido_handler
+
+    resposta = receber_pedido_handler(
+        {'cliente': {'nome': 'Ana'}, 'itens': [{'tipo': 'esfiha_carne', 'quantidade': 1}]}, {}
+    )
+    return resposta['body']['pedido_id']
+
+
+def test_evento_atrasado_nao_altera_pedido_pago(atualizar_pedido_handler):
+    from database.db import atualizar_pedido, get_pedido
+
+    pedido_id = _novo_pedido()
+    atualizar_pedido(pedido_id, {'status': 'pago', 'data_pagamento': '2024-01-01T12:00:00'})
+
+    atualizar_pedido_handler({'pedido_id': pedido_id, 'timestamp': '2024-01-01T12:00:05'}, {})
+    assert get_pedido(pedido_id)['data_pagamento'] == '2024-01-01T12:00:00'
+
+
+def test_evento_antes_da_gravacao_usa_horario_do_pagamento(atualizar_pedido_handler):
+    from database.db import get_pedido
+    from lambda_functions.processar_pagamento import processar_pagamento_handler
+    from messaging.sns import get_topic
+
+    pedido_id = _novo_pedido()
+    # O assinante (pedido ainda não pago) grava o horário do evento
+    atualizar_pedido_handler({'pedido_id': pedido_id, 'timestamp': '2024-01-01T12:00:00'}, {})
+    assert get_pedido(pedido_id)['status'] == 'pago'
+    assert get_pedido(pedido_id)['data_pagamento'] == '2024-01-01T12:00:00'
+
+    # Pagamento completo: pedido e evento levam o mesmo horário
+    outro = _novo_pedido()
+    eventos = []
+    get_topic('Pagamento_Concluido').subscribe('lambda', 'Capturar', lambda event, ctx: eventos.append(event))
+    resultado = processar_pagamento_handler(
+        {'pedido_id': outro, 'total': 3.5, 'forcar_status_pagamento': 'aprovado'}, {}
+    )
+    assert resultado['statusCode'] == 200
+    assert eventos[0]['timestamp'] == get_pedido(outro)['data_pagamento']
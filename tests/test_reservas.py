@@ -0,0 +1,115 @@
+"""Motor de reservas: vendas descontadas do estoque e conferência entre processos"""
+import pytest
+from tinydb import TinyDB
+
+from database.reservas import CAMPO_INCORPORADAS, EstoqueInsuficiente, MotorReservas
+from database.wal import WALStorage
+
+
+@pytest.fixture
+def abrir(tmp_path):
+    """Abre motores sobre os mesmos arquivos, como processos diferentes"""
+    bancos = []
+
+    def abrir_motor():
+        # Sem acompanhamento em segundo plano: só as transações leem o log
+        dbs = [TinyDB(str(tmp_path / nome), storage=WALStorage, intervalo_acompanhamento=60)
+               for nome in ('estoque.json', 'reservas.json')]
+        bancos.extend(dbs)
+        return MotorReservas(*dbs)
+
+    yield abrir_motor
+    for db in bancos:
+        db.close()
+
+
+def test_venda_desconta_estoque_e_remove_reserva(abrir):
+    motor = abrir()
+    motor.adicionar('esfiha_carne', 10)
+    motor.reservar('p1', [{'tipo': 'esfiha_carne', 'quantidade': 3}])
+    motor.reservar('p2', [{'tipo': 'esfiha_carne', 'quantidade': 2}])
+
+    assert motor.confirmar('p1')
+    assert motor.liberar('p2')
+    assert not motor.confirmar('p1')
+
+    assert motor.reservas.all() == []
+    assert motor.quantidades['esfiha_carne'] == 7
+    assert motor.disponivel('esfiha_carne') == 7
+    assert abrir().disponivel('esfiha_carne') == 7
+
+
+def test_abertura_incorpora_reservas_antigas(abrir):
+    motor = abrir()
+    motor.adicionar('esfiha_carne', 10)
+    # Banco antigo: vendas guardadas como reservas 'confirmada'
+    motor.reservas.storage.gravar_documentos(motor.reservas.name, {
+        '1': {'pedido_id': 'p1', 'itens': {'esfiha_carne': 4}, 'estado': 'confirmada'},
+        '2': {'pedido_id': 'p2', 'itens': {'esfiha_carne': 1}, 'estado': 'liberada'},
+    })
+    motor.reservas.storage.sincronizar()
+
+    reaberto = abrir()
+    assert reaberto.disponivel('esfiha_carne') == 6
+    assert reaberto.quantidades['esfiha_carne'] == 6
+    assert reaberto.reservas.all() == []
+
+
+def test_queda_entre_desconto_e_remocao_nao_desconta_duas_vezes(abrir):
+    motor = abrir()
+    motor.adicionar('esfiha_carne', 10)
+    motor.reservar('p1', [{'tipo': 'esfiha_carne', 'quantidade': 3}])
+    # Estoque já descontado, reserva ainda gravada
+    doc_id = motor._docs_estoque['esfiha_carne']
+    item = dict(motor.estoque.get(doc_id=doc_id), quantidade=7, **{CAMPO_INCORPORADAS: ['p1']})
+    motor.estoque.storage.gravar_documentos(motor.estoque.name, {str(doc_id): item})
+    motor.estoque.storage.sincronizar()
+
+    reaberto = abrir()
+    assert reaberto.disponivel('esfiha_carne') == 7
+    assert reaberto.reservas.all() == []
+    assert not reaberto.confirmar('p1')
+
+
+def test_processos_nao_vendem_alem_do_estoque(abrir):
+    api, worker = abrir(), abrir()
+    api.adicionar('esfiha_carne', 5)
+
+    worker.reservar('p1', [{'tipo': 'esfiha_carne', 'quantidade': 3}])
+    with pytest.raises(EstoqueInsuficiente):
+        api.reservar('p2', [{'tipo': 'esfiha_carne', 'quantidade': 3}])
+
+    # A venda feita por um processo é vista pelo outro antes da conferência
+    assert api.confirmar('p1')
+    assert not worker.confirmar('p1')
+    worker.reservar('p3', [{'tipo': 'esfiha_carne', 'quantidade': 2}])
+    with pytest.raises(EstoqueInsuficiente):
+        api.reservar('p4', [{'tipo': 'esfiha_carne', 'quantidade': 1}])
+
+
+def test_reposicao_de_outro_processo_vale_para_a_reserva(abrir):
+    api, worker = abrir(), abrir()
+    api.adicionar('esfiha_carne', 5)
+
+    # Os contadores do worker ainda não viram a reposição; a transação vê
+    worker.reservar('p1', [{'tipo': 'esfiha_carne', 'quantidade': 3}])
+    assert worker.disponivel('esfiha_carne') == 2
+
+
+def test_falha_na_gravacao_desfaz_a_reserva(abrir, monkeypatch):
+    motor = abrir()
+    motor.adicionar('esfiha_carne', 5)
+
+    def falhar(fsync=True):
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(motor.reservas.storage, 'sincronizar', falhar)
+    with pytest.raises(OSError):
+        motor.reservar('p1', [{'tipo': 'esfiha_carne', 'quantidade': 3}])
+    monkeypatch.undo()
+
+    assert motor.disponivel('esfiha_carne') == 5
+    assert 'p1' not in motor.pendentes
+    assert motor.reservas.all() == []
+    motor.reservar('p2', [{'tipo': 'esfiha_carne', 'quantidade': 5}])
+    assert abrir().disponivel('esfiha_carne') == 0
@@ -0,0 +1,31 @@
+"""Agregados de vendas: receita pelo preço cobrado, não pelo catálogo atual"""
+from datetime import datetime
+
+
+def test_reconstrucao_usa_preco_cobrado(ambiente):
+    from database.db import (atualizar_pedido, atualizar_preco, consultar_vendas, get_pedido,
+                             reconstruir_vendas, registrar_venda)
+    from lambda_functions.receber_pedido import receber_pedido_handler
+
+    atualizar_preco('esfiha_carne', 3.50)
+    # Agregados já existentes antes da venda (senão nascem reconstruídos)
+    assert consultar_vendas() == {}
+    resposta = receber_pedido_handler(
+        {'cliente': {'nome': 'Ana'}, 'itens': [{'tipo': 'esfiha_carne', 'quantidade': 2}]}, {}
+    )
+    pedido_id = resposta['body']['pedido_id']
+    pedido = get_pedido(pedido_id)
+    assert pedido['itens'][0]['preco_unitario'] == 3.50
+    assert pedido['total'] == 7.0
+
+    momento = datetime.now().isoformat()
+    atualizar_pedido(pedido_id, {'status': 'pago', 'data_pagamento': momento})
+    assert registrar_venda(pedido_id, momento, pedido['itens'])
+    incremental = consultar_vendas()
+
+    # Preço alterado depois da venda: a receita histórica não muda
+    atualizar_preco('esfiha_carne', 5.00)
+    reconstruir_vendas()
+
+    assert consultar_vendas() == incremental
+    assert incremental['esfiha_carne'] == (2, 700)
@@ -0,0 +1,51 @@
+"""WALStorage: registros de outros processos não atrapalham leituras em andamento"""
+import pytest
+
+from database.wal import WALStorage
+
+
+@pytest.fixture
+def storages(tmp_path):
+    """Dois storages sobre o mesmo arquivo, como dois processos"""
+    caminho = str(tmp_path / 'banco.json')
+    abertos = [WALStorage(caminho, janela_commit=0, intervalo_acompanhamento=60) for _ in range(2)]
+    yield abertos
+    for storage in abertos:
+        storage.close()
+
+
+def test_acompanhar_nao_altera_tabela_sendo_percorrida(storages):
+    leitor, escritor = storages
+    leitor.gravar_documentos('_default', {'1': {'n': 1}, '2': {'n': 2}})
+    escritor.acompanhar()
+
+    iteracao = iter(leitor.read()['_default'].items())
+    next(iteracao)
+    escritor.gravar_documentos('_default', {'3': {'n': 3}, '1': None})
+    leitor.acompanhar()
+
+    # A iteração termina sobre a versão anterior, sem RuntimeError
+    assert [chave for chave, _ in iteracao] == ['2']
+    assert leitor.read()['_default'] == {'2': {'n': 2}, '3': {'n': 3}}
+
+
+def test_escrita_altera_so_os_documentos_gravados(storages):
+    storage, _ = storages
+    storage.gravar_documentos('_default', {str(i): {'n': i} for i in range(1000)})
+    tabela = storage.read()['_default']
+
+    # Inserção e remoção mudam a tabela em uso, sem copiá-la
+    storage.gravar_documentos('_default', {'1000': {'n': 1000}, '0': None})
+    assert storage.read()['_default'] is tabela
+    assert len(tabela) == 1000 and '1000' in tabela and '0' not in tabela
+
+
+def test_iteracao_percorre_a_tabela_de_quando_comecou(storages):
+    storage, _ = storages
+    storage.gravar_documentos('_default', {'1': {'n': 1}, '2': {'n': 2}})
+
+    vistos = []
+    for chave in storage.read()['_default']:
+        vistos.append(chave)
+        storage.gravar_documentos('_default', {str(len(vistos) + 10): {'n': 0}})
+    assert vistos == ['1', '2']
@@ -1,31 +1,191 @@
 """
-Worker para processar filas SQS periodicamente
-Simula o comportamento de Lambda triggers em SQS
+Worker para processar filas SQS continuamente
+Simula o comportamento de Lambda triggers em SQS, com vários
+consumidores processando a Fila_Pagamentos em paralelo
 """
-import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import BoundedSemaphore, Event, Lock
+import argparse
 import logging
-from config.setup import processar_filas
+import os
+import signal
+import time
+from config.setup import configurar_arquitetura, processar_mensagem_pagamento
+from messaging.sns import aguardar_entregas
+from messaging.sqs import get_queue
+from lambda_functions.cliente_gateway import configurar_cliente_gateway
+from lambda_functions.processar_pagamento import configurar_executor_gateway
+from monitoramento.logs import configurar_logs
+from monitoramento.metricas import iniciar_servidor_metricas
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Long polling: tempo máximo de espera por mensagens em cada recebimento.
+# Mensagens novas acordam o worker na hora; o limite só define em quanto
+# tempo um pedido de parada é percebido com a fila vazia
+WAIT_TIME_SECONDS = 1
+# Tamanho máximo do lote recebido da fila a cada chamada
+TAMANHO_LOTE = 10
+# Quantidade de mensagens processadas em paralelo
+CONCORRENCIA = int(os.environ.get('ESFIHARIA_CONCORRENCIA', '8'))
+# Porta do GET /metrics do worker (vazio = desativado)
+PORTA_METRICAS = os.environ.get('ESFIHARIA_PORTA_METRICAS_WORKER')
+
+
+class PoolConsumidores:
+    """
+    Pool de consumidores de uma fila SQS
+
+    Uma thread recebe mensagens (long polling) e as distribui para um pool
+    de threads. Nunca há mais que `concorrencia` mensagens em processamento,
+    então o worker não retém mensagens invisíveis que não consegue atender.
+    Cada mensagem só é removida da fila depois que seu handler termina; as
+    de um mesmo lote recebido são removidas juntas (delete_message_batch)
+    quando a última delas termina.
+
+    Com usar_processos=True a chamada ao gateway de pagamentos roda em um
+    ProcessPoolExecutor; o restante do handler continua no processo do
+    worker, que é dono do banco e das filas.
+    """
+
+    def __init__(self, nome_fila: str = 'Fila_Pagamentos', handler=processar_mensagem_pagamento,
+                 concorrencia: int = CONCORRENCIA, usar_processos: bool = False,
+                 wait_time_seconds: float = WAIT_TIME_SECONDS, tamanho_lote: int = TAMANHO_LOTE):
+        # Cria as filas com seus atributos (visibility timeout, DLQ) antes de usá-las
+        configurar_arquitetura()
+        # Uma conexão com o gateway por consumidor
+        configurar_cliente_gateway(concorrencia)
+        self.fila = get_queue(nome_fila)
+        self.handler = handler
+        self.concorrencia = concorrencia
+        self.usar_processos = usar_processos
+        self.wait_time_seconds = wait_time_seconds
+        self.tamanho_lote = tamanho_lote
+        self._vagas = BoundedSemaphore(concorrencia)
+        self._parando = Event()
+        self._executor = None
+        self._executor_gateway = None
+
+    def executar(self):
+        """Recebe e despacha mensagens até parar() ser chamado"""
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concorrencia, thread_name_prefix='consumidor'
+        )
+        if self.usar_processos:
+            self._executor_gateway = ProcessPoolExecutor(max_workers=self.concorrencia)
+            configurar_executor_gateway(self._executor_gateway)
+
+        logger.info("Worker iniciado: %d consumidores em %s%s", self.concorrencia, self.fila.queue_name,
+                    ' (gateway em processos)' if self.usar_processos else '')
+        try:
+            while not self._parando.is_set():
+                self._receber_lote()
+        finally:
+            self._encerrar()
+
+    def parar(self):
+        """Para de receber mensagens; as que estão em processamento terminam"""
+        self._parando.set()
+
+    def _receber_lote(self):
+        # Reserva vagas antes de receber: só tira da fila o que pode processar
+        if not self._vagas.acquire(timeout=self.wait_time_seconds):
+            return
+        vagas = 1
+        while vagas < self.tamanho_lote and self._vagas.acquire(blocking=False):
+            vagas += 1
+
+        mensagens = []
+        try:
+            mensagens = self.fila.receive_message(
+                max_number_of_messages=vagas, wait_time_seconds=self.wait_time_seconds
+            )
+            confirmacoes = _Confirmacoes(self.fila, len(mensagens))
+            for msg in mensagens:
+                self._executor.submit(self._processar, msg, confirmacoes)
+        finally:
+            for _ in range(vagas - len(mensagens)):
+                self._vagas.release()
+
+    def _processar(self, msg: dict, confirmacoes: '_Confirmacoes'):
+        processada = False
+        try:
+            processada = self.handler(msg)
+        except Exception as e:
+            # Sem confirmação: a mensagem volta após o visibility timeout
+            logger.error("Erro ao processar mensagem %s: %s", msg['MessageId'], e)
+        finally:
+            self._vagas.release()
+            confirmacoes.concluir(msg, processada)
+
+    def _encerrar(self):
+        logger.info("Encerrando worker: aguardando mensagens em processamento...")
+        self._executor.shutdown(wait=True)
+        if self._executor_gateway is not None:
+            configurar_executor_gateway(None)
+            self._executor_gateway.shutdown(wait=True)
+        # Entregas assíncronas do SNS publicadas pelos handlers
+        aguardar_entregas()
+        logger.info("Worker encerrado")
+
+
+class _Confirmacoes:
+    """Receipt handles das mensagens processadas de um lote recebido"""
+
+    def __init__(self, fila, total: int):
+        self.fila = fila
+        self.restantes = total
+        self.entradas = []
+        self.lock = Lock()
 
-def run_worker():
+    def concluir(self, msg: dict, processada: bool):
+        """Registra o fim de uma mensagem; a última do lote remove as processadas"""
+        with self.lock:
+            if processada:
+                self.entradas.append({'Id': msg['MessageId'], 'ReceiptHandle': msg['ReceiptHandle']})
+            self.restantes -= 1
+            if self.restantes:
+                return
+        if not self.entradas:
+            return
+        try:
+            resultado = self.fila.delete_message_batch(self.entradas)
+        except Exception as e:
+            logger.error("Erro ao remover %d mensagens de %s: %s", len(self.entradas),
+                         self.fila.queue_name, e)
+            return
+        for falha in resultado.get('Failed', []):
+            logger.warning("Mensagem %s não removida de %s: %s", falha['Id'],
+                           self.fila.queue_name, falha.get('Code'))
+
+
+def run_worker(concorrencia: int = CONCORRENCIA, usar_processos: bool = False):
     """Executa worker que processa filas continuamente"""
-    logger.info("Worker iniciado. Processando filas SQS...")
-    
+    pool = PoolConsumidores(concorrencia=concorrencia, usar_processos=usar_processos)
+    signal.signal(signal.SIGTERM, lambda *_: pool.parar())
+
     while True:
         try:
-            processar_filas()
-            time.sleep(2)  # Polling a cada 2 segundos
+            pool.executar()
+            break
         except KeyboardInterrupt:
             logger.info("Worker interrompido pelo usuário")
+            pool.parar()
             break
         except Exception as e:
-            logger.error(f"Erro no worker: {str(e)}")
+            logger.error("Erro no worker: %s", e)
             time.sleep(5)
 
 
 if __name__ == '__main__':
-    run_worker()
-
+    parser = argparse.ArgumentParser(description='Worker da Fila_Pagamentos')
+    parser.add_argument('--concorrencia', type=int, default=CONCORRENCIA)
+    parser.add_argument('--processos', action='store_true',
+                        help='executa a chamada ao gateway em um pool de processos')
+    parser.add_argument('--porta-metricas', type=int, default=int(PORTA_METRICAS) if PORTA_METRICAS else None,
+                        help='serve GET /metrics do worker nesta porta')
+    args = parser.parse_args()
+    configurar_logs()
+    if args.porta_metricas:
+        iniciar_servidor_metricas(args.porta_metricas)
+    run_worker(args.concorrencia, args.processos)